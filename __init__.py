@@ -9,14 +9,14 @@ bl_info = {
 }
 
 
-from . import ui_panel
-
-
+# ui_panel импортируется лениво, чтобы вычислительные модули пакета можно было использовать без Blender
 def register():
+    from . import ui_panel
     ui_panel.register()
 
 
 def unregister():
+    from . import ui_panel
     ui_panel.unregister()
 
 
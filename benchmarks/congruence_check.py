@@ -0,0 +1,71 @@
+import argparse
+import itertools
+from typing import List, Tuple
+from geometry_connector.benchmarks.fracture import generate_fracture
+from geometry_connector.congruence import CongruenceClasses
+from geometry_connector.connect_geometry import GeometryConnector
+from geometry_connector.constants import DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, DEFAULT_FACE_AREA_THRESHOLD, \
+    DEFAULT_EDGE_LENGTH_THRESHOLD
+from geometry_connector.graph_utils import sort_graph, generate_networks, expand_congruent
+from geometry_connector.models import Network
+
+
+def _key(network: Network) -> Tuple:
+    return tuple((m.mesh1, m.mesh2, m.match_type.name, m.indices) for m in network.matches)
+
+
+# Сверка сворачивания конгруэнтных фрагментов на решётчатом разбиении: представители generate_networks
+# с congruence, развёрнутые expand_congruent, должны дать ровно сети обхода без congruence.
+# Возвращает список расхождений; пустой — всё сошлось
+def check_expansion(n_cells: int = 4, seed: int = 0, poses: bool = False,
+                    max_networks: int = 2_000_000) -> List[str]:
+    meshes = generate_fracture(n_cells, seed=seed, lattice=True).meshes
+    meshes_dictionary = {m.name: m for m in meshes}
+    connector = GeometryConnector(
+        connected_edge_angle_threshold=DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD,
+        area_threshold=DEFAULT_FACE_AREA_THRESHOLD,
+        edge_length_threshold=DEFAULT_EDGE_LENGTH_THRESHOLD,
+        use_match_table=False
+    )
+    graph = sort_graph(connector.build_mesh_graph(meshes))
+    prune_meshes = meshes_dictionary if poses else None
+    congruence = CongruenceClasses(meshes_dictionary)
+    if not congruence:
+        return [f"no congruent fragments in a {n_cells}-cell lattice (seed {seed})"]
+
+    plain = [_key(n) for n in itertools.islice(generate_networks(graph, prune_meshes), max_networks + 1)]
+    if len(plain) > max_networks:
+        return [f"more than {max_networks} networks, pick a smaller fracture"]
+    representatives = list(generate_networks(graph, prune_meshes, congruence))
+    expanded = [_key(n) for n in expand_congruent(representatives, congruence, graph, prune_meshes)]
+    print(f"{n_cells} cells, classes {congruence.classes}: {len(plain)} networks, "
+          f"{len(representatives)} representatives, {len(expanded)} after expansion")
+
+    failures = []
+    missing, extra = set(plain) - set(expanded), set(expanded) - set(plain)
+    if missing:
+        failures.append(f"{len(missing)} networks of the plain search are never expanded")
+    if extra:
+        failures.append(f"{len(extra)} expanded networks are not produced by the plain search")
+    if len(expanded) != len(set(expanded)):
+        failures.append(f"{len(expanded) - len(set(expanded))} networks are expanded more than once")
+    return failures
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that collapsed congruent networks expand to the full search")
+    parser.add_argument("--cells", type=int, default=4, help="Cells of the lattice fracture (4 takes a few minutes)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--poses", action="store_true", help="Prune inconsistent poses in both searches")
+    args = parser.parse_args(argv)
+
+    failures = check_expansion(args.cells, args.seed, args.poses)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,301 @@
+import math
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+import numpy as np
+from mathutils import Vector, Matrix, Quaternion
+from geometry_connector.constants import DEFAULT_COPLANAR_ANGLE_THRESHOLD, DEFAULT_CURVATURE_THRESHOLD
+from geometry_connector.models import Mesh, Face, Edge
+
+CLIP_EPS = 1e-9                                         # Допуск отсечения полуплоскостью
+WELD_DISTANCE = 1e-7                                    # Расстояние склейки вершин внутри ячейки
+MIN_FACE_AREA = 1e-10                                   # Грани меньшей площади считаются вырожденными
+
+
+@dataclass
+class FractureSet:
+    meshes: List[Mesh]
+    ground_truth: Dict[str, Matrix]                     # Истинные matrix_world обломков в собранном виде
+
+
+# Выпуклый многогранник как список многоугольников (вершины против часовой стрелки, если смотреть снаружи)
+Polyhedron = List[np.ndarray]
+
+
+def _box(size: Tuple[float, float, float]) -> Polyhedron:
+    hx, hy, hz = (s / 2 for s in size)
+    c = np.array([[-hx, -hy, -hz], [hx, -hy, -hz], [hx, hy, -hz], [-hx, hy, -hz],
+                  [-hx, -hy, hz], [hx, -hy, hz], [hx, hy, hz], [-hx, hy, hz]])
+    quads = [(0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4), (2, 3, 7, 6), (1, 2, 6, 5), (3, 0, 4, 7)]
+    return [c[list(q)] for q in quads]
+
+
+# Отсечение многогранника полупространством n·x <= d
+def _clip(poly: Polyhedron, n: np.ndarray, d: float) -> Polyhedron:
+    dists = [p @ n - d for p in poly]
+    if all(np.all(dd <= CLIP_EPS) for dd in dists):
+        return poly
+
+    result: Polyhedron = []
+    cap_points = []
+    for pts, dd in zip(poly, dists):
+        out = []
+        k = len(pts)
+        for i in range(k):
+            a, b = pts[i], pts[(i + 1) % k]
+            da, db = dd[i], dd[(i + 1) % k]
+            if da <= CLIP_EPS:
+                out.append(a)
+            if (da <= CLIP_EPS) != (db <= CLIP_EPS):
+                t = da / (da - db)
+                p = a + (b - a) * t
+                out.append(p)
+                cap_points.append(p)
+        if len(out) >= 3:
+            result.append(np.array(out))
+
+    # Крышка по плоскости отсечения: упорядочиваем точки по углу вокруг центра
+    if len(cap_points) >= 3:
+        cap = np.array(cap_points)
+        ids = _weld(cap)
+        pts = cap[np.unique(ids)]
+        if len(pts) >= 3:
+            center = pts.mean(axis=0)
+            u = pts[0] - center
+            u /= np.linalg.norm(u)
+            v = np.cross(n, u)
+            rel = pts - center
+            order = np.argsort(np.arctan2(rel @ v, rel @ u))
+            result.append(pts[order])
+    return result
+
+
+# Индекс представителя для каждой точки: точки ближе WELD_DISTANCE склеиваются (ячейки малы, хватает перебора)
+def _weld(points: np.ndarray) -> np.ndarray:
+    ids = np.arange(len(points))
+    for i in range(1, len(points)):
+        close = np.flatnonzero(np.linalg.norm(points[:i] - points[i], axis=1) < WELD_DISTANCE)
+        if len(close):
+            ids[i] = ids[close[0]]
+    return ids
+
+
+def _polygon_area(pts: np.ndarray) -> float:
+    return 0.5 * float(np.linalg.norm(np.cross(pts - pts[0], np.roll(pts, -1, axis=0) - pts[0]).sum(axis=0)))
+
+
+def _random_planes(rng: np.random.Generator, count: int, size: Tuple[float, float, float]) -> List[Tuple[np.ndarray, float]]:
+    # Касательные плоскости к вписанному эллипсоиду — срезают углы коробки, получая выпуклое тело
+    half = np.array(size) / 2
+    planes = []
+    for _ in range(count):
+        n = rng.normal(size=3)
+        n /= np.linalg.norm(n)
+        d = float(np.linalg.norm(n * half)) * rng.uniform(0.75, 0.95)
+        planes.append((n, d))
+    return planes
+
+
+def _sample_seeds(rng: np.random.Generator, count: int, size: Tuple[float, float, float],
+                  planes: List[Tuple[np.ndarray, float]]) -> np.ndarray:
+    half = np.array(size) / 2
+    seeds = []
+    while len(seeds) < count:
+        p = rng.uniform(-half, half)
+        if all(p @ n < d for n, d in planes):
+            seeds.append(p)
+    return np.array(seeds)
+
+
+# Семена в узлах регулярной решётки: ячейки — одинаковые «кирпичи», то есть конгруэнтные обломки
+def _lattice_seeds(count: int, size: Tuple[float, float, float]) -> np.ndarray:
+    per_axis = [1, 1, 1]
+    while per_axis[0] * per_axis[1] * per_axis[2] < count:
+        per_axis[per_axis.index(min(per_axis))] += 1
+    axes = [(np.arange(k) + 0.5) / k * s - s / 2 for k, s in zip(per_axis, size)]
+    grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    return grid[:count]
+
+
+def _voronoi_cell(i: int, seeds: np.ndarray, base: Polyhedron) -> Polyhedron:
+    s = seeds[i]
+    cell = base
+    dist = np.linalg.norm(seeds - s, axis=1)
+    for j in np.argsort(dist):
+        if j == i:
+            continue
+        # Дальние семена не могут срезать ячейку: их биссектриса дальше радиуса ячейки
+        radius = max(float(np.max(np.linalg.norm(p - s, axis=1))) for p in cell)
+        if dist[j] > 2 * radius:
+            break
+        n = seeds[j] - s
+        n /= dist[j]
+        cell = _clip(cell, n, float(n @ (s + seeds[j]) / 2))
+    return cell
+
+
+def _random_rotation(rng: np.random.Generator) -> Quaternion:
+    axis = rng.normal(size=3)
+    return Quaternion(Vector(axis / np.linalg.norm(axis)), rng.uniform(0, 2 * math.pi))
+
+
+# Перевод многогранника в Mesh так же, как это делает GeometryCalculator после аппроксимации
+def _cell_to_mesh(name: str, cell: Polyhedron, matrix_world: Matrix, rng: np.random.Generator, noise: float) -> Mesh:
+    # Склейка вершин и построение индексных многоугольников
+    cell = [pts for pts in cell if _polygon_area(pts) >= MIN_FACE_AREA]
+    all_points = np.vstack(cell)
+    ids = _weld(all_points)
+    coords: List[np.ndarray] = list(all_points)
+    loops: List[List[int]] = []
+    offset = 0
+    for pts in cell:
+        loop = []
+        for k in range(len(pts)):
+            vi = int(ids[offset + k])
+            if not loop or loop[-1] != vi:
+                loop.append(vi)
+        offset += len(pts)
+        if len(loop) > 1 and loop[0] == loop[-1]:
+            loop.pop()
+        if len(loop) >= 3:
+            loops.append(loop)
+
+    # Вершины только двух граней лежат на ребре — убираем их, как dissolve_edges(use_verts=True)
+    valence: Dict[int, int] = {}
+    for loop in loops:
+        for vi in loop:
+            valence[vi] = valence.get(vi, 0) + 1
+    loops = [[vi for vi in loop if valence[vi] > 2] for loop in loops]
+    loops = [loop for loop in loops if len(loop) >= 3]
+    used = sorted({vi for loop in loops for vi in loop})
+    remap = {vi: k for k, vi in enumerate(used)}
+    loops = [[remap[vi] for vi in loop] for loop in loops]
+    coords = [coords[vi] for vi in used]
+
+    co = np.array(coords)
+    if noise > 0.0:
+        co = co + rng.normal(scale=noise, size=co.shape)
+
+    # Рёбра нумеруются в порядке первого появления, как индексы bmesh
+    edge_ids: Dict[Tuple[int, int], int] = {}
+    edge_verts: List[Tuple[int, int]] = []
+    edge_faces: List[List[int]] = []
+    for f_idx, loop in enumerate(loops):
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            key = (min(a, b), max(a, b))
+            if key not in edge_ids:
+                edge_ids[key] = len(edge_verts)
+                edge_verts.append((a, b))
+                edge_faces.append([])
+            edge_faces[edge_ids[key]].append(f_idx)
+
+    normals = []
+    for loop in loops:
+        v0, v1, v2 = (Vector(co[k]) for k in loop[:3])
+        normals.append((v1 - v0).cross(v2 - v0).normalized())
+
+    faces_out: List[Face] = []
+    for f_idx, loop in enumerate(loops):
+        edges_list: List[Edge] = []
+        dihedral_angles = []
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            e_idx = edge_ids[(min(a, b), max(a, b))]
+            ea, eb = edge_verts[e_idx]
+            edges_list.append(Edge(
+                new_index=e_idx,
+                orig_indices=[e_idx],
+                length=float(np.linalg.norm(co[ea] - co[eb])),
+                vertices=[co[ea].tolist(), co[eb].tolist()]
+            ))
+            linked = edge_faces[e_idx]
+            if len(linked) == 2:
+                dihedral_angles.append(normals[linked[0]].angle(normals[linked[1]]))
+
+        avg_dihedral = sum(dihedral_angles) / len(dihedral_angles) if dihedral_angles else 0.0
+        face_type = 1 if avg_dihedral > DEFAULT_COPLANAR_ANGLE_THRESHOLD else (
+            -1 if avg_dihedral < -DEFAULT_COPLANAR_ANGLE_THRESHOLD else 0)
+
+        faces_out.append(Face(
+            new_index=f_idx,
+            orig_indices=[f_idx],
+            area=_polygon_area(co[loop]),
+            face_type=face_type,
+            normal=normals[f_idx],
+            edges=edges_list,
+            vertices=co[loop].tolist()
+        ))
+
+    # Классификация вершин по кривизне (нормаль вершины — среднее по углам, как в bmesh)
+    vert_faces: Dict[int, List[int]] = {}
+    for f_idx, loop in enumerate(loops):
+        for vi in loop:
+            vert_faces.setdefault(vi, []).append(f_idx)
+    convex_inds, concave_inds, flat_inds = [], [], []
+    for vi in range(len(co)):
+        linked = vert_faces.get(vi, [])
+        if not linked:
+            continue
+        avg = sum((normals[f] for f in linked), Vector()) / len(linked)
+        avg.normalize()
+        weighted = Vector()
+        for f in linked:
+            loop = loops[f]
+            k = loop.index(vi)
+            a = Vector(co[loop[k - 1]]) - Vector(co[vi])
+            b = Vector(co[loop[(k + 1) % len(loop)]]) - Vector(co[vi])
+            weighted += normals[f] * a.angle(b, 0.0)
+        deviation = 1.0 - weighted.normalized().dot(avg)
+        if deviation > DEFAULT_CURVATURE_THRESHOLD:
+            convex_inds.append(vi)
+        elif deviation < -DEFAULT_CURVATURE_THRESHOLD:
+            concave_inds.append(vi)
+        else:
+            flat_inds.append(vi)
+
+    return Mesh(
+        name=name,
+        size=(co.max(axis=0) - co.min(axis=0)).tolist(),
+        convex_points=convex_inds,
+        concave_points=concave_inds,
+        flat_points=flat_inds,
+        matrix_world=matrix_world,
+        faces=faces_out
+    )
+
+
+# Режет коробку (или выпуклое тело, если solid_planes > 0) на n_cells ячеек Вороного.
+# noise — СКО шума вершин каждого обломка, random_pose — разбросать обломки случайными поворотами и сдвигами,
+# lattice — семена на регулярной решётке вместо случайных (набор с конгруэнтными обломками)
+def generate_fracture(n_cells: int, seed: int = 0, size: Tuple[float, float, float] = (2.0, 2.0, 2.0),
+                      solid_planes: int = 0, noise: float = 0.0, random_pose: bool = False,
+                      pose_spread: float = 10.0, lattice: bool = False) -> FractureSet:
+    rng = np.random.default_rng(seed)
+
+    base = _box(size)
+    planes = _random_planes(rng, solid_planes, size)
+    for n, d in planes:
+        base = _clip(base, n, d)
+
+    seeds = _lattice_seeds(n_cells, size) if lattice else _sample_seeds(rng, n_cells, size, planes)
+
+    meshes: List[Mesh] = []
+    ground_truth: Dict[str, Matrix] = {}
+    for i in range(n_cells):
+        cell = _voronoi_cell(i, seeds, base)
+        if not cell:
+            continue
+
+        # Вершины обломка хранятся в локальных координатах относительно его центра
+        center = np.vstack(cell).mean(axis=0)
+        local = [pts - center for pts in cell]
+        name = f"Cell.{i:03d}"
+        ground_truth[name] = Matrix.Translation(Vector(center))
+
+        if random_pose:
+            offset = Vector(rng.uniform(-pose_spread, pose_spread, size=3))
+            matrix_world = Matrix.Translation(offset) @ _random_rotation(rng).to_matrix().to_4x4()
+        else:
+            matrix_world = ground_truth[name].copy()
+
+        meshes.append(_cell_to_mesh(name, local, matrix_world, rng, noise))
+
+    return FractureSet(meshes=meshes, ground_truth=ground_truth)
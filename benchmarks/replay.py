@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Callable, Any
+from geometry_connector.build_geometry import assemble_network
+from geometry_connector.connect_geometry import GeometryConnector
+from geometry_connector.constants import JSON_PATH, REPLAY_BASELINE_PATH, REPLAY_REGRESSION_PERCENT, \
+    REPLAY_MIN_REGRESSION_SECONDS, REPLAY_MATRIX_DECIMALS, DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, \
+    DEFAULT_FACE_AREA_THRESHOLD, DEFAULT_EDGE_LENGTH_THRESHOLD
+from geometry_connector.graph_utils import sort_graph, generate_networks
+from geometry_connector.models import Mesh, MeshGraph, Network, TransformMatch
+from geometry_connector.reader import JsonMeshReader
+
+STAGES = ("build_mesh_graph", "sort_graph", "generate_networks", "assemble_network")
+
+
+@dataclass
+class StageRecord:
+    seconds: float = 0.0                                # Лучшее время из повторов
+    peak_bytes: int = 0                                 # Пик tracemalloc в отдельном прогоне
+
+
+@dataclass
+class ReplayResult:
+    geometry: str                                       # Имя файла геометрии (без пути: эталон переносим)
+    settings: Dict[str, float]                          # Пороги коннектора и число сетей: эталон сравним только при равных
+    stages: Dict[str, StageRecord] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    outputs: Dict[str, str] = field(default_factory=dict)  # Хеши совпадений, сетей и матриц сборки
+
+
+def _digest(value: Any) -> str:
+    return hashlib.blake2b(repr(value).encode(), digest_size=16).hexdigest()
+
+
+# Совпадения хранятся в графе в обе стороны, поэтому берётся только направление mesh1 < mesh2
+def _matches_digest(graph: MeshGraph) -> str:
+    rows = sorted((m.mesh1, m.mesh2, m.match_type.name, tuple(m.indices), round(m.coeff, 9))
+                  for nbrs in graph.connections.values() for matches in nbrs.values() for m in matches
+                  if m.mesh1 < m.mesh2)
+    return _digest(rows)
+
+
+# Порядок сетей важен: панель показывает варианты именно в нём
+def _networks_digest(networks: List[Network]) -> str:
+    return _digest([[(m.mesh1, m.mesh2, m.match_type.name, tuple(m.indices)) for m in n.matches] for n in networks])
+
+
+def _transforms_digest(transforms: List[List[TransformMatch]]) -> str:
+    d = REPLAY_MATRIX_DECIMALS
+    # + 0.0 убирает -0.0, чтобы знак нуля не менял хеш
+    return _digest([[(tm.src_mesh_name, tm.dst_mesh_name,
+                      [[round(x, d) + 0.0 for x in row] for row in tm.matrix_world]) for tm in t]
+                    for t in transforms])
+
+
+# Один проход по стадиям; measure(имя, fn) замеряет стадию и возвращает её результат
+def _pipeline(meshes: List[Mesh], connector: GeometryConnector, max_networks: int,
+              measure: Callable[[str, Callable[[], Any]], Any]):
+    meshes_dictionary = {m.name: m for m in meshes}
+    graph = measure("build_mesh_graph", lambda: connector.build_mesh_graph(meshes))
+    sorted_graph = measure("sort_graph", lambda: sort_graph(graph))
+    networks = measure("generate_networks",
+                       lambda: list(itertools.islice(generate_networks(sorted_graph), max_networks)))
+    transforms = measure("assemble_network",
+                         lambda: [assemble_network(n, meshes_dictionary, sorted_graph) for n in networks])
+    return graph, networks, transforms
+
+
+# Прогон geometry.json: repeats замеров времени без tracemalloc (он замедляет Python) и один прогон под ним
+def run_replay(geometry: str = JSON_PATH, max_networks: int = 10, repeats: int = 3,
+               track_memory: bool = True) -> ReplayResult:
+    meshes = JsonMeshReader.read(geometry)
+    connector = GeometryConnector(
+        connected_edge_angle_threshold=DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD,
+        area_threshold=DEFAULT_FACE_AREA_THRESHOLD,
+        edge_length_threshold=DEFAULT_EDGE_LENGTH_THRESHOLD,
+        use_match_table=False
+    )
+    result = ReplayResult(
+        geometry=os.path.basename(geometry),
+        settings={"connected_edge_angle_threshold": connector.connected_edge_angle_threshold,
+                  "area_threshold": connector.area_threshold,
+                  "edge_length_threshold": connector.edge_length_threshold,
+                  "max_networks": max_networks},
+        stages={name: StageRecord(seconds=float("inf")) for name in STAGES}
+    )
+
+    def timed(name: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        value = fn()
+        record = result.stages[name]
+        record.seconds = min(record.seconds, time.perf_counter() - start)
+        return value
+
+    def traced(name: str, fn: Callable[[], Any]) -> Any:
+        tracemalloc.start()
+        try:
+            return fn()
+        finally:
+            result.stages[name].peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    outputs = None
+    for _ in range(max(repeats, 1)):
+        graph, networks, transforms = _pipeline(meshes, connector, max_networks, timed)
+        run_outputs = {"matches": _matches_digest(graph), "networks": _networks_digest(networks),
+                       "transforms": _transforms_digest(transforms)}
+        # Повторы обязаны давать одно и то же, иначе сравнение с эталоном бессмысленно
+        if outputs is not None and run_outputs != outputs:
+            raise RuntimeError("Replay outputs differ between repeats: the pipeline is not deterministic")
+        outputs = run_outputs
+    if track_memory:
+        _pipeline(meshes, connector, max_networks, traced)
+
+    result.outputs = outputs
+    result.counts = {"meshes": len(meshes),
+                     "matches": sum(len(v) for d in graph.connections.values() for v in d.values()) // 2,
+                     "networks": len(networks),
+                     "assembled": sum(1 for t in transforms if t)}
+    return result
+
+
+# Список нарушений: изменившиеся результаты и стадии, выросшие больше чем на percent процентов
+def compare(result: ReplayResult, baseline: Dict[str, Any], percent: float = REPLAY_REGRESSION_PERCENT) -> List[str]:
+    if baseline.get("geometry") != result.geometry or baseline.get("settings") != result.settings:
+        return [f"baseline was recorded for {baseline.get('geometry')} with {baseline.get('settings')}, "
+                f"not {result.geometry} with {result.settings}"]
+
+    failures = []
+    for key, value in result.outputs.items():
+        if baseline["outputs"].get(key) != value:
+            failures.append(f"{key} changed (counts now {result.counts}, baseline {baseline['counts']})")
+
+    limit = 1 + percent / 100
+    for name, record in result.stages.items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        if record.seconds > base["seconds"] * limit and \
+                record.seconds - base["seconds"] > REPLAY_MIN_REGRESSION_SECONDS:
+            failures.append(f"{name}: {record.seconds:.4f} s vs baseline {base['seconds']:.4f} s")
+        if record.peak_bytes and base["peak_bytes"] and record.peak_bytes > base["peak_bytes"] * limit:
+            failures.append(f"{name}: peak {record.peak_bytes / 2 ** 20:.2f} MiB "
+                            f"vs baseline {base['peak_bytes'] / 2 ** 20:.2f} MiB")
+    return failures
+
+
+def _print_result(result: ReplayResult, baseline: Dict[str, Any] | None):
+    print(f"{'stage':<18} {'time, s':>10} {'baseline':>10} {'peak, MiB':>10} {'baseline':>10}")
+    for name, record in result.stages.items():
+        base = baseline["stages"].get(name, {}) if baseline else {}
+        base_seconds = f"{base['seconds']:.4f}" if base else "-"
+        base_peak = f"{base['peak_bytes'] / 2 ** 20:.2f}" if base else "-"
+        print(f"{name:<18} {record.seconds:>10.4f} {base_seconds:>10} {record.peak_bytes / 2 ** 20:>10.2f} "
+              f"{base_peak:>10}")
+    print(", ".join(f"{k}={v}" for k, v in result.counts.items()))
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay data/geometry.json and check it against a stored baseline")
+    parser.add_argument("--geometry", default=JSON_PATH, help="Meshes JSON written by the add-on")
+    parser.add_argument("--baseline", default=REPLAY_BASELINE_PATH,
+                        help="Baseline JSON (timings are machine-specific, record it on the machine that checks)")
+    parser.add_argument("--max-networks", type=int, default=10, help="Networks enumerated and assembled")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing runs, the best one is kept")
+    parser.add_argument("--threshold", type=float, default=REPLAY_REGRESSION_PERCENT,
+                        help="Allowed growth of a stage time or peak memory, percent")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    result = run_replay(args.geometry, args.max_networks, args.repeats, not args.no_memory)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(asdict(result), f, indent=4)
+        _print_result(result, None)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        _print_result(result, None)
+        print(f"No baseline at {args.baseline}, record one with --update-baseline")
+        return 2
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    _print_result(result, baseline)
+
+    failures = compare(result, baseline, args.threshold)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
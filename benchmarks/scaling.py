@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Callable, Any
+from geometry_connector import instrumentation
+from geometry_connector.benchmarks.fracture import generate_fracture
+from geometry_connector.build_geometry import assemble_network
+from geometry_connector.congruence import CongruenceClasses
+from geometry_connector.connect_geometry import GeometryConnector
+from geometry_connector.constants import DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, DEFAULT_FACE_AREA_THRESHOLD, \
+    DEFAULT_EDGE_LENGTH_THRESHOLD
+from geometry_connector.graph_utils import sort_graph, generate_networks, beam_search_networks
+from geometry_connector.greedy_assembly import greedy_assemble
+
+DEFAULT_SIZES = (10, 25, 50, 100, 250, 500, 1000, 2000)
+
+
+@dataclass
+class StageResult:
+    seconds: float = 0.0
+    peak_bytes: int = 0
+    items: int = 0                                      # Сколько единиц работы обработано (для пропускной способности)
+    error: str | None = None
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class SizeResult:
+    n_cells: int
+    n_meshes: int
+    n_faces: int
+    n_matches: int = 0
+    n_networks: int = 0
+    stages: Dict[str, StageResult] = field(default_factory=dict)
+    counters: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+
+# Замер одной стадии: время и пик памяти по tracemalloc
+def _measure(fn: Callable[[], Any], track_memory: bool) -> tuple[Any, StageResult]:
+    stage = StageResult()
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = None
+    try:
+        value = fn()
+    except RecursionError as exc:
+        stage.error = f"RecursionError: {exc}"
+    finally:
+        stage.seconds = time.perf_counter() - start
+        if track_memory:
+            stage.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return value, stage
+
+
+def run_size(n_cells: int, seed: int = 0, noise: float = 0.0, random_pose: bool = False, solid_planes: int = 0,
+             max_networks: int = 10, track_memory: bool = True, use_match_table: bool = False,
+             greedy: bool = False, beam_width: int = 0, beam_time_limit: float = 5.0,
+             prune: bool = False, lattice: bool = False, congruent: bool = False) -> SizeResult:
+    instrumentation.reset()
+    fracture = generate_fracture(n_cells, seed=seed, noise=noise, random_pose=random_pose, solid_planes=solid_planes,
+                                 lattice=lattice)
+    meshes = fracture.meshes
+    meshes_dictionary = {m.name: m for m in meshes}
+    result = SizeResult(n_cells=n_cells, n_meshes=len(meshes), n_faces=sum(len(m.faces) for m in meshes))
+
+    connector = GeometryConnector(
+        connected_edge_angle_threshold=DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD,
+        area_threshold=DEFAULT_FACE_AREA_THRESHOLD,
+        edge_length_threshold=DEFAULT_EDGE_LENGTH_THRESHOLD,
+        use_match_table=use_match_table
+    )
+
+    graph, stage = _measure(lambda: connector.build_mesh_graph(meshes), track_memory)
+    stage.items = len(meshes) * (len(meshes) - 1) // 2
+    result.stages["build_mesh_graph"] = stage
+    if graph is None:
+        return result
+    result.n_matches = sum(len(v) for d in graph.connections.values() for v in d.values()) // 2
+
+    sorted_graph, stage = _measure(lambda: sort_graph(graph), track_memory)
+    stage.items = result.n_matches
+    result.stages["sort_graph"] = stage
+
+    if greedy:
+        _, stage = _measure(lambda: greedy_assemble(sorted_graph, meshes_dictionary), track_memory)
+        stage.items = result.n_matches
+        result.stages["greedy_assembly"] = stage
+
+    if beam_width > 0:
+        beam_networks, stage = _measure(lambda: beam_search_networks(sorted_graph, beam_width, beam_time_limit,
+                                                                     max_networks), track_memory)
+        stage.items = len(beam_networks or [])
+        result.stages["beam_search"] = stage
+
+    congruence = None
+    if congruent:
+        congruence, stage = _measure(lambda: CongruenceClasses(meshes_dictionary), track_memory)
+        stage.items = len(meshes)
+        result.stages["congruence"] = stage
+
+    prune_meshes = meshes_dictionary if prune else None
+    networks, stage = _measure(lambda: list(itertools.islice(generate_networks(sorted_graph, prune_meshes, congruence),
+                                                             max_networks)), track_memory)
+    networks = networks or []
+    stage.items = len(networks)
+    result.stages["generate_networks"] = stage
+    result.n_networks = len(networks)
+
+    _, stage = _measure(lambda: [assemble_network(net, meshes_dictionary, sorted_graph) for net in networks],
+                        track_memory)
+    stage.items = len(networks)
+    result.stages["assemble_network"] = stage
+
+    result.counters = {name: stats['counters'] for name, stats in instrumentation.get_report().items()}
+    return result
+
+
+def _print_table(results: List[SizeResult]):
+    print(f"{'N':>6} {'stage':<18} {'time, s':>10} {'items/s':>12} {'peak, MiB':>10}")
+    for r in results:
+        for name, st in r.stages.items():
+            line = f"{r.n_cells:>6} {name:<18} {st.seconds:>10.4f} {st.throughput:>12.1f} {st.peak_bytes / 2 ** 20:>10.2f}"
+            if st.error:
+                line += f"  ({st.error})"
+            print(line)
+        print(f"{'':>6} meshes={r.n_meshes} faces={r.n_faces} matches={r.n_matches} networks={r.n_networks}")
+        for name, counters in r.counters.items():
+            if counters:
+                print(f"{'':>6} {name}: " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Scaling benchmark on synthetic Voronoi fractures")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--random-pose", action="store_true")
+    parser.add_argument("--solid-planes", type=int, default=0, help="Cut the box into a convex solid first")
+    parser.add_argument("--max-networks", type=int, default=10)
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows Python down)")
+    parser.add_argument("--match-table", action="store_true", help="Store graph matches in the columnar MatchTable")
+    parser.add_argument("--greedy", action="store_true", help="Also time the greedy hierarchical assembly")
+    parser.add_argument("--beam", type=int, default=0, metavar="WIDTH", help="Also time beam search of this width")
+    parser.add_argument("--beam-time", type=float, default=5.0, help="Beam search deadline, seconds")
+    parser.add_argument("--prune", action="store_true", help="Cut branches with inconsistent poses (PoseConsistency)")
+    parser.add_argument("--lattice", action="store_true", help="Place seeds on a grid so that fragments are congruent")
+    parser.add_argument("--congruent", action="store_true", help="Collapse permutations of congruent fragments")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n in args.sizes:
+        results.append(run_size(n, seed=args.seed, noise=args.noise, random_pose=args.random_pose,
+                                solid_planes=args.solid_planes, max_networks=args.max_networks,
+                                track_memory=not args.no_memory, use_match_table=args.match_table,
+                                greedy=args.greedy, beam_width=args.beam, beam_time_limit=args.beam_time,
+                                prune=args.prune, lattice=args.lattice, congruent=args.congruent))
+        _print_table(results[-1:])
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import json
+import math
+import time
+from dataclasses import asdict
+from typing import List
+from geometry_connector.benchmarks.fracture import generate_fracture
+from geometry_connector.constants import DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, DEFAULT_FACE_AREA_THRESHOLD, \
+    DEFAULT_EDGE_LENGTH_THRESHOLD
+from geometry_connector.reader import JsonMeshReader
+from geometry_connector.threshold_sweep import sweep_thresholds
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Match and network counts over a grid of connector thresholds")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--geometry", help="Meshes JSON written by the add-on (data/geometry.json)")
+    source.add_argument("--cells", type=int, default=25, help="Synthetic Voronoi fracture size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--angles", type=float, nargs="+",
+                        default=[math.degrees(DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD)], help="Degrees")
+    parser.add_argument("--areas", type=float, nargs="+", default=[DEFAULT_FACE_AREA_THRESHOLD])
+    parser.add_argument("--edges", type=float, nargs="+", default=[DEFAULT_EDGE_LENGTH_THRESHOLD])
+    parser.add_argument("--max-networks", type=int, default=1000, help="0 skips network counting")
+    parser.add_argument("--prune", action="store_true", help="Count networks with pose consistency pruning")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    meshes = JsonMeshReader.read(args.geometry) if args.geometry else generate_fracture(args.cells, seed=args.seed).meshes
+
+    start = time.perf_counter()
+    points = sweep_thresholds(meshes, [math.radians(a) for a in args.angles], args.areas, args.edges,
+                              max_networks=args.max_networks, prune_poses=args.prune)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'angle, deg':>10} {'area':>10} {'edge':>10} {'FACE':>7} {'EDGE':>7} {'networks':>9}")
+    for p in points:
+        networks = f"{p.networks}{'+' if p.networks_capped else ''}"
+        print(f"{math.degrees(p.connected_edge_angle_threshold):>10.3f} {p.area_threshold:>10.2g} "
+              f"{p.edge_length_threshold:>10.2g} {p.face_matches:>7} {p.edge_matches:>7} {networks:>9}")
+    print(f"{len(points)} settings, {len(meshes)} meshes in {elapsed:.2f} s")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump([asdict(p) for p in points], f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
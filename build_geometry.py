@@ -1,16 +1,20 @@
-﻿import math
-import bpy
+﻿import logging
+import math
 from typing import Dict, List, Counter, Set
 from geometry_connector.constants import MAX_DISTANCE_BETWEEN_MESHES, NORMAL_ANGLE_THRESHOLD
 from geometry_connector.enums import MatchType
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.logger import get_logger
 from geometry_connector.models import Network, Mesh, TransformMatch, MeshGraph, GraphMatch
 from mathutils import Quaternion, Vector
 from mathutils import Matrix
 
+log = get_logger("build")
 
+
+@instrumented("assemble_network")
 def assemble_network(network: Network, meshes: Dict[str, Mesh], graph: MeshGraph) -> List[TransformMatch]:
-    print("[assemble_network] Старт сети")
-    print(f"[assemble_network] Mesh Cube_cell.023 присутствует в meshes? {'Cube_cell.023' in meshes}")
+    log.debug("[assemble_network] Старт сети")
 
     # Кэшируем все исходные мировые матрицы
     mat_worlds: Dict[str, Matrix] = {name: mesh.matrix_world.copy() for name, mesh in meshes.items()}
@@ -25,72 +29,17 @@ def assemble_network(network: Network, meshes: Dict[str, Mesh], graph: MeshGraph
     transforms.append(
         TransformMatch(src_mesh_name=base, dst_mesh_name=base, matrix_world=mat_worlds[base])
     )
-    print(f"[assemble_network] Базовый меш: {base}")
+    log.debug("[assemble_network] Базовый меш: %s", base)
 
     for match in network.matches:
         src, dst = match.mesh2, match.mesh1
-        idx_src, idx_dst = match.indices[1], match.indices[0]
-        edges = [(e2, e1) for e1, e2 in match.edges]
-
-        # Лог, если задействован интересующий меш
-        if 'Cube_cell.023' in (src, dst):
-            print(f"[assemble_network] Обработка Cube_cell.023 в соединении {src} -> {dst}")
-
-        # Получаем текущие мировые матрицы
-        M_src = mat_worlds[src]
-        M_dst = mat_worlds[dst]
-
-        # Вспомогательная функция для центроидов и направлений
-        def get_cd(fe, M: Matrix):
-            pts = [M @ Vector(v) for v in fe.vertices]
-            ctr = sum(pts, Vector()) / len(pts)
-            if hasattr(fe, 'normal'):
-                nr = (M.to_3x3() @ fe.normal).normalized()
-                return ctr, nr
-            return ctr, (pts[1] - pts[0]).normalized()
-
-        # Выбираем Face или Edge
-        if match.match_type == MatchType.FACE:
-            fe_s = meshes[src].faces[idx_src]
-            fe_d = meshes[dst].faces[idx_dst]
-        else:
-            fe_s = meshes[src].edges[idx_src]
-            fe_d = meshes[dst].edges[idx_dst]
-
-        c_src, dir_src = get_cd(fe_s, M_src)
-        c_dst, dir_dst = get_cd(fe_d, M_dst)
-        print(f"[assemble_network] c_src={c_src}, dir_src={dir_src}, c_dst={c_dst}, dir_dst={dir_dst}")
-
-        # Вычисляем кватернион
-        if match.match_type == MatchType.FACE:
-            print(f"[assemble_network] Расчёт FACE-вращения для {src}")
-            q1 = dir_src.rotation_difference(-dir_dst)
-            if edges:
-                e1, e2 = edges[0]
-                p1 = [M_src @ Vector(v) for v in e1.vertices]
-                v1 = (q1 @ (p1[1] - p1[0]).normalized()).normalized()
-                p2 = [M_dst @ Vector(v) for v in e2.vertices]
-                v2 = (p2[1] - p2[0]).normalized()
-                axis = -dir_dst
-                angle = v1.angle(v2)
-                sign = 1 if axis.dot(v1.cross(v2)) > 0 else -1
-                q = Quaternion(axis, sign * angle) @ q1
-            else:
-                q = q1
-        else:
-            print(f"[assemble_network] Расчёт EDGE-вращения для {src}")
-            q = dir_src.rotation_difference(dir_dst)
-        print(f"[assemble_network] Кватернион поворота: {q}")
-
-        # Строим матрицы трансформации
-        mat_rot = q.to_matrix().to_4x4()
-        mat_trans = Matrix.Translation(c_dst - (q @ c_src))
-        new_world = mat_trans @ mat_rot @ M_src
+        log.debug("[assemble_network] Обработка соединения %s -> %s", src, dst)
+        new_world = align_match(match, meshes, mat_worlds[src], mat_worlds[dst])
 
         # Сохраняем результат
         mat_worlds[src] = new_world
         transforms.append(TransformMatch(src_mesh_name=src, dst_mesh_name=dst, matrix_world=new_world))
-        print(f"[assemble_network] Transform для {src}:\n{new_world}")
+        log.debug("[assemble_network] Transform для %s:\n%s", src, new_world)
 
     # Проверка ориентации: флипим меши с некорректными нормалями
     _flip_incorrect_orientations(network, graph, meshes, mat_worlds, transforms)
@@ -98,14 +47,74 @@ def assemble_network(network: Network, meshes: Dict[str, Mesh], graph: MeshGraph
     # Пост-обработка: корректировка трансформаций
     _correct_transformations(network, meshes, mat_worlds, transforms, MAX_DISTANCE_BETWEEN_MESHES)
 
-    for asfas in transforms:
-        print(f"{asfas.src_mesh_name} -> {asfas.dst_mesh_name}")
+    if log.isEnabledFor(logging.DEBUG):
+        for tm in transforms:
+            log.debug("[assemble_network] %s -> %s", tm.src_mesh_name, tm.dst_mesh_name)
 
-    print("[assemble_network] Завершение сети")
+    log.debug("[assemble_network] Завершение сети")
     return transforms
 
 
+# Новая мировая матрица mesh2 совпадения, при которой его грань/ребро прилегает к mesh1 в текущем положении
+def align_match(match: GraphMatch, meshes: Dict[str, Mesh], M_src: Matrix, M_dst: Matrix) -> Matrix:
+    src, dst = match.mesh2, match.mesh1
+    idx_src, idx_dst = match.indices[1], match.indices[0]
+    edges = [(e2, e1) for e1, e2 in match.edges]
+
+    # Вспомогательная функция для центроидов и направлений
+    def get_cd(fe, M: Matrix):
+        pts = [M @ Vector(v) for v in fe.vertices]
+        ctr = sum(pts, Vector()) / len(pts)
+        if hasattr(fe, 'normal'):
+            nr = (M.to_3x3() @ fe.normal).normalized()
+            return ctr, nr
+        return ctr, (pts[1] - pts[0]).normalized()
+
+    # Выбираем Face или Edge
+    if match.match_type == MatchType.FACE:
+        fe_s = meshes[src].face(idx_src)
+        fe_d = meshes[dst].face(idx_dst)
+    else:
+        fe_s = meshes[src].edge(idx_src)
+        fe_d = meshes[dst].edge(idx_dst)
+
+    c_src, dir_src = get_cd(fe_s, M_src)
+    c_dst, dir_dst = get_cd(fe_d, M_dst)
+    log.debug("[align_match] c_src=%s, dir_src=%s, c_dst=%s, dir_dst=%s", c_src, dir_src, c_dst, dir_dst)
+
+    # Вычисляем кватернион
+    if match.match_type == MatchType.FACE and match.rotation is not None:
+        # Вращение совпадения проверено по всем рёбрам в локальных координатах: mesh2 -> mesh1
+        log.debug("[align_match] FACE-вращение для %s по вращению совпадения", src)
+        q = M_dst.to_quaternion() @ match.rotation @ M_src.to_quaternion().inverted()
+    elif match.match_type == MatchType.FACE:
+        log.debug("[align_match] Расчёт FACE-вращения для %s", src)
+        q1 = dir_src.rotation_difference(-dir_dst)
+        if edges:
+            e1, e2 = edges[0]
+            p1 = [M_src @ Vector(v) for v in e1.vertices]
+            v1 = (q1 @ (p1[1] - p1[0]).normalized()).normalized()
+            p2 = [M_dst @ Vector(v) for v in e2.vertices]
+            v2 = (p2[1] - p2[0]).normalized()
+            axis = -dir_dst
+            angle = v1.angle(v2)
+            sign = 1 if axis.dot(v1.cross(v2)) > 0 else -1
+            q = Quaternion(axis, sign * angle) @ q1
+        else:
+            q = q1
+    else:
+        log.debug("[align_match] Расчёт EDGE-вращения для %s", src)
+        q = dir_src.rotation_difference(dir_dst)
+    log.debug("[align_match] Кватернион поворота: %s", q)
+
+    # Строим матрицы трансформации
+    mat_rot = q.to_matrix().to_4x4()
+    mat_trans = Matrix.Translation(c_dst - (q @ c_src))
+    return mat_trans @ mat_rot @ M_src
+
+
 def apply_transforms_to_scene(transforms: List[TransformMatch]):
+    import bpy
     for tm in transforms:
         obj = bpy.data.objects.get(tm.src_mesh_name)
         if obj:
@@ -121,11 +130,11 @@ def _correct_transformations(network: Network, meshes: Dict[str, Mesh], mat_worl
 
         # Сбор соответствующих точек
         if match.match_type == MatchType.FACE:
-            fe_s = meshes[src].faces[idx_src]
-            fe_d = meshes[dst].faces[idx_dst]
+            fe_s = meshes[src].face(idx_src)
+            fe_d = meshes[dst].face(idx_dst)
         else:
-            fe_s = meshes[src].edges[idx_src]
-            fe_d = meshes[dst].edges[idx_dst]
+            fe_s = meshes[src].edge(idx_src)
+            fe_d = meshes[dst].edge(idx_dst)
 
         pts_s = [M_src @ Vector(v) for v in fe_s.vertices]
         pts_d = [M_dst @ Vector(v) for v in fe_d.vertices]
@@ -140,11 +149,11 @@ def _correct_transformations(network: Network, meshes: Dict[str, Mesh], mat_worl
             corr = Matrix.Translation(shift)
             tm.matrix_world = corr @ tm.matrix_world
             mat_worlds[src] = tm.matrix_world
-            print(f"[correct_transformations] Применена коррекция для {src}: shift={shift}")
+            log.debug("[correct_transformations] Применена коррекция для %s: shift=%s", src, shift)
 
 
 def _flip_incorrect_orientations(network : Network, graph: MeshGraph, meshes: Dict[str, Mesh], mat_worlds: Dict[str, Matrix], transforms: List[TransformMatch]) -> None:
-    print("[flip_orientations] Начало проверки ориентаций")
+    log.debug("[flip_orientations] Начало проверки ориентаций")
 
     cos_th = math.cos(NORMAL_ANGLE_THRESHOLD)
     tm_map = {tm.src_mesh_name: tm for tm in transforms}
@@ -152,37 +161,45 @@ def _flip_incorrect_orientations(network : Network, graph: MeshGraph, meshes: Di
     flipped_meshes : Set[str] = set()
 
     while True:
+        instrumentation.count("assemble_network", "flip_passes")
         meshes_to_flip = []
         added_matches = []
 
         for tm in transforms[1:]:
             name = tm.src_mesh_name
-            print(f"[flip_orientations] Проверяем меш '{name}'")
+            log.debug("[flip_orientations] Проверяем меш '%s'", name)
             for neighbor_name, gm_list in graph.connections.get(name, {}).items():
-                print(f"[flip_orientations]  Найден сосед '{neighbor_name}' с {len(gm_list)} связями")
+                log.debug("[flip_orientations]  Найден сосед '%s' с %d связями", neighbor_name, len(gm_list))
                 for gm in gm_list:
+                    # Нормали есть только у граней, EDGE-совпадения ориентацию не проверяют
+                    if gm.match_type != MatchType.FACE:
+                        continue
                     if gm in added_matches or gm.inverted in added_matches:
                         continue
 
-                    print(f"[flip_orientations]   Используемый GraphMatch: {gm.mesh1} -> {gm.mesh2}, indices: {gm.indices[0]} {gm.indices[1]}")
+                    log.debug("[flip_orientations]   Используемый GraphMatch: %s -> %s, indices: %d %d",
+                              gm.mesh1, gm.mesh2, gm.indices[0], gm.indices[1])
                     is_src = (name == gm.mesh2)
                     idx_local, idx_other = (gm.indices[1], gm.indices[0]) if is_src else (gm.indices[0], gm.indices[1])
-                    fe_local = meshes[name].faces[idx_local] if gm.match_type == MatchType.FACE else meshes[name].edges[idx_local]
-                    fe_other = meshes[neighbor_name].faces[idx_other] if gm.match_type == MatchType.FACE else meshes[neighbor_name].edges[idx_other]
+                    fe_local = meshes[name].face(idx_local)
+                    fe_other = meshes[neighbor_name].face(idx_other)
                     n_local = (mat_worlds[name].to_3x3() @ fe_local.normal).normalized()
                     n_other = (mat_worlds[neighbor_name].to_3x3() @ fe_other.normal).normalized()
-                    print(f"[flip_orientations]    Нормаль локальная: {n_local}, нормаль соседа: {-n_other}, dot = {n_local.dot(-n_other)}, thr = {cos_th}")
-                    if n_local.dot(-n_other) < cos_th:
-                        print(f"[flip_orientations]    Нормали не противоположны, заносим {name} и {neighbor_name}")
+                    dot = n_local.dot(-n_other)
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("[flip_orientations]    Нормаль локальная: %s, нормаль соседа: %s, dot = %s, thr = %s",
+                                  n_local, -n_other, dot, cos_th)
+                    if dot < cos_th:
+                        log.debug("[flip_orientations]    Нормали не противоположны, заносим %s и %s", name, neighbor_name)
                         meshes_to_flip.append(name)
                         meshes_to_flip.append(neighbor_name)
                         added_matches.append(gm)
                         break
                     else:
-                        print(f"[flip_orientations]  Для меша '{name}' нет используемых соединений, требующих флипа")
+                        log.debug("[flip_orientations]  Для меша '%s' нет используемых соединений, требующих флипа", name)
                         continue
 
-        print(f"[flip_orientations]  Проход закончен, список для флипа {meshes_to_flip}")
+        log.debug("[flip_orientations]  Проход закончен, список для флипа %s", meshes_to_flip)
 
         counter = Counter(meshes_to_flip)
         if counter:
@@ -193,11 +210,14 @@ def _flip_incorrect_orientations(network : Network, graph: MeshGraph, meshes: Di
         if most_common_element in flipped_meshes or count < 2:
             break
 
-        print(f"[flip_orientations]  Самый частый элемент {most_common_element}, поворачиваем его")
+        log.debug("[flip_orientations]  Самый частый элемент %s, поворачиваем его", most_common_element)
 
-        match = [m for m in network.matches if m.mesh2 == most_common_element][0]
+        face_matches = [m for m in network.matches if m.mesh2 == most_common_element and m.match_type == MatchType.FACE]
+        if not face_matches:
+            break
+        match = face_matches[0]
 
-        fe_local = meshes[most_common_element].faces[match.indices[1]] if match.match_type == MatchType.FACE else meshes[most_common_element].edges[match.indices[1]]
+        fe_local = meshes[most_common_element].face(match.indices[1])
         n_local = (mat_worlds[most_common_element].to_3x3() @ fe_local.normal).normalized()
         center = sum((mat_worlds[most_common_element] @ Vector(v) for v in fe_local.vertices), Vector()) / len(fe_local.vertices)
         q_flip = Quaternion(n_local, math.pi)
@@ -208,9 +228,9 @@ def _flip_incorrect_orientations(network : Network, graph: MeshGraph, meshes: Di
         mat_worlds[most_common_element] = tm_map[most_common_element].matrix_world
 
         flipped_meshes.add(most_common_element)
-        print(f"[flip_orientations]    Меш '{most_common_element}' флипанут на 180° вокруг нормали {n_local}")
+        log.debug("[flip_orientations]    Меш '%s' флипанут на 180° вокруг нормали %s", most_common_element, n_local)
 
-    print("[flip_orientations] Завершение проверки ориентаций")
+    log.debug("[flip_orientations] Завершение проверки ориентаций")
 
 
 # def postprocess_leaf_orientation(network, meshes: dict[str, Mesh], graph, transforms: list[TransformMatch]) -> List[TransformMatch]:
@@ -1,11 +1,19 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from typing import List
 import bpy
 import bmesh
-from mathutils import Vector
+import numpy as np
+from mathutils import Vector, Matrix
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.mesh_arrays import MeshArrays, extract, coplanar_labels, dissolvable_edges, group_lists
 from geometry_connector.models import Mesh, Face, Edge
+from geometry_connector.planar_simplify import simplify_fragment
 
 ORIG_INDICES = "orig_indices"
 ORIG_INDEX = "orig_index"
+EXTRACT_MESH_NAME = "_geometry_connector_extract"
 
 
 class GeometryCalculator:
@@ -14,76 +22,39 @@ class GeometryCalculator:
         self.angle_threshold = scene.coplanar_angle_threshold
         self.distance_threshold = scene.coplanar_distance_threshold
         self.curvature_threshold = scene.curvature_threshold
+        self.parallel = scene.parallel_extraction
 
 
+    @instrumented("calculate")
     def calculate(self) -> List[Mesh]:
-        result_meshes: List[Mesh] = []
+        objects = [obj for obj in bpy.data.objects if obj.type == 'MESH' and obj.visible_get()]
+        if self.parallel:
+            return self._calculate_parallel(objects)
 
-        for obj in bpy.data.objects:
-            if obj.type != 'MESH' or not obj.visible_get():
-                continue
+        result_meshes: List[Mesh] = []
 
+        for obj in objects:
             # region Чтение мэша
 
             mesh = obj.data
-            bm = bmesh.new()
-            bm.from_mesh(mesh)
-
-            bm.verts.ensure_lookup_table()
-            bm.faces.ensure_lookup_table()
-            bm.edges.ensure_lookup_table()
+            source = MeshArrays.from_blender(mesh)
 
             # endregion
 
-            # Кэшируем переиспользуемые данные
-            face_normals = [f.normal.copy() for f in bm.faces]
-            face_centroids = [f.calc_center_median().copy() for f in bm.faces]
-
-            # region Создаем словарь смежности граней, чтобы потом была возможность вернуться от аппроксимации к дефолтной модели
-
-            neighbors = {i: [] for i in range(len(bm.faces))}
-            for f_idx, f in enumerate(bm.faces):
-                n1 = face_normals[f_idx]
-                d1 = n1.dot(face_centroids[f_idx])
-                for e in f.edges:
-                    for g in e.link_faces:
-                        g_idx = g.index
-                        if g_idx <= f_idx:
-                            continue
-                        n2 = face_normals[g_idx]
-                        if n1.angle(n2) < self.angle_threshold:
-                            d2 = n2.dot(face_centroids[g_idx])
-                            if abs(d1 - d2) < self.distance_threshold:
-                                neighbors[f_idx].append(g_idx)
-                                neighbors[g_idx].append(f_idx)
-
-            # Группировка компланарных граней
-            visited = set()
-            coplanar_groups = []
-            for start in neighbors:
-                if start in visited:
-                    continue
-                stack = [start]
-                comp = []
-                while stack:
-                    curr = stack.pop()
-                    if curr in visited:
-                        continue
-                    visited.add(curr)
-                    comp.append(curr)
-                    for nbr in neighbors[curr]:
-                        if nbr not in visited:
-                            stack.append(nbr)
-                coplanar_groups.append(comp)
+            # region Группы компланарных граней исходной модели, чтобы потом была возможность вернуться от аппроксимации к дефолтной модели
+
+            group_labels = coplanar_labels(source, self.angle_threshold, self.distance_threshold)
 
             # endregion
 
             # region Аппроксимация контуров
 
-            # Собираем только внутренние рёбра, у которых ровно две прилегающие грани и угол между ними < threshold
-            internal_edges = [e for e in bm.edges
-                              if len(e.link_faces) == 2
-                              and e.link_faces[0].normal.angle(e.link_faces[1].normal) < self.angle_threshold]
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bm.edges.ensure_lookup_table()
+
+            # Внутренние рёбра, у которых ровно две прилегающие грани и угол между ними < threshold
+            internal_edges = [bm.edges[i] for i in dissolvable_edges(source, self.angle_threshold).tolist()]
 
             # Производим dissolve по этим рёбрам
             bmesh.ops.dissolve_edges(
@@ -110,79 +81,81 @@ class GeometryCalculator:
 
             # region Сбор данных
 
-            # Получаем размеры меша
-            coords = [v.co for v in bm.verts]
-            if coords:
-                xs = [c.x for c in coords]; ys = [c.y for c in coords]; zs = [c.z for c in coords]
-                size = [max(xs) - min(xs), max(ys) - min(ys), max(zs) - min(zs)]
-            else:
-                size = [0.0, 0.0, 0.0]
-
-            # Классификация вершин по кривизне
-            convex_inds, concave_inds, flat_inds = [], [], []
-            for v in bm.verts:
-                normals = [f.normal for f in v.link_faces]
-                if not normals:
-                    continue
-                avg = sum(normals, Vector()) / len(normals)
-                avg.normalize()
-                deviation = 1.0 - v.normal.dot(avg)
-                if deviation > self.curvature_threshold:
-                    convex_inds.append(v.index)
-                elif deviation < -self.curvature_threshold:
-                    concave_inds.append(v.index)
-                else:
-                    flat_inds.append(v.index)
-
-            # Собираем данные граней и ребер
-            faces_out: List[Face] = []
-            group_map = {idx: grp for grp in coplanar_groups for idx in grp}
-            for f in bm.faces:
-                idx = f.index
-                orig_group = group_map.get(idx, [idx])
-                vert_coords = [[v.co.x, v.co.y, v.co.z] for v in f.verts]
-
-                edges_list: List[Edge] = []
-                linked_edges = f.edges[:]
-                for e in linked_edges:
-                    edge_verts = [[v.co.x, v.co.y, v.co.z] for v in e.verts]
-                    edges_list.append(Edge(
-                        new_index=e.index,
-                        orig_indices=[e.index],
-                        length=e.calc_length(),
-                        vertices=edge_verts
-                    ))
-
-                # Определяем тип грани по среднему диэдральному
-                dihedral_angles = [e.link_faces[0].normal.angle(e.link_faces[1].normal)
-                                   for e in linked_edges if len(e.link_faces) == 2]
-                avg_dihedral = sum(dihedral_angles) / len(dihedral_angles) if dihedral_angles else 0.0
-                face_type = 1 if avg_dihedral > self.angle_threshold else (
-                    -1 if avg_dihedral < -self.angle_threshold else 0)
-
-                normal = (f.verts[1].co - f.verts[0].co).cross(f.verts[2].co - f.verts[0].co).normalized()
-
-                faces_out.append(Face(
-                    new_index=idx,
-                    orig_indices=orig_group,
-                    area=f.calc_area(),
-                    face_type=face_type,
-                    normal=normal,
-                    edges=edges_list,
-                    vertices=vert_coords
-                ))
+            # Выгружаем упрощённую геометрию во временный меш и снимаем массивы через foreach_get
+            tmp_mesh = bpy.data.meshes.new(EXTRACT_MESH_NAME)
+            bm.to_mesh(tmp_mesh)
+            bm.free()
+            arrays = MeshArrays.from_blender(tmp_mesh)
+            bpy.data.meshes.remove(tmp_mesh)
 
-            result_meshes.append(Mesh(
-                name=obj.name,
-                size=size,
-                convex_points=convex_inds,
-                concave_points=concave_inds,
-                flat_points=flat_inds,
-                matrix_world=obj.matrix_world.copy(),
-                faces=faces_out
-            ))
+            result_meshes.append(self._build_mesh(obj.name, obj.matrix_world.copy(), arrays, group_labels))
+            instrumentation.count("calculate", "faces_extracted", arrays.face_count)
 
             # endregion
 
-            bm.free()
         return result_meshes
+
+
+    # Главный поток только снимает сырые массивы, упрощение всех фрагментов идёт в пуле процессов
+    def _calculate_parallel(self, objects) -> List[Mesh]:
+        raw = [MeshArrays.from_blender(obj.data) for obj in objects]
+
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+            simplified = list(pool.map(simplify_fragment, raw,
+                                       repeat(self.angle_threshold), repeat(self.distance_threshold)))
+
+        result_meshes: List[Mesh] = []
+        for obj, (arrays, group_labels) in zip(objects, simplified):
+            result_meshes.append(self._build_mesh(obj.name, obj.matrix_world.copy(), arrays, group_labels))
+            instrumentation.count("calculate", "faces_extracted", arrays.face_count)
+        return result_meshes
+
+
+    # Сборка Mesh/Face/Edge из массивов: все вычисления векторные, здесь только упаковка в объекты
+    def _build_mesh(self, name: str, matrix_world: Matrix, arrays: MeshArrays, group_labels: np.ndarray) -> Mesh:
+        ext = extract(arrays, self.angle_threshold, self.curvature_threshold)
+        groups, group_of = group_lists(group_labels)
+        group_of = group_of.tolist()
+
+        co = arrays.co.tolist()
+        edge_verts = arrays.edge_verts.tolist()
+        edge_lengths = ext.edge_lengths.tolist()
+        edge_directions = ext.edge_directions
+        loop_verts = arrays.loop_verts.tolist()
+        loop_edges = arrays.loop_edges.tolist()
+        face_types = ext.face_types.tolist()
+        face_areas = arrays.face_areas.tolist()
+
+        faces_out: List[Face] = []
+        for idx, (start, total) in enumerate(zip(arrays.loop_start.tolist(), arrays.loop_total.tolist())):
+            edges_list: List[Edge] = []
+            for e_idx in loop_edges[start:start + total]:
+                a, b = edge_verts[e_idx]
+                edges_list.append(Edge(
+                    new_index=e_idx,
+                    orig_indices=[e_idx],
+                    length=edge_lengths[e_idx],
+                    vertices=[co[a], co[b]],
+                    direction=edge_directions[e_idx]
+                ))
+
+            faces_out.append(Face(
+                new_index=idx,
+                orig_indices=list(groups[group_of[idx]]) if idx < len(group_of) else [idx],
+                area=face_areas[idx],
+                face_type=face_types[idx],
+                normal=Vector(ext.face_normals[idx]),
+                unit_normal=ext.face_normals[idx],
+                edges=edges_list,
+                vertices=[co[v] for v in loop_verts[start:start + total]]
+            ))
+
+        return Mesh(
+            name=name,
+            size=ext.size.tolist(),
+            convex_points=ext.convex_points.tolist(),
+            concave_points=ext.concave_points.tolist(),
+            flat_points=ext.flat_points.tolist(),
+            matrix_world=matrix_world,
+            faces=faces_out
+        )
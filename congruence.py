@@ -0,0 +1,215 @@
+import hashlib
+import itertools
+from typing import Dict, List, Tuple, Iterator
+import numpy as np
+from geometry_connector.constants import CONGRUENCE_DECIMALS, CONGRUENCE_TOLERANCE, CONGRUENCE_FULL_GROUP_SIZE
+from geometry_connector.enums import MatchType
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Mesh, MeshGraph, GraphMatch, Network
+
+log = get_logger("graph")
+
+# Перенумерация индексов при замене меша конгруэнтным: (тип, индекс) -> индекс в другом меше
+IndexMap = Dict[Tuple[MatchType, int], int]
+
+
+# Каноническая подпись фрагмента, не зависящая от поворота и сдвига: мультимножество граней
+# (число рёбер, площадь, отсортированные длины рёбер), округлённых до CONGRUENCE_DECIMALS.
+# Равные подписи — только кандидаты, конгруэнтность подтверждает congruence_maps
+def fragment_signature(mesh: Mesh) -> str:
+    d = CONGRUENCE_DECIMALS
+    faces = sorted((len(f.edges), round(f.area, d), tuple(sorted(round(e.length, d) for e in f.edges)))
+                   for f in mesh.faces)
+    return hashlib.blake2b(repr(faces).encode(), digest_size=16).hexdigest()
+
+
+def _vertices(mesh: Mesh) -> np.ndarray:
+    points = np.array([v for f in mesh.faces for v in f.vertices], dtype=np.float64)
+    return np.unique(np.round(points, 9), axis=0)
+
+
+def _frame(origin: np.ndarray, normal: np.ndarray, point: np.ndarray) -> np.ndarray | None:
+    x = point - origin
+    x = x - normal * (x @ normal)
+    norm = np.linalg.norm(x)
+    if norm < 1e-12:
+        return None
+    x /= norm
+    return np.column_stack((x, np.cross(normal, x), normal))
+
+
+def _face_centroid(face) -> np.ndarray:
+    return np.mean(np.asarray(face.vertices, dtype=np.float64), axis=0)
+
+
+# Собственное движение (без отражений), переводящее a в b, и соответствие граней и рёбер.
+# Самая большая грань a прикладывается к каждой подходящей грани b по каждой её вершине
+def congruence_maps(a: Mesh, b: Mesh) -> IndexMap | None:
+    if len(a.faces) != len(b.faces):
+        return None
+    verts_a, verts_b = _vertices(a), _vertices(b)
+    if len(verts_a) != len(verts_b):
+        return None
+    scale = max(np.abs(verts_a).max(), 1e-12)
+    tol = CONGRUENCE_TOLERANCE * scale
+
+    d = CONGRUENCE_DECIMALS
+    fa = max(a.faces, key=lambda f: f.area)
+    key_a = (len(fa.edges), round(fa.area, d))
+    ca = _face_centroid(fa)
+    frame_a = _frame(ca, fa.unit_normal, np.asarray(fa.vertices[0], dtype=np.float64))
+    if frame_a is None:
+        return None
+
+    for fb in b.faces:
+        if (len(fb.edges), round(fb.area, d)) != key_a:
+            continue
+        cb = _face_centroid(fb)
+        for vb in fb.vertices:
+            frame_b = _frame(cb, fb.unit_normal, np.asarray(vb, dtype=np.float64))
+            if frame_b is None:
+                continue
+            r = frame_b @ frame_a.T
+            t = cb - r @ ca
+            moved = verts_a @ r.T + t
+            dist = np.linalg.norm(moved[:, None, :] - verts_b[None, :, :], axis=2)
+            if dist.min(axis=1).max() > tol:
+                continue
+            index_map = _index_map(a, b, r, t, tol)
+            if index_map is not None:
+                return index_map
+    return None
+
+
+# Соответствие граней по центроидам и нормалям, рёбер — по серединам
+def _index_map(a: Mesh, b: Mesh, r: np.ndarray, t: np.ndarray, tol: float) -> IndexMap | None:
+    index_map: IndexMap = {}
+    centroids_b = np.array([_face_centroid(f) for f in b.faces])
+    normals_b = np.array([f.unit_normal for f in b.faces])
+    for f in a.faces:
+        c = r @ _face_centroid(f) + t
+        n = r @ f.unit_normal
+        hits = np.flatnonzero((np.linalg.norm(centroids_b - c, axis=1) <= tol) & (normals_b @ n > 0.99))
+        if len(hits) != 1:
+            return None
+        index_map[(MatchType.FACE, f.new_index)] = b.faces[hits[0]].new_index
+
+    edges_b = list({e.new_index: e for e in b.edges}.values())
+    mids_b = np.array([np.mean(e.vertices, axis=0) for e in edges_b])
+    for e in {e.new_index: e for e in a.edges}.values():
+        mid = r @ np.mean(e.vertices, axis=0) + t
+        hits = np.flatnonzero(np.linalg.norm(mids_b - mid, axis=1) <= tol)
+        if len(hits) != 1:
+            return None
+        index_map[(MatchType.EDGE, e.new_index)] = edges_b[hits[0]].new_index
+    return index_map
+
+
+# Перестановка конгруэнтных мешей вместе с перенумерацией их граней и рёбер; остальные меши на месте
+class Relabeling:
+    def __init__(self, mapping: Dict[str, str], index_maps: Dict[str, IndexMap]):
+        self.mapping = mapping                          # Меш -> меш, только сдвинутые
+        self.index_maps = index_maps                    # Сдвинутый меш -> перенумерация в его образе
+
+    def mesh(self, name: str) -> str:
+        return self.mapping.get(name, name)
+
+    def index(self, name: str, match_type: MatchType, index: int) -> int:
+        index_map = self.index_maps.get(name)
+        return index_map[(match_type, index)] if index_map is not None else index
+
+    # Образ совпадения в графе: совпадения хранятся в обе стороны, поэтому ищем прямо по мешам образа.
+    # coeff образа может отличаться: он зависит от порядка вершин грани
+    def match(self, match: GraphMatch, graph: MeshGraph) -> GraphMatch | None:
+        mesh1, mesh2 = self.mesh(match.mesh1), self.mesh(match.mesh2)
+        indices = (self.index(match.mesh1, match.match_type, match.indices[0]),
+                   self.index(match.mesh2, match.match_type, match.indices[1]))
+        for candidate in graph.connections.get(mesh1, {}).get(mesh2, []):
+            if candidate.match_type == match.match_type and candidate.indices == indices:
+                return candidate
+        return None
+
+
+# Классы конгруэнтных фрагментов: внутри класса меши взаимозаменяемы вместе с их гранями и рёбрами
+class CongruenceClasses:
+    def __init__(self, meshes: Dict[str, Mesh]):
+        self.classes: List[List[str]] = []
+        # Перенумерация из каждого меша класса в представителя (первый меш класса) и обратно
+        self._to_rep: Dict[str, IndexMap] = {}
+        self._from_rep: Dict[str, IndexMap] = {}
+
+        by_signature: Dict[str, List[str]] = {}
+        for name, mesh in meshes.items():
+            by_signature.setdefault(fragment_signature(mesh), []).append(name)
+
+        for names in by_signature.values():
+            remaining = sorted(names)
+            while len(remaining) > 1:
+                rep = remaining.pop(0)
+                members = [rep]
+                self._to_rep[rep] = self._from_rep[rep] = {}
+                for name in list(remaining):
+                    index_map = congruence_maps(meshes[name], meshes[rep])
+                    if index_map is None:
+                        continue
+                    members.append(name)
+                    remaining.remove(name)
+                    self._to_rep[name] = index_map
+                    self._from_rep[name] = {(t, j): i for (t, i), j in index_map.items()}
+                if len(members) > 1:
+                    self.classes.append(members)
+        log.info("Классов конгруэнтных фрагментов: %d, фрагментов в них: %d",
+                 len(self.classes), sum(len(c) for c in self.classes))
+
+    def __bool__(self) -> bool:
+        return bool(self.classes)
+
+    # Перенумерация a -> b через представителя класса
+    def _map(self, a: str, b: str) -> IndexMap:
+        to_rep, from_rep = self._to_rep[a], self._from_rep[b]
+        # У представителя карты пустые: его индексы и есть индексы класса
+        if not to_rep:
+            return dict(from_rep)
+        if not from_rep:
+            return dict(to_rep)
+        return {key: from_rep[(key[0], j)] for key, j in to_rep.items()}
+
+    def _relabeling(self, members: List[str], image: Tuple[str, ...]) -> Relabeling:
+        mapping = {a: b for a, b in zip(members, image) if a != b}
+        return Relabeling(mapping, {a: self._map(a, b) for a, b in mapping.items()})
+
+    # Перестановки для отсечения симметричных веток: внутри небольших классов все,
+    # в крупных — только транспозиции (отсечение остаётся корректным, но неполным)
+    def generators(self) -> List[Relabeling]:
+        result: List[Relabeling] = []
+        for members in self.classes:
+            if len(members) <= CONGRUENCE_FULL_GROUP_SIZE:
+                images = [p for p in itertools.permutations(members) if list(p) != members]
+            else:
+                images = []
+                for i, j in itertools.combinations(range(len(members)), 2):
+                    image = list(members)
+                    image[i], image[j] = image[j], image[i]
+                    images.append(tuple(image))
+            result.extend(self._relabeling(members, image) for image in images)
+        return result
+
+    # Все сети, получаемые из network перестановками конгруэнтных фрагментов (по требованию, лениво)
+    def images(self, network: Network, graph: MeshGraph) -> Iterator[Network]:
+        per_class = [list(itertools.permutations(members)) for members in self.classes]
+        seen = set()
+        for choice in itertools.product(*per_class):
+            mapping: Dict[str, str] = {}
+            index_maps: Dict[str, IndexMap] = {}
+            for members, image in zip(self.classes, choice):
+                relabeling = self._relabeling(members, image)
+                mapping.update(relabeling.mapping)
+                index_maps.update(relabeling.index_maps)
+            relabeling = Relabeling(mapping, index_maps)
+            matches = [relabeling.match(m, graph) for m in network.matches]
+            if any(m is None for m in matches):
+                continue
+            key = tuple((m.mesh1, m.mesh2, m.match_type, m.indices) for m in matches)
+            if key not in seen:
+                seen.add(key)
+                yield Network(matches=matches)
@@ -1,184 +1,343 @@
-﻿import math
-from typing import List, Tuple
+﻿import logging
+import math
+from typing import List, Tuple, Dict, Set, Iterator
+import numpy as np
 from geometry_connector import math_utils
 from geometry_connector.enums import MatchType
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.logger import get_logger
+from geometry_connector.match_table import MatchTable
+from geometry_connector.mesh_arrays import _normalize
 from geometry_connector.models import GraphMatch, Face, Edge, Mesh, MeshGraph
-from geometry_connector.constants import AREA_PENALTY, EDGE_PENALTY, NORMAL_PENALTY, MIN_MATCH_FACE_COEFF
-from mathutils import Vector, Matrix, Quaternion
-import bpy
+from geometry_connector.constants import AREA_PENALTY, EDGE_PENALTY, NORMAL_PENALTY, MIN_MATCH_FACE_COEFF, \
+    MIN_MATCH_EDGE_COEFF, LENGTH_BIN_COUNT
+from mathutils import Matrix, Quaternion
+
+log = get_logger("connect")
+
+
+# Рёбра меша (без повторов общих рёбер граней), отсортированные по длине, для поиска по диапазону
+class EdgeLengthIndex:
+    def __init__(self, mesh: Mesh):
+        edges: Dict[int, Edge] = {}
+        faces: Dict[int, List[int]] = {}
+        for f in mesh.faces:
+            for e in f.edges:
+                edges.setdefault(e.new_index, e)
+                faces.setdefault(e.new_index, []).append(f.new_index)
+
+        order = sorted(edges, key=lambda idx: edges[idx].length)
+        self.edges: List[Edge] = [edges[idx] for idx in order]
+        self.lengths = np.array([e.length for e in self.edges], dtype=np.float64)
+        # Грани ребра: вторая равна -1, если ребро граничное
+        self.face_a = np.array([faces[idx][0] for idx in order], dtype=np.int64)
+        self.face_b = np.array([faces[idx][1] if len(faces[idx]) > 1 else -1 for idx in order], dtype=np.int64)
+
+    # Ребро доступно, если хотя бы одна его грань не занята совпадением FACE
+    def available(self, used_faces: Set[int]) -> np.ndarray:
+        if not used_faces:
+            return np.ones(len(self.edges), dtype=bool)
+        used = np.fromiter(used_faces, dtype=np.int64)
+        return ~(np.isin(self.face_a, used) & ((self.face_b < 0) | np.isin(self.face_b, used)))
+
+    # Пары рёбер с разницей длин в пределах threshold: O(E log E) вместо перебора всех пар
+    def query(self, other: "EdgeLengthIndex", used_self: Set[int], used_other: Set[int],
+              threshold: float) -> List[Tuple[Edge, Edge, float]]:
+        mask1 = np.flatnonzero(self.available(used_self))
+        mask2 = np.flatnonzero(other.available(used_other))
+        if not len(mask1) or not len(mask2):
+            return []
+
+        lengths1 = self.lengths[mask1]
+        lengths2 = other.lengths[mask2]
+        lo = np.searchsorted(lengths2, lengths1 - threshold, side='left')
+        hi = np.searchsorted(lengths2, lengths1 + threshold, side='right')
+        counts = hi - lo
+        if not counts.any():
+            return []
+
+        rows = np.repeat(np.arange(len(mask1)), counts)
+        cols = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+        l1, l2 = lengths1[rows], lengths2[cols]
+        max_len = np.maximum(np.maximum(l1, l2), 1e-12)
+        coeffs = 1.0 - np.abs(l1 - l2) / max_len
+        keep = coeffs >= MIN_MATCH_EDGE_COEFF
+
+        return [(self.edges[mask1[r]], other.edges[mask2[c]], float(k))
+                for r, c, k in zip(rows[keep].tolist(), cols[keep].tolist(), coeffs[keep].tolist())]
+
+
+# Занятые интервалы длин рёбер меша и каждой его грани, битами int.
+# Ширина интервала не меньше порога длины, поэтому рёбра, прошедшие compare_values, лежат в одном
+# или соседних интервалах. Грань без единого такого ребра не наберёт MIN_MATCH_FACE_COEFF
+# (даже при совпавших площади и числе рёбер штраф за рёбра без пары не меньше EDGE_PENALTY)
+# и не даст трёх совпавших рёбер для проверки нормалей — такие пары граней и мешей пропускаются целиком
+class EdgeLengthBins:
+    def __init__(self, mesh: Mesh, width: float):
+        self.faces: List[int] = [_length_bits([e.length for e in f.edges], width) for f in mesh.faces]
+        self.mesh = 0
+        for bits in self.faces:
+            self.mesh |= bits
+
+    # Интервалы, в которые может попасть ребро другого меша, совпадающее с ребром из bits
+    @staticmethod
+    def reach(bits: int) -> int:
+        return bits | bits << 1 | bits >> 1
+
+
+# Ширина интервала: не меньше порога (с запасом на округление) и не больше LENGTH_BIN_COUNT интервалов на все длины
+def length_bin_width(meshes: List[Mesh], threshold: float) -> float:
+    max_length = max((e.length for m in meshes for f in m.faces for e in f.edges), default=0.0)
+    return max(threshold * 1.01, max_length / LENGTH_BIN_COUNT, 1e-12)
+
+
+def _length_bits(lengths: List[float], width: float) -> int:
+    bits = 0
+    for length in lengths:
+        bits |= 1 << int(length / width)
+    return bits
 
 
 class GeometryConnector:
-    def __init__(self):
-        scene = bpy.context.scene
+    # Пороги берутся из сцены Blender, если не заданы явно (bpy-free запуски передают их напрямую)
+    def __init__(self, connected_edge_angle_threshold: float | None = None, area_threshold: float | None = None,
+                 edge_length_threshold: float | None = None, use_match_table: bool | None = None):
+        if None in (connected_edge_angle_threshold, area_threshold, edge_length_threshold, use_match_table):
+            import bpy
+            scene = bpy.context.scene
+            if connected_edge_angle_threshold is None:
+                connected_edge_angle_threshold = scene.connected_edge_angle_threshold
+            if area_threshold is None:
+                area_threshold = scene.face_area_threshold
+            if edge_length_threshold is None:
+                edge_length_threshold = scene.edge_length_threshold
+            if use_match_table is None:
+                use_match_table = scene.use_match_table
 
-        self.connected_edge_angle_threshold = scene.connected_edge_angle_threshold
-        self.area_threshold = scene.face_area_threshold
-        self.edge_length_threshold = scene.edge_length_threshold
+        self.connected_edge_angle_threshold = connected_edge_angle_threshold
+        self.area_threshold = area_threshold
+        self.edge_length_threshold = edge_length_threshold
+        self.use_match_table = use_match_table
 
     # Построение графа совпадений обломков
-    def build_mesh_graph(self, pieces_meshes: List[Mesh]) -> MeshGraph:
-        pieces_graph = MeshGraph()
+    @instrumented("build_mesh_graph")
+    def build_mesh_graph(self, pieces_meshes: List[Mesh], use_match_table: bool | None = None) -> MeshGraph:
+        if use_match_table is None:
+            use_match_table = self.use_match_table
+        pieces_graph = MeshGraph(store=MatchTable(pieces_meshes) if use_match_table else None)
+        # Грани, уже совпавшие по FACE, для каждой пары мешей: (грани m1, грани m2)
+        face_matched: Dict[Tuple[str, str], Tuple[Set[int], Set[int]]] = {}
+        # Пары мешей с FACE-совпадением, прошедшим проверку нормалей (с вращением)
+        face_posed: Set[Tuple[str, str]] = set()
+        pairs_considered = 0
+        matches_emitted = 0
+        mesh_pairs_skipped = 0
+        faces_skipped = 0
 
         # region Поиск совпадений по граням
 
+        # Предфильтр точен, пока грань без совпавших по длине рёбер не может пройти по коэффициенту
+        prefilter = 1.0 - EDGE_PENALTY < MIN_MATCH_FACE_COEFF
+        width = length_bin_width(pieces_meshes, self.edge_length_threshold)
+        length_bins = [EdgeLengthBins(m, width) for m in pieces_meshes]
         for i, m1 in enumerate(pieces_meshes):
-            for m2 in pieces_meshes[i + 1:]:
-                for f1 in m1.faces:
+            bins1 = length_bins[i]
+            reach1 = EdgeLengthBins.reach(bins1.mesh)
+            for j, m2 in enumerate(pieces_meshes[i + 1:], i + 1):
+                bins2 = length_bins[j].mesh
+                # Ни одно ребро m1 не совпадает по длине с рёбрами m2: совпадений FACE у пары быть не может
+                if prefilter and not reach1 & bins2:
+                    mesh_pairs_skipped += 1
+                    continue
+
+                candidates: List[Tuple[Face, Face, List[Tuple[Edge, Edge]], float]] = []
+                for f1, face_bits in zip(m1.faces, bins1.faces):
+                    if prefilter and not EdgeLengthBins.reach(face_bits) & bins2:
+                        faces_skipped += 1
+                        continue
                     a1 = f1.area
                     edges1 = f1.edges
                     n1 = len(edges1)
 
+                    pairs_considered += len(m2.faces)
                     for f2 in m2.faces:
-                        coeff = 1.0
-
-                        # Сравнение площадей
-                        if not math_utils.compare_values(a1, f2.area, self.area_threshold):
-                            coeff -= AREA_PENALTY
-
-                        # Подготовка рёбер
-                        edges2 = f2.edges
-                        n2 = len(edges2)
-                        n_max = max(n1, n2)
-                        if n1 != n2:
-                            coeff -= (n_max - min(n1, n2)) / n_max * EDGE_PENALTY
-
-                        # Сопоставление рёбер
-                        matched_edges = []
-                        used = set()
-                        for e1 in edges1:
-                            found = False
-                            for e2 in edges2:
-                                if e2.new_index in used:
-                                    continue
-                                if math_utils.compare_values(e1.length, e2.length, self.edge_length_threshold):
-                                    used.add(e2.new_index)
-                                    if n1 <= n2:
-                                        matched_edges.append((e1, e2))
-                                    else:
-                                        matched_edges.append((e2, e1))
-                                    found = True
-                                    break
-                            if not found:
-                                coeff -= EDGE_PENALTY / n_max
-
-                        rotation = None
-                        # Сравнение нормалей, если есть достаточно рёбер
-                        if len(matched_edges) > 2:
-                            ok, rotation = self._compare_normals(f1, f2, matched_edges)
-
-                            if not ok:
-                                coeff -= NORMAL_PENALTY
-                            elif coeff < MIN_MATCH_FACE_COEFF:
-                                coeff = MIN_MATCH_FACE_COEFF
-
-                        # Добавляем совпадение, если коэффициент удовлетворён
-                        if coeff >= MIN_MATCH_FACE_COEFF:
-                            pieces_graph.add_match(GraphMatch(
-                                mesh1=m1.name,
-                                mesh2=m2.name,
-                                match_type=MatchType.FACE,
-                                indices=(f1.new_index, f2.new_index),
-                                coeff=coeff,
-                                edges=matched_edges,
-                                rotation=rotation
-                            ))
+                        # Сопоставление рёбер и коэффициент по площади и рёбрам
+                        matched_edges, missing = match_face_edges(edges1, f2.edges, self.edge_length_threshold)
+                        coeff = face_pair_coeff(math_utils.compare_values(a1, f2.area, self.area_threshold),
+                                                n1, len(f2.edges), missing)
+
+                        # Нормали сравниваются, если есть достаточно рёбер, — пакетом после перебора пары мешей
+                        if len(matched_edges) > 2 or coeff >= MIN_MATCH_FACE_COEFF:
+                            candidates.append((f1, f2, matched_edges, coeff))
+
+                checks = self._compare_normals([c for c in candidates if len(c[2]) > 2])
+                for f1, f2, matched_edges, coeff in candidates:
+                    rotation = None
+                    if len(matched_edges) > 2:
+                        ok, rotation = next(checks)
+
+                        if not ok:
+                            coeff -= NORMAL_PENALTY
+                        elif coeff < MIN_MATCH_FACE_COEFF:
+                            coeff = MIN_MATCH_FACE_COEFF
+
+                    # Добавляем совпадение, если коэффициент удовлетворён
+                    if coeff >= MIN_MATCH_FACE_COEFF:
+                        matches_emitted += 1
+                        used1, used2 = face_matched.setdefault((m1.name, m2.name), (set(), set()))
+                        used1.add(f1.new_index)
+                        used2.add(f2.new_index)
+                        if rotation is not None:
+                            face_posed.add((m1.name, m2.name))
+                        pieces_graph.add_match(GraphMatch(
+                            mesh1=m1.name,
+                            mesh2=m2.name,
+                            match_type=MatchType.FACE,
+                            indices=(f1.new_index, f2.new_index),
+                            coeff=coeff,
+                            edges=matched_edges,
+                            rotation=rotation
+                        ))
+
+        instrumentation.count("build_mesh_graph", "face_pairs_considered", pairs_considered)
+        instrumentation.count("build_mesh_graph", "face_pairs_pruned", pairs_considered - matches_emitted)
+        instrumentation.count("build_mesh_graph", "matches_emitted", matches_emitted)
+        instrumentation.count("build_mesh_graph", "mesh_pairs_skipped", mesh_pairs_skipped)
+        instrumentation.count("build_mesh_graph", "faces_skipped", faces_skipped)
 
         # endregion
 
         # region Поиск совпадений по рёбрам
 
-        # for i, m1 in enumerate(pieces_meshes):
-        #     for m2 in pieces_meshes[i + 1:]:
-        #         min_coeff = MIN_MATCH_FACE_COEFF
-        #         # Исключаем рёбра, у которых грани уже совпали по FACE
-        #         existing = pieces_graph.adj.get(m1.name, {}).get(m2.name, [])
-        #         used_face_idxs = {
-        #             match.indices[0]
-        #             for match in existing
-        #             if match.match_type == MatchType.FACE
-        #         }
-        #
-        #         edges1 = [e for f in m1.faces if f.new_index not in used_face_idxs for e in f.edges]
-        #         edges2 = [e for f in m2.faces if f.new_index not in used_face_idxs for e in f.edges]
-        #
-        #         for e1 in edges1:
-        #             for e2 in edges2:
-        #                 max_len = max(e1.length, e2.length)
-        #                 coeff = 1 - abs(e1.length / max_len - e2.length / max_len)
-        #                 if coeff >= min_coeff:
-        #                     pieces_graph.add_match(GraphMatch(
-        #                         mesh1=m1.name,
-        #                         mesh2=m2.name,
-        #                         match_type=MatchType.EDGE,
-        #                         indices=(e1.new_index, e2.new_index),
-        #                         coeff=coeff
-        #                     ))
-        #                     min_coeff = coeff
+        # Пара мешей с проверенным FACE-совпадением рёбрами не сопоставляется: сеть берёт одно совпадение
+        # на пару, и поза по грани уже задана полностью, а EDGE лишь множил бы варианты. На разбиениях
+        # Вороного все рёбра, сходящиеся в истинной сборке, приходятся на такие пары
+        length_indexes = {m.name: EdgeLengthIndex(m) for m in pieces_meshes}
+        edge_matches = 0
+        edge_pairs_skipped = 0
+        for i, m1 in enumerate(pieces_meshes):
+            for m2 in pieces_meshes[i + 1:]:
+                if (m1.name, m2.name) in face_posed:
+                    edge_pairs_skipped += 1
+                    continue
+                # Исключаем рёбра, у которых грани уже совпали по FACE
+                used1, used2 = face_matched.get((m1.name, m2.name), (set(), set()))
+
+                for e1, e2, coeff in length_indexes[m1.name].query(length_indexes[m2.name], used1, used2,
+                                                                   self.edge_length_threshold):
+                    edge_matches += 1
+                    pieces_graph.add_match(GraphMatch(
+                        mesh1=m1.name,
+                        mesh2=m2.name,
+                        match_type=MatchType.EDGE,
+                        indices=(e1.new_index, e2.new_index),
+                        coeff=coeff
+                    ))
+
+        instrumentation.count("build_mesh_graph", "edge_matches_emitted", edge_matches)
+        instrumentation.count("build_mesh_graph", "edge_pairs_skipped", edge_pairs_skipped)
 
         # endregion
 
         return pieces_graph
 
 
-    # Сравнение нормалей граней с учётом выравнивания совпавших рёбер
-    def _compare_normals(self, f1: Face, f2: Face, matching_edges: List[Tuple[Edge, Edge]]) -> Tuple[bool, Quaternion | None]:
-        # Порог и его косинус
+    # Сравнение нормалей граней с учётом выравнивания совпавших рёбер, сразу для всех кандидатов пары мешей
+    def _compare_normals(self, candidates: List[Tuple[Face, Face, List[Tuple[Edge, Edge]], float]]) \
+            -> Iterator[Tuple[bool, Quaternion | None]]:
+        if not candidates:
+            return iter(())
         cos_th = math.cos(self.connected_edge_angle_threshold)
+        r, valid, edge_dots, normal_dots = rotation_checks(candidates)
+        ok = valid & (edge_dots >= cos_th) & (normal_dots > cos_th)
+
+        if log.isEnabledFor(logging.DEBUG):
+            for p in np.flatnonzero(ok).tolist():
+                log.debug("[compare_normals] %s ↔ %s: dot = %s, thr = %s",
+                          candidates[p][0].new_index, candidates[p][1].new_index, normal_dots[p], cos_th)
+
+        return ((True, Matrix(r[p].tolist()).to_quaternion()) if ok[p] else (False, None)
+                for p in range(len(candidates)))
+
+
+# Жадное сопоставление рёбер двух граней по длине: (пары рёбер, число рёбер первой грани без пары).
+# В парах первым идёт ребро грани с меньшим числом рёбер
+def match_face_edges(edges1: List[Edge], edges2: List[Edge], threshold: float) -> Tuple[List[Tuple[Edge, Edge]], int]:
+    n1, n2 = len(edges1), len(edges2)
+    matched_edges = []
+    missing = 0
+    used = set()
+    for e1 in edges1:
+        found = False
+        for e2 in edges2:
+            if e2.new_index in used:
+                continue
+            if math_utils.compare_values(e1.length, e2.length, threshold):
+                used.add(e2.new_index)
+                if n1 <= n2:
+                    matched_edges.append((e1, e2))
+                else:
+                    matched_edges.append((e2, e1))
+                found = True
+                break
+        if not found:
+            missing += 1
+    return matched_edges, missing
+
+
+# Коэффициент пары граней до проверки нормалей (штрафы вычитаются в том же порядке, что и раньше в цикле)
+def face_pair_coeff(area_matched: bool, n1: int, n2: int, missing: int) -> float:
+    coeff = 1.0
+
+    # Сравнение площадей
+    if not area_matched:
+        coeff -= AREA_PENALTY
+
+    # Разное число рёбер
+    n_max = max(n1, n2)
+    if n1 != n2:
+        coeff -= (n_max - min(n1, n2)) / n_max * EDGE_PENALTY
+
+    # Рёбра без пары
+    for _ in range(missing):
+        coeff -= EDGE_PENALTY / n_max
+    return coeff
+
+
+# Не зависящая от порога часть проверки нормалей для пакета пар граней (у каждой больше двух совпавших рёбер).
+# Для каждой пары строится вращение по первой паре рёбер; возвращаются вращения, признак невырожденного базиса,
+# минимальный по рёбрам косинус после вращения и косинус между повёрнутой нормалью и обратной нормалью
+def rotation_checks(candidates) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    n_pairs = len(candidates)
+
+    # Направляющие векторы рёбер всех пар подряд и номер пары для каждого
+    counts = np.array([len(c[2]) for c in candidates])
+    owner = np.repeat(np.arange(n_pairs), counts)
+    first = np.cumsum(counts) - counts
+    d1 = np.array([e1.direction for c in candidates for e1, _ in c[2]])
+    d2 = np.array([e2.direction for c in candidates for _, e2 in c[2]])
+    # Вторые направления ориентируем по первым
+    d2 = d2 * np.where(np.einsum("ij,ij->i", d1, d2) >= 0.0, 1.0, -1.0)[:, None]
+
+    # Нормали граней
+    n1 = np.array([c[0].unit_normal for c in candidates])
+    n2 = np.array([c[1].unit_normal for c in candidates])
+
+    # Базисы по первой паре рёбер: столбцы (x, y, z)
+    x1, z1 = d1[first], -n1
+    x2, z2 = d2[first], n2
+    m1 = np.stack((x1, _normalize(np.cross(z1, x1)), z1), axis=2)
+    m2 = np.stack((x2, _normalize(np.cross(z2, x2)), z2), axis=2)
+
+    # Вырожденные базисы (нулевое ребро или ребро вдоль нормали) не проверяем
+    valid = np.abs(np.linalg.det(m2)) > 1e-9
+    r = np.zeros((n_pairs, 3, 3))
+    r[valid] = m1[valid] @ np.linalg.inv(m2[valid])
+
+    # Все рёбра после вращения должны совпасть по направлению
+    edge_dots = np.einsum("ij,ij->i", d1, np.einsum("nij,nj->ni", r[owner], d2))
+    min_edge_dots = np.minimum.reduceat(edge_dots, first)
 
-        # Собираем направляющие векторы по рёбрам
-        v1_list: List[Vector] = []
-        v2_list: List[Vector] = []
-        for e1, e2 in matching_edges:
-            p1a, p1b = map(Vector, e1.vertices)
-            p2a, p2b = map(Vector, e2.vertices)
-            v1_list.append((p1b - p1a).normalized())
-            v2_list.append((p2b - p2a).normalized())
-
-        if not v1_list:
-            return False, None
-
-        # Ориентируем первую пару
-        v1_ref = v1_list[0]
-        raw_v2_ref = v2_list[0]
-        sign_ref = 1.0 if v1_ref.dot(raw_v2_ref) >= 0.0 else -1.0
-        v2_ref = (raw_v2_ref * sign_ref).normalized()
-
-        # Нормали граней
-        n1 = f1.normal.normalized()
-        n2 = f2.normal.normalized()
-
-        # Сбор базисов и матриц
-        x1, z1 = v1_ref, -n1
-        y1 = z1.cross(x1).normalized()
-        M1 = Matrix((x1, y1, z1)).transposed()
-
-        x2, z2 = v2_ref, n2
-        y2 = z2.cross(x2).normalized()
-        M2 = Matrix((x2, y2, z2)).transposed()
-
-        # Инверсия M2
-        try:
-            M2_inv = M2.inverted()
-        except Exception:
-            return False
-
-        # Матрица вращения
-        r = M1 @ M2_inv
-        q = r.to_quaternion()
-
-        # Проверяем все остальные рёбра через скалярное произведение
-        for v1_i, raw_v2_i in zip(v1_list, v2_list):
-            sign_i = 1.0 if v1_i.dot(raw_v2_i) >= 0.0 else -1.0
-            v2o = (raw_v2_i * sign_i).normalized()
-            v2_rot = r @ v2o
-            if v1_i.dot(v2_rot) < cos_th:
-                return False, None
-
-        # Финальная проверка нормалей граней
-        n2_rot = r @ n2
-        if n2_rot.dot(-n1) > cos_th:
-            print(f"[compare_normals] Нормаль локальная: {n2_rot}, нормаль соседа: {-n1}, dot = {n2_rot.dot(-n1)}, thr = {cos_th}")
-            return True, q
-
-        return False, None
\ No newline at end of file
+    # Финальная проверка нормалей граней
+    normal_dots = np.einsum("ij,ij->i", np.einsum("nij,nj->ni", r, n2), -n1)
+    return r, valid, min_edge_dots, normal_dots
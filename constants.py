@@ -5,12 +5,22 @@ import os
 BASE_DIR = os.path.dirname(__file__)
 JSON_FILENAME = "geometry.json"
 JSON_PATH = os.path.join(BASE_DIR, "data", JSON_FILENAME)
+REPORT_FILENAME = "report.json"                         # Отчёт инструментирования рядом с geometry.json
+REPORT_PATH = os.path.join(BASE_DIR, "data", REPORT_FILENAME)
+CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")     # Кэш графов совпадений (и других результатов расчёта)
+GRAPH_CACHE_VERSION = 3                                 # Увеличивается при изменении сопоставления или формата таблицы
+GRAPH_CACHE_MAX_FILES = 32                              # Графов в кэше; сверх этого удаляются давно не читанные
+VARIANT_STORE_VERSION = 6                               # Увеличивается при изменении перебора сетей или сборки
+WORKER_ADDRESS = ("127.0.0.1", 47613)                   # Локальный сервис пакетной сборки
+WORKER_KEY_PATH = os.path.join(CACHE_DIR, "worker.key")  # Ключ авторизации клиентов сервиса
+REPLAY_BASELINE_PATH = os.path.join(BASE_DIR, "data", "replay_baseline.json")  # Эталон прогона geometry.json
 
 # # Константы
 BATCH_SIZE = 100
 
 MIN_MATCH_FACE_COEFF = 0.6                              # Минимальный итоговый коэффициент
 MIN_MATCH_EDGE_COEFF = 0.999                            # Минимальный итоговый коэффициент
+LENGTH_BIN_COUNT = 4096                                 # Наибольшее число интервалов длин рёбер в предфильтре пар
 ORIG_INDICES = "orig_indices"                           # Метка для int слоя граней и рёбер
 ORIG_INDEX = "orig_index"                               # Метка для str слоя граней
 
@@ -21,4 +31,30 @@ NORMAL_PENALTY = 0.1                                    # Штраф за нес
 COMPARE_OTHER_MATCHES_PENALTY = 0.1                     # Штраф за несовпадение по другим соединениям
 
 NORMAL_ANGLE_THRESHOLD = math.radians(2)
-MAX_DISTANCE_BETWEEN_MESHES = 0.01                     # Штраф за несовпадение по другим соединениям
\ No newline at end of file
+MAX_DISTANCE_BETWEEN_MESHES = 0.01                     # Штраф за несовпадение по другим соединениям
+LOOP_CLOSURE_ANGLE_THRESHOLD = math.radians(5)          # Допустимое расхождение поворота меша при замыкании цикла
+LOOP_CLOSURE_DISTANCE_RATIO = 0.1                       # Допустимый сдвиг меша при замыкании цикла, доля радиуса
+POSE_OVERLAP_RATIO = 0.25                               # Центроиды ближе этой доли меньшего радиуса: меши на одном месте
+POSE_HINGE_CACHE_SIZE = 100_000                         # Записей в кэше проверок шарниров PoseConsistency до сброса
+REPLAY_REGRESSION_PERCENT = 20.0                        # Допустимый рост времени или памяти стадии относительно эталона
+REPLAY_MIN_REGRESSION_SECONDS = 0.005                   # Более короткие стадии не проверяются по времени (шум)
+REPLAY_MATRIX_DECIMALS = 6                              # Округление матриц сборки при сравнении с эталоном
+SCENE_MATRIX_TOLERANCE = 1e-6                           # Объект не переписывается, если его матрица меняется меньше
+RANK_MAX_GAP_WEIGHT = 0.5                               # Вес наибольшего зазора в оценке варианта (к среднему зазору)
+RANK_AREA_WEIGHT = 0.1                                  # Вес разницы площадей прилегающих граней в оценке варианта
+RANK_OVERLAP_PENALTY = 1.0                              # Штраф оценки за каждую пару мешей на одном месте
+CONGRUENCE_DECIMALS = 4                                 # Округление площадей и длин в подписи фрагмента
+CONGRUENCE_TOLERANCE = 1e-4                             # Допуск совпадения вершин конгруэнтных фрагментов, доля размера
+CONGRUENCE_FULL_GROUP_SIZE = 4                          # До такого размера класса перебираются все перестановки
+NETWORK_INDEX_MAX_STATES = 200_000                      # Предел запомненных поддеревьев NetworkIndex, дальше — хранилище
+
+# Значения порогов по умолчанию (используются панелью и bpy-free запусками)
+DEFAULT_COPLANAR_ANGLE_THRESHOLD = math.radians(1)      # Угол, до которого грани считаются компланарными
+DEFAULT_COPLANAR_DISTANCE_THRESHOLD = 0.0001            # Дистанция, до которой грани считаются компланарными
+DEFAULT_CURVATURE_THRESHOLD = 0.01                      # Величина отклонения кривизны
+DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD = math.radians(1)  # Допустимый угол между совпавшими рёбрами
+DEFAULT_FACE_AREA_THRESHOLD = 0.00001                   # Допустимая разница площадей граней для совпадения
+DEFAULT_EDGE_LENGTH_THRESHOLD = 0.00130                 # Допустимая разница длин рёбер
+DEFAULT_BEAM_WIDTH = 64                                 # Сколько частичных сетей хранит лучевой поиск
+DEFAULT_BEAM_TIME_LIMIT = 5.0                           # Ограничение лучевого поиска по времени, секунды
+DEFAULT_RANK_TOP_N = 20                                 # Сколько первых вариантов собирается и оценивается при ранжировании
\ No newline at end of file
@@ -1,22 +1,41 @@
 import bpy
-import bmesh
 import time
+import numpy as np
+from typing import Dict, List
+from bpy.props import EnumProperty
+from geometry_connector.enums import MatchType
+from geometry_connector.logger import get_logger
 
+log = get_logger("ui")
+
+
+# Подсветка меняет material_index только у затронутых полигонов: исходные индексы снимаются
+# один раз через foreach_get, на каждом шаге сбрасываются и подсвечиваются лишь несколько граней,
+# bmesh и полная перезапись меша не нужны
 class ModalFaceHighlighter(bpy.types.Operator):
     bl_idname = "object.highlight_faces"
     bl_label = "Highlight Faces One by One (Accurate Time)"
     bl_options = {'REGISTER'}
 
+    mode: EnumProperty(
+        name="Mode",
+        items=[
+            ('FACES', "All Faces", "Every face of the first visible mesh"),
+            ('MATCHES', "Matched Pairs", "Face pairs of FACE matches in the last resolved match graph"),
+        ],
+        default='FACES'
+    )
+
     _timer = None
-    _obj = None
-    _bm = None
-    _face_indices = []
-    _original_indices = {}
+    _objects: Dict[str, bpy.types.Object] = {}
+    _original_indices: Dict[str, np.ndarray] = {}       # Имя объекта -> исходные material_index полигонов
+    _highlight_mat_indices: Dict[str, int] = {}
+    _appended_slots: List[str] = []                     # Объекты, которым слот материала добавлен этим запуском
+    _steps: List[Dict[str, List[int]]] = []             # Шаг: имя объекта -> индексы подсвечиваемых полигонов
     _current_index = 0
-    _highlight_mat_index = -1
     _highlight_mat_name = "Highlight_Mat"
     _created_material = False
-    _prev_face_index = None
+    _prev_step: Dict[str, List[int]] | None = None
     _last_change_time = 0.0
     _interval = 10.0  # В секундах
 
@@ -24,30 +43,29 @@ class ModalFaceHighlighter(bpy.types.Operator):
         if event.type == 'TIMER':
             now = time.perf_counter()
 
-            if self._current_index >= len(self._face_indices):
+            if self._current_index >= len(self._steps):
                 self.restore_materials()
                 self.finish(context)
-                print("Завершено.")
+                log.info("Завершено.")
                 return {'FINISHED'}
 
             if now - self._last_change_time >= self._interval:
-                self._bm.faces.ensure_lookup_table()
+                # Сброс предыдущих граней
+                if self._prev_step is not None:
+                    for name, indices in self._prev_step.items():
+                        original = self._original_indices[name]
+                        self._set_material_indices(name, indices, [int(original[i]) for i in indices])
 
-                # Сброс предыдущей грани
-                if self._prev_face_index is not None:
-                    prev_face = self._bm.faces[self._prev_face_index]
-                    prev_face.material_index = self._original_indices.get(prev_face.index, 0)
+                # Подсветка текущих граней
+                step = self._steps[self._current_index]
+                for name, indices in step.items():
+                    self._set_material_indices(name, indices, [self._highlight_mat_indices[name]] * len(indices))
+                self._prev_step = step
 
-                # Подсветка текущей грани
-                face_index = self._face_indices[self._current_index]
-                face = self._bm.faces[face_index]
-                self._prev_face_index = face.index
-                face.material_index = self._highlight_mat_index
+                log.debug("Подсвечиваются грани: %s", step)
 
-                print(f"Подсвечивается грань: {face.index}")
-
-                self._bm.to_mesh(self._obj.data)
-                self._obj.data.update()
+                if context.area:
+                    context.area.tag_redraw()
 
                 self._current_index += 1
                 self._last_change_time = now
@@ -55,13 +73,24 @@ class ModalFaceHighlighter(bpy.types.Operator):
         return {'PASS_THROUGH'}
 
     def execute(self, context):
-        self._obj = self.find_first_visible_mesh()
-        if not self._obj:
-            self.report({'WARNING'}, "Нет видимого mesh-объекта")
-            return {'CANCELLED'}
+        if self.mode == 'MATCHES':
+            self._steps = self._match_steps()
+            if not self._steps:
+                self.report({'WARNING'}, "Нет FACE-совпадений: сначала выполните Connect Fragments")
+                return {'CANCELLED'}
+        else:
+            obj = self.find_first_visible_mesh()
+            if not obj:
+                self.report({'WARNING'}, "Нет видимого mesh-объекта")
+                return {'CANCELLED'}
+            self._steps = [{obj.name: [i]} for i in range(len(obj.data.polygons))]
 
+        bpy.ops.object.mode_set(mode='OBJECT')
+        self._objects = {name: bpy.data.objects[name] for step in self._steps for name in step}
         self._prepare_materials()
-        self._prepare_bmesh()
+        self._snapshot_materials()
+        self._current_index = 0
+        self._prev_step = None
 
         self._last_change_time = time.perf_counter()
 
@@ -71,14 +100,13 @@ class ModalFaceHighlighter(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
     def finish(self, context):
-        if self._bm:
-            self._bm.free()
         context.window_manager.event_timer_remove(self._timer)
 
+        for name in self._appended_slots:
+            self._objects[name].data.materials.pop(index=self._highlight_mat_indices[name])
         if self._created_material:
             mat = bpy.data.materials.get(self._highlight_mat_name)
             if mat:
-                self._obj.data.materials.pop(index=self._highlight_mat_index)
                 bpy.data.materials.remove(mat)
 
     def find_first_visible_mesh(self):
@@ -87,10 +115,29 @@ class ModalFaceHighlighter(bpy.types.Operator):
                 return obj
         return None
 
-    def _prepare_materials(self):
-        if len(self._obj.data.materials) == 0:
-            self._obj.data.materials.append(None)
+    # Шаги по парам граней FACE-совпадений последнего графа: подсвечиваются исходные полигоны обеих граней.
+    # ui_panel импортируется здесь: он сам регистрирует этот оператор
+    def _match_steps(self) -> List[Dict[str, List[int]]]:
+        from geometry_connector.ui_panel import resolved_match_graph
+        graph, meshes = resolved_match_graph()
+        if graph is None or meshes is None:
+            return []
+
+        steps: List[Dict[str, List[int]]] = []
+        for m1, nbrs in graph.connections.items():
+            for m2, matches in nbrs.items():
+                if m1 >= m2 or m1 not in bpy.data.objects or m2 not in bpy.data.objects:
+                    continue
+                for match in matches:
+                    if match.match_type != MatchType.FACE:
+                        continue
+                    steps.append({
+                        m1: list(meshes[m1].face(match.indices[0]).orig_indices),
+                        m2: list(meshes[m2].face(match.indices[1]).orig_indices),
+                    })
+        return steps
 
+    def _prepare_materials(self):
         mat = bpy.data.materials.get(self._highlight_mat_name)
         if not mat:
             mat = bpy.data.materials.new(name=self._highlight_mat_name)
@@ -99,34 +146,37 @@ class ModalFaceHighlighter(bpy.types.Operator):
         else:
             self._created_material = False
 
-        if mat.name not in [m.name for m in self._obj.data.materials]:
-            self._obj.data.materials.append(mat)
-
-        self._highlight_mat_index = self._obj.data.materials.find(mat.name)
-
-    def _prepare_bmesh(self):
-        bpy.ops.object.mode_set(mode='OBJECT')
-        me = self._obj.data
-        self._bm = bmesh.new()
-        self._bm.from_mesh(me)
-        self._bm.faces.ensure_lookup_table()
-
-        self._face_indices = [f.index for f in self._bm.faces]
-        self._original_indices = {f.index: f.material_index for f in self._bm.faces}
-        self._current_index = 0
-        self._prev_face_index = None
-
+        self._highlight_mat_indices = {}
+        self._appended_slots = []
+        for name, obj in self._objects.items():
+            if len(obj.data.materials) == 0:
+                obj.data.materials.append(None)
+            if mat.name not in [m.name for m in obj.data.materials if m]:
+                obj.data.materials.append(mat)
+                self._appended_slots.append(name)
+            self._highlight_mat_indices[name] = obj.data.materials.find(mat.name)
+
+    def _snapshot_materials(self):
+        self._original_indices = {}
+        for name, obj in self._objects.items():
+            polygons = obj.data.polygons
+            original = np.empty(len(polygons), dtype=np.int32)
+            polygons.foreach_get("material_index", original)
+            self._original_indices[name] = original
+
+    # Точечная запись: O(число граней шага), меш только помечается для обновления
+    def _set_material_indices(self, name: str, indices: List[int], values: List[int]):
+        me = self._objects[name].data
+        polygons = me.polygons
+        for i, value in zip(indices, values):
+            polygons[i].material_index = value
+        me.update_tag()
+
+    # Одна запись всего массива в конце, без bmesh
     def restore_materials(self):
-        self._bm = bmesh.new()
-        self._bm.from_mesh(self._obj.data)
-        self._bm.faces.ensure_lookup_table()
-
-        for face in self._bm.faces:
-            face.material_index = self._original_indices.get(face.index, 0)
-
-        self._bm.to_mesh(self._obj.data)
-        self._obj.data.update()
-        self._bm.free()
+        for name, obj in self._objects.items():
+            obj.data.polygons.foreach_set("material_index", self._original_indices[name])
+            obj.data.update()
 
 def register():
     bpy.utils.register_class(ModalFaceHighlighter)
@@ -0,0 +1,122 @@
+import hashlib
+import os
+from typing import List
+import numpy as np
+from geometry_connector.constants import CACHE_DIR, GRAPH_CACHE_VERSION, GRAPH_CACHE_MAX_FILES, MIN_MATCH_FACE_COEFF, \
+    MIN_MATCH_EDGE_COEFF, AREA_PENALTY, EDGE_PENALTY, NORMAL_PENALTY
+from geometry_connector.instrumentation import instrumentation
+from geometry_connector.logger import get_logger
+from geometry_connector.match_table import MatchTable
+from geometry_connector.models import Mesh, MeshGraph
+
+log = get_logger("connect")
+
+
+# Хеш геометрии фрагмента в локальных координатах: всё, от чего зависит сопоставление (matrix_world не входит)
+def fragment_hash(mesh: Mesh) -> str:
+    values: List[float] = []
+    for f in mesh.faces:
+        values.extend((f.new_index, f.area, f.face_type, len(f.edges), *f.normal))
+        for v in f.vertices:
+            values.extend(v)
+        for e in f.edges:
+            values.extend((e.new_index, e.length, *e.vertices[0], *e.vertices[1]))
+    return hashlib.blake2b(np.array(values, dtype=np.float64).tobytes(), digest_size=16).hexdigest()
+
+
+# Ключ графа: имена и хеши фрагментов в порядке перебора, пороги коннектора и константы штрафов
+def graph_key(meshes: List[Mesh], connected_edge_angle_threshold: float, area_threshold: float,
+              edge_length_threshold: float) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((GRAPH_CACHE_VERSION, connected_edge_angle_threshold, area_threshold, edge_length_threshold,
+                   MIN_MATCH_FACE_COEFF, MIN_MATCH_EDGE_COEFF, AREA_PENALTY, EDGE_PENALTY,
+                   NORMAL_PENALTY)).encode())
+    for m in meshes:
+        h.update(m.name.encode())
+        h.update(fragment_hash(m).encode())
+    return h.hexdigest()
+
+
+def connector_graph_key(connector, meshes: List[Mesh]) -> str:
+    return graph_key(meshes, connector.connected_edge_angle_threshold, connector.area_threshold,
+                     connector.edge_length_threshold)
+
+
+def graph_path(key: str, directory: str = CACHE_DIR) -> str:
+    return os.path.join(directory, f"graph_{key}.npz")
+
+
+# Оставляет max_files графов, к которым обращались последними (время изменения обновляется при чтении)
+def evict_graphs(directory: str = CACHE_DIR, max_files: int = GRAPH_CACHE_MAX_FILES) -> int:
+    try:
+        names = [n for n in os.listdir(directory) if n.startswith("graph_") and n.endswith(".npz")]
+    except OSError:
+        return 0
+    paths = sorted((os.path.join(directory, n) for n in names), key=_mtime, reverse=True)
+    removed = 0
+    for path in paths[max_files:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as exc:
+            log.warning("Не удалось удалить старый кэш графа %s: %s", path, exc)
+    if removed:
+        instrumentation.count("graph_cache", "evicted", removed)
+        log.info("Удалено старых графов из кэша: %d", removed)
+    return removed
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def save_table(table: MatchTable, filepath: str):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    # Пишем во временный файл и переименовываем, чтобы прерванная запись не оставила битый кэш.
+    # Имя с pid: один и тот же граф могут одновременно сохранять несколько процессов сервиса сборки
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    table.save(tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+# Строки таблицы идут в порядке добавления, поэтому dict-граф получается тем же, что и при прямом построении
+def graph_from_table(table: MatchTable, use_match_table: bool) -> MeshGraph:
+    if use_match_table:
+        return MeshGraph(store=table)
+    graph = MeshGraph()
+    for match in table.matches():
+        graph.add_match(match)
+    return graph
+
+
+# Граф из кэша, если фрагменты и пороги не менялись, иначе построение и сохранение
+def cached_mesh_graph(connector, meshes: List[Mesh], directory: str = CACHE_DIR) -> MeshGraph:
+    filepath = graph_path(connector_graph_key(connector, meshes), directory)
+
+    if os.path.exists(filepath):
+        try:
+            graph = graph_from_table(MatchTable.load(filepath, meshes), connector.use_match_table)
+        except (OSError, ValueError, KeyError) as exc:
+            log.warning("Кэш графа %s не прочитан (%s), граф будет построен заново", filepath, exc)
+        else:
+            instrumentation.count("graph_cache", "hits")
+            log.info("Граф совпадений загружен из кэша: %s", filepath)
+            try:
+                os.utime(filepath)
+            except OSError:
+                pass
+            return graph
+
+    instrumentation.count("graph_cache", "misses")
+    # Строим сразу в таблицу: она и сохраняется, и при необходимости разворачивается в dict-граф
+    table = connector.build_mesh_graph(meshes, use_match_table=True).store
+    try:
+        save_table(table, filepath)
+        log.info("Граф совпадений сохранён в кэш: %s", filepath)
+    except OSError as exc:
+        log.warning("Не удалось сохранить кэш графа %s: %s", filepath, exc)
+    evict_graphs(directory)
+    return graph_from_table(table, connector.use_match_table)
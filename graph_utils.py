@@ -1,10 +1,23 @@
-﻿from typing import List, Dict, Set
+﻿from typing import List, Dict, Set, Tuple
+from geometry_connector.congruence import CongruenceClasses, Relabeling
+from geometry_connector.constants import BATCH_SIZE, DEFAULT_BEAM_WIDTH, DEFAULT_BEAM_TIME_LIMIT
 from geometry_connector.enums import MatchType
-from geometry_connector.models import MeshGraph, GraphMatch, Network
+from geometry_connector.instrumentation import instrumentation, instrumented, instrumented_generator
+from geometry_connector.logger import get_logger
+from geometry_connector.models import MeshGraph, GraphMatch, Network, Mesh
+from geometry_connector.pose_consistency import PoseConsistency
 import copy
+import heapq
+import time
 
+log = get_logger("graph")
 
+
+@instrumented("sort_graph")
 def sort_graph(graph: MeshGraph) -> MeshGraph:
+    if graph.store is not None:
+        return MeshGraph(store=graph.store.sorted())
+
     # Глубокое копирование, чтобы не изменять оригинальный граф
     new_graph = copy.deepcopy(graph)
 
@@ -18,9 +31,32 @@ def sort_graph(graph: MeshGraph) -> MeshGraph:
     return new_graph
 
 
-# Выдаёт сети группами для оптимизации
-def generate_networks(graph: MeshGraph):
+# Совпадения по парам мешей в порядке обхода графа; каждое совпадение берётся в направлении mesh1 < mesh2.
+# Этот порядок пар задаёт порядок перебора сетей (generate_networks, beam_search_networks, NetworkIndex)
+def group_matches_by_pair(graph: MeshGraph) -> Dict[frozenset, List[GraphMatch]]:
+    pair_to_matches: Dict[frozenset, List[GraphMatch]] = {}
+    for m1, nbrs in graph.connections.items():
+        for m2, matches in nbrs.items():
+            if m1 < m2:
+                pair_to_matches.setdefault(frozenset((m1, m2)), []).extend(matches)
+    return pair_to_matches
+
+
+# Выдаёт сети группами для оптимизации.
+# Если переданы меши, ветки с противоречивыми позами фрагментов отсекаются (см. PoseConsistency).
+# С congruence сеть не выдаётся, если перестановка конгруэнтных фрагментов переводит её в сеть,
+# которую обход выдаёт раньше; остальные сети группы по требованию даёт expand_congruent.
+# Дерево перебора при этом не сокращается: отсекать частичные ветки нельзя, потому что обход
+# останавливается, как только покрыты все меши, и выбор направления зависит от порядка присоединения,
+# поэтому образ частичной ветки может вообще не встретиться среди выданных сетей.
+# Проверка каждой сети делает обход в разы медленнее, поэтому из панели и воркера режим убран
+# (сверка — benchmarks/congruence_check.py, замеры — benchmarks/scaling.py --congruent)
+@instrumented_generator("generate_networks")
+def generate_networks(graph: MeshGraph, meshes: Dict[str, Mesh] | None = None,
+                      congruence: CongruenceClasses | None = None):
     connections = graph.connections
+    consistency = PoseConsistency(meshes) if meshes is not None else None
+    visited = pruned = symmetric = 0
 
     # Собираем все меши
     nodes: Set[str] = set(connections.keys())
@@ -28,21 +64,27 @@ def generate_networks(graph: MeshGraph):
         nodes |= set(nbrs.keys())
 
     # Предварительно группируем матчи по парам
-    pair_to_matches: Dict[frozenset, List[GraphMatch]] = {}
-    for m1, nbrs in connections.items():
-        for m2, matches in nbrs.items():
-            if m1 < m2:
-                key = frozenset((m1, m2))
-                pair_to_matches.setdefault(key, []).extend(matches)
+    pair_to_matches = group_matches_by_pair(graph)
 
     pairs = list(pair_to_matches.keys())
+    symmetries = _symmetry_tables(pairs, pair_to_matches, congruence.generators()) if congruence else []
+    space = _DecisionSpace(graph, meshes) if symmetries else None
+    decisions: List[int] = []
 
     # Рекурсивный dfs
-    def dfs(idx: int, current: List[GraphMatch], used_idx: Dict[str, Set[int]], used_meshes: Set[str]):
+    # Занятые индексы хранятся отдельно для граней и рёбер: у них независимая нумерация
+    def dfs(idx: int, current: List[GraphMatch], used_idx: Dict[Tuple[str, MatchType], Set[int]], used_meshes: Set[str]):
+        nonlocal visited, pruned, symmetric
+        visited += 1
+
         # Если досчитали все пары — выдаём сеть
         if used_meshes == nodes:
             if any(m.match_type == MatchType.FACE for m in current):
-                yield Network(matches=list(current))
+                # Сеть, чей образ при перестановке конгруэнтных мешей выдаётся раньше, не нужна
+                if space is not None and space.has_smaller_image(decisions, symmetries):
+                    symmetric += 1
+                else:
+                    yield Network(matches=list(current))
             return
 
         if idx >= len(pairs):
@@ -52,12 +94,13 @@ def generate_networks(graph: MeshGraph):
         matches = pair_to_matches[key]
 
         # Пробуем добавить каждый мэтч из пары
-        for match in matches:
+        for i, match in enumerate(matches):
             a, b = match.mesh1, match.mesh2
             index_a, index_b = match.indices
+            key_a, key_b = (a, match.match_type), (b, match.match_type)
 
             # Пропускаем, если индексы уже заняты
-            if index_a in used_idx.get(a, ()) or index_b in used_idx.get(b, ()):
+            if index_a in used_idx.get(key_a, ()) or index_b in used_idx.get(key_b, ()):
                 continue
 
             # Смотрим, какие мэши уже присоединены
@@ -69,8 +112,8 @@ def generate_networks(graph: MeshGraph):
                 continue
 
             # Маркируем занятые индексы
-            used_idx.setdefault(a, set()).add(index_a)
-            used_idx.setdefault(b, set()).add(index_b)
+            used_idx.setdefault(key_a, set()).add(index_a)
+            used_idx.setdefault(key_b, set()).add(index_b)
             added_a = a not in used_meshes
             added_b = b not in used_meshes
             if added_a:
@@ -80,26 +123,304 @@ def generate_networks(graph: MeshGraph):
 
             # Если b ещё не присоединён
             if need_add_b:
-                current.append(match)
-                yield from dfs(idx + 1, current, used_idx, used_meshes)
-                current.pop()
+                if consistency is None or consistency.push(match, False):
+                    current.append(match)
+                    decisions.append(2 * i)
+                    yield from dfs(idx + 1, current, used_idx, used_meshes)
+                    decisions.pop()
+                    current.pop()
+                    if consistency is not None:
+                        consistency.pop()
+                else:
+                    pruned += 1
 
             # Если a ещё не присоединён
             if need_add_a:
-                current.append(match.inverted)
-                yield from dfs(idx + 1, current, used_idx, used_meshes)
-                current.pop()
+                if consistency is None or consistency.push(match, True):
+                    current.append(match.inverted)
+                    decisions.append(2 * i + 1)
+                    yield from dfs(idx + 1, current, used_idx, used_meshes)
+                    decisions.pop()
+                    current.pop()
+                    if consistency is not None:
+                        consistency.pop()
+                else:
+                    pruned += 1
 
             # Снимаем маркировку занятых индексов
-            used_idx[a].remove(index_a)
-            used_idx[b].remove(index_b)
+            used_idx[key_a].remove(index_a)
+            used_idx[key_b].remove(index_b)
             if added_a:
                 used_meshes.remove(a)
             if added_b:
                 used_meshes.remove(b)
 
         # Продолжаем поиск без мэтчей из этой пары
+        decisions.append(_SKIP)
         yield from dfs(idx + 1, current, used_idx, used_meshes)
+        decisions.pop()
+
+    # Начинаем обход графа, сбрасывая счётчик узлов перед каждой выдачей
+    for network in dfs(0, [], {}, set()):
+        instrumentation.count("generate_networks", "dfs_nodes_visited", visited)
+        instrumentation.count("generate_networks", "branches_pruned", pruned)
+        instrumentation.count("generate_networks", "symmetric_networks_skipped", symmetric)
+        instrumentation.count("generate_networks", "networks_yielded")
+        visited = pruned = symmetric = 0
+        yield network
+    instrumentation.count("generate_networks", "dfs_nodes_visited", visited)
+    instrumentation.count("generate_networks", "branches_pruned", pruned)
+    instrumentation.count("generate_networks", "symmetric_networks_skipped", symmetric)
+
+
+# Разворачивает сети-представители generate_networks(graph, meshes, congruence) во все перестановки
+# конгруэнтных фрагментов, которые выдал бы и обход без congruence (в его виде и порядке совпадений).
+# Образы строятся лениво: следующий представитель не ищется, пока не выданы образы текущего
+def expand_congruent(networks, congruence: CongruenceClasses, graph: MeshGraph, meshes: Dict[str, Mesh] | None = None):
+    space = _DecisionSpace(graph, meshes)
+    for network in networks:
+        orbit: Dict[Tuple[int, ...], List[int]] = {}
+        for image in congruence.images(network, graph):
+            decisions = space.decisions(image)
+            if decisions is not None and tuple(decisions) not in orbit and space.produced(decisions):
+                orbit[tuple(decisions)] = decisions
+        # generators() в крупных классах даёт не все перестановки, и в одной группе может остаться
+        # несколько представителей. Группу выдаёт наименьший из них: он же наименьший в группе
+        representative = space.decisions(network)
+        if representative is None or min(orbit, default=None) != tuple(representative):
+            continue
+        for key in sorted(orbit):
+            yield space.network(orbit[key])
+
+
+# Решение dfs по паре: 2i — i-й мэтч пары прямо, 2i + 1 — обратно, _SKIP — пара пропущена.
+# Порядок значений совпадает с порядком обхода, поэтому «меньше» значит «перебирается раньше»
+_SKIP = 1 << 30
+
+
+# Для каждой перестановки: позиция-прообраз каждой пары и перевод решений прообраза в решения образа.
+# Перестановка годится, только если граф переходит сам в себя: у каждого мэтча есть образ.
+# coeff не сравнивается: он зависит от порядка вершин грани и у образа может быть другим
+def _symmetry_tables(pairs: List[frozenset], pair_to_matches: Dict[frozenset, List[GraphMatch]],
+                     relabelings: List[Relabeling]) -> List[Tuple[List[int], List[Dict[int, int]]]]:
+    position = {key: p for p, key in enumerate(pairs)}
+    tables = []
+    for relabeling in relabelings:
+        preimage = [0] * len(pairs)
+        value_maps: List[Dict[int, int]] = []
+        for p, key in enumerate(pairs):
+            image_key = frozenset(relabeling.mesh(name) for name in key)
+            if image_key not in position:
+                break
+            q = position[image_key]
+            preimage[q] = p
+            image_matches = pair_to_matches[image_key]
+            lookup = {(m.mesh1, m.mesh2, m.match_type, m.indices): j for j, m in enumerate(image_matches)}
+            value_map = {_SKIP: _SKIP}
+            for i, match in enumerate(pair_to_matches[key]):
+                a, b = relabeling.mesh(match.mesh1), relabeling.mesh(match.mesh2)
+                ia = relabeling.index(match.mesh1, match.match_type, match.indices[0])
+                ib = relabeling.index(match.mesh2, match.match_type, match.indices[1])
+                # В паре мэтчи хранятся в одну сторону: образ может оказаться обратным
+                flipped = (b, a, match.match_type, (ib, ia)) in lookup
+                j = lookup.get((b, a, match.match_type, (ib, ia)) if flipped else (a, b, match.match_type, (ia, ib)))
+                if j is None:
+                    break
+                value_map[2 * i] = 2 * j + flipped
+                value_map[2 * i + 1] = 2 * j + (not flipped)
+            else:
+                value_maps.append(value_map)
+                continue
+            break
+        else:
+            # value_maps[p] переводит решение в позиции p в решение в позиции её образа
+            tables.append((preimage, value_maps))
+    log.debug("Перестановок конгруэнтных мешей, сохраняющих граф: %d из %d", len(tables), len(relabelings))
+    return tables
+
+
+# Решения полной сети после перестановки: позиции за концом вектора — пропуски, хвостовые пропуски отбрасываются
+def _image(decisions: List[int], preimage: List[int], value_maps: List[Dict[int, int]]) -> List[int]:
+    n = len(decisions)
+    image = [value_maps[q][decisions[q]] if q < n else _SKIP for q in preimage]
+    while image and image[-1] == _SKIP:
+        image.pop()
+    return image
+
+
+# Сети как векторы решений dfs из generate_networks: перевод сети в вектор и обратно
+# и повтор обхода по вектору, чтобы узнать, выдаёт ли обход такую сеть
+class _DecisionSpace:
+    def __init__(self, graph: MeshGraph, meshes: Dict[str, Mesh] | None):
+        self.nodes: Set[str] = set(graph.connections.keys())
+        for nbrs in graph.connections.values():
+            self.nodes |= set(nbrs.keys())
+        self.pair_to_matches = group_matches_by_pair(graph)
+        self.pairs = list(self.pair_to_matches.keys())
+        self._lookup = {(m.mesh1, m.mesh2, m.match_type, m.indices): (p, i)
+                        for p, key in enumerate(self.pairs) for i, m in enumerate(self.pair_to_matches[key])}
+        self._consistency = PoseConsistency(meshes) if meshes is not None else None
+
+    # Вектор решений сети или None, если её совпадений нет в графе или два из них из одной пары
+    def decisions(self, network: Network) -> List[int] | None:
+        chosen: Dict[int, int] = {}
+        for m in network.matches:
+            found = self._lookup.get((m.mesh1, m.mesh2, m.match_type, m.indices))
+            value = 0
+            if found is None:
+                found = self._lookup.get((m.mesh2, m.mesh1, m.match_type, (m.indices[1], m.indices[0])))
+                value = 1
+            if found is None or found[0] in chosen:
+                return None
+            chosen[found[0]] = 2 * found[1] + value
+        if not chosen:
+            return []
+        return [chosen.get(p, _SKIP) for p in range(max(chosen) + 1)]
+
+    def network(self, decisions: List[int]) -> Network:
+        matches = []
+        for p, value in enumerate(decisions):
+            if value != _SKIP:
+                match = self.pair_to_matches[self.pairs[p]][value // 2]
+                matches.append(match.inverted if value % 2 else match)
+        return Network(matches=matches)
+
+    # Выдаёт ли dfs сеть с такими решениями: те же проверки занятых индексов, присоединения и поз,
+    # и все меши покрываются ровно последним решением (иначе обход остановился бы раньше)
+    def produced(self, decisions: List[int]) -> bool:
+        used: Set[Tuple[str, MatchType, int]] = set()
+        used_meshes: Set[str] = set()
+        attached: Set[str] = set()
+        has_face = False
+        pushed = 0
+        try:
+            for p, value in enumerate(decisions):
+                if used_meshes == self.nodes:
+                    return False
+                if value == _SKIP:
+                    continue
+                match = self.pair_to_matches[self.pairs[p]][value // 2]
+                inverted = bool(value % 2)
+                key_a = (match.mesh1, match.match_type, match.indices[0])
+                key_b = (match.mesh2, match.match_type, match.indices[1])
+                target = match.mesh1 if inverted else match.mesh2
+                if key_a in used or key_b in used or target in attached:
+                    return False
+                if self._consistency is not None:
+                    if not self._consistency.push(match, inverted):
+                        return False
+                    pushed += 1
+                used.update((key_a, key_b))
+                used_meshes.update((match.mesh1, match.mesh2))
+                attached.add(target)
+                has_face = has_face or match.match_type == MatchType.FACE
+            return used_meshes == self.nodes and has_face
+        finally:
+            for _ in range(pushed):
+                self._consistency.pop()
+
+    # Есть ли перестановка, переводящая сеть в меньший вектор решений, который обход тоже выдаёт
+    def has_smaller_image(self, decisions: List[int], symmetries: List[Tuple[List[int], List[Dict[int, int]]]]) -> bool:
+        for preimage, value_maps in symmetries:
+            image = _image(decisions, preimage, value_maps)
+            if image < decisions and self.produced(image):
+                return True
+        return False
+
+
+# Лучевой поиск сетей: пары обходятся в том же порядке, что и в generate_networks, но на каждом шаге
+# остаются только beam_width частичных сетей с наибольшим покрытием и суммой coeff.
+# По истечении time_limit секунд возвращаются лучшие из уже найденных полных сетей
+@instrumented("beam_search")
+def beam_search_networks(graph: MeshGraph, beam_width: int = DEFAULT_BEAM_WIDTH,
+                         time_limit: float = DEFAULT_BEAM_TIME_LIMIT, max_networks: int = BATCH_SIZE) -> List[Network]:
+    deadline = time.perf_counter() + time_limit
+    connections = graph.connections
+
+    # Меши, занятые грани/рёбра и присоединённые меши храним битами в int: дочерние состояния копируются дёшево
+    nodes: Dict[str, None] = dict.fromkeys(connections.keys())
+    for nbrs in connections.values():
+        nodes.update(dict.fromkeys(nbrs.keys()))
+    mesh_bit = {name: 1 << i for i, name in enumerate(nodes)}
+    all_meshes = (1 << len(nodes)) - 1
+
+    pairs = list(group_matches_by_pair(graph).values())
+
+    # Номер бита на каждую тройку (меш, тип, индекс)
+    key_bits: Dict[Tuple[str, MatchType, int], int] = {}
+
+    def key_bit(mesh: str, match_type: MatchType, index: int) -> int:
+        return 1 << key_bits.setdefault((mesh, match_type, index), len(key_bits))
+
+    # Меши, у которых после шага idx не осталось пар: частичная сеть без них уже не станет полной
+    last_pair: Dict[str, int] = {}
+    for idx, matches in enumerate(pairs):
+        for name in (matches[0].mesh1, matches[0].mesh2):
+            last_pair[name] = idx
+    dead_after = [0] * (len(pairs) + 1)
+    for name, idx in last_pair.items():
+        dead_after[idx + 1] |= mesh_bit[name]
+    for idx in range(1, len(dead_after)):
+        dead_after[idx] |= dead_after[idx - 1]
+    isolated = all_meshes & ~sum(mesh_bit[name] for name in last_pair)
+
+    # Состояние: (вес, покрытые меши, присоединённые меши, занятые индексы, есть FACE, цепочка совпадений)
+    beam = [(0.0, 0, 0, 0, False, None)]
+    complete = []
+    expanded = 0
+    timed_out = False
+
+    for idx, matches in enumerate(pairs):
+        if isolated or not beam:
+            break
+        if time.perf_counter() > deadline:
+            timed_out = True
+            break
+
+        candidates = []
+        for state in beam:
+            weight, covered, attached, used, has_face, chain = state
+            # Продолжение без мэтчей из этой пары
+            candidates.append(state)
+            for match in matches:
+                bit_a, bit_b = mesh_bit[match.mesh1], mesh_bit[match.mesh2]
+                keys = key_bit(match.mesh1, match.match_type, match.indices[0]) | \
+                    key_bit(match.mesh2, match.match_type, match.indices[1])
+                if used & keys:
+                    continue
+                child = (weight + match.coeff, covered | bit_a | bit_b, 0, used | keys,
+                         has_face or match.match_type == MatchType.FACE, None)
+                # Как в generate_networks: присоединяем b по прямому совпадению или a по обратному
+                if not attached & bit_b:
+                    candidates.append(child[:2] + (attached | bit_b,) + child[3:5] + ((match, False, chain),))
+                if not attached & bit_a:
+                    candidates.append(child[:2] + (attached | bit_a,) + child[3:5] + ((match, True, chain),))
+            expanded += 1
+
+        beam = []
+        for state in candidates:
+            if state[1] == all_meshes:
+                if state[4]:
+                    complete.append(state)
+            elif not (all_meshes & ~state[1]) & dead_after[idx + 1]:
+                beam.append(state)
+
+        # Оценка: сколько мешей уже покрыто, при равном покрытии — накопленный coeff.
+        # Оптимистичная оценка по coeff предпочитала бы пропуск пары любому неидеальному мэтчу
+        beam = heapq.nlargest(beam_width, beam, key=lambda s: (s[1].bit_count(), s[0]))
+
+    instrumentation.count("beam_search", "states_expanded", expanded)
+    instrumentation.count("beam_search", "complete_networks", len(complete))
+    if timed_out:
+        instrumentation.count("beam_search", "deadline_hits")
+        log.info("Лучевой поиск остановлен по времени, найдено полных сетей: %d", len(complete))
 
-    # Начинаем обход графа
-    yield from dfs(0, [], {}, set())
+    networks = []
+    for state in heapq.nlargest(max_networks, complete, key=lambda s: s[0]):
+        matches: List[GraphMatch] = []
+        chain = state[5]
+        while chain is not None:
+            match, inverted, chain = chain
+            matches.append(match.inverted if inverted else match)
+        networks.append(Network(matches=matches[::-1]))
+    return networks
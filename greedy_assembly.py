@@ -0,0 +1,86 @@
+from typing import List, Dict, Tuple, Set
+from geometry_connector.build_geometry import align_match
+from geometry_connector.enums import MatchType
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Mesh, MeshGraph, GraphMatch, TransformMatch
+from mathutils import Matrix
+
+log = get_logger("build")
+
+
+# Кластер — жёсткий суперфрагмент: мировые матрицы участников уже согласованы между собой
+class _Cluster:
+    def __init__(self, name: str, matrix_world: Matrix):
+        self.anchor = name                              # Меш, положение которого кластер сохраняет
+        self.members: List[str] = [name]
+        self.worlds: Dict[str, Matrix] = {name: matrix_world}
+
+
+# Жадная иерархическая сборка без перебора сетей: совпадения идут по убыванию качества (FACE, затем EDGE),
+# каждое принятое совпадение сливает два кластера, меньший переносится целиком одной матрицей.
+# Совпадение отбрасывается, если его меши уже в одном кластере или его грань/ребро уже занято.
+# Сортировка O(M log M), перенос меньшего кластера даёт O(N log N) умножений матриц
+@instrumented("greedy_assembly")
+def greedy_assemble(graph: MeshGraph, meshes: Dict[str, Mesh]) -> List[TransformMatch]:
+    matches: List[GraphMatch] = []
+    seen: Set[Tuple[str, str]] = set()
+    for m1, nbrs in graph.connections.items():
+        for m2, pair_matches in nbrs.items():
+            if (m2, m1) in seen:
+                continue
+            seen.add((m1, m2))
+            matches.extend(pair_matches)
+    matches.sort(key=lambda m: (0 if m.match_type == MatchType.FACE else 1, -m.coeff))
+
+    clusters: Dict[str, _Cluster] = {name: _Cluster(name, mesh.matrix_world.copy()) for name, mesh in meshes.items()}
+    used: Set[Tuple[str, MatchType, int]] = set()
+    attached_to: Dict[str, str] = {}
+    merges = rejected = 0
+
+    for match in matches:
+        c1, c2 = clusters[match.mesh1], clusters[match.mesh2]
+        key1 = (match.mesh1, match.match_type, match.indices[0])
+        key2 = (match.mesh2, match.match_type, match.indices[1])
+        if c1 is c2 or key1 in used or key2 in used:
+            rejected += 1
+            continue
+
+        # Переносим меньший кластер: он становится стороной mesh2 совпадения
+        if len(c2.members) > len(c1.members):
+            match = match.inverted
+            c1, c2 = c2, c1
+        src, dst = match.mesh2, match.mesh1
+
+        new_world = align_match(match, meshes, c2.worlds[src], c1.worlds[dst])
+        delta = new_world @ c2.worlds[src].inverted()
+        for name in c2.members:
+            c1.worlds[name] = delta @ c2.worlds[name]
+            clusters[name] = c1
+        c1.members.extend(c2.members)
+
+        used.add(key1)
+        used.add(key2)
+        attached_to[src] = dst
+        merges += 1
+        log.debug("[greedy_assembly] %s -> %s (%s, coeff=%.3f), размер кластера %d",
+                  src, dst, match.match_type.name, match.coeff, len(c1.members))
+
+    instrumentation.count("greedy_assembly", "merges", merges)
+    instrumentation.count("greedy_assembly", "matches_rejected", rejected)
+
+    # Для каждого кластера из нескольких мешей: якорь, затем остальные в порядке присоединения
+    transforms: List[TransformMatch] = []
+    for cluster in {id(c): c for c in clusters.values()}.values():
+        if len(cluster.members) < 2:
+            continue
+        anchor = cluster.anchor
+        transforms.append(TransformMatch(src_mesh_name=anchor, dst_mesh_name=anchor,
+                                         matrix_world=cluster.worlds[anchor]))
+        for name in cluster.members:
+            if name != anchor:
+                transforms.append(TransformMatch(src_mesh_name=name, dst_mesh_name=attached_to.get(name, anchor),
+                                                 matrix_world=cluster.worlds[name]))
+    log.info("Жадная сборка: %d слияний, кластеров из нескольких мешей: %d",
+             merges, sum(1 for tm in transforms if tm.src_mesh_name == tm.dst_mesh_name))
+    return transforms
@@ -0,0 +1,96 @@
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any
+
+
+@dataclass
+class StageStats:
+    name: str
+    seconds: float = 0.0                                # Суммарное время стадии по всем вызовам
+    peak_bytes: int = 0                                 # Максимальный пик памяти (если включён трекинг)
+    calls: int = 0
+    counters: Dict[str, int] = field(default_factory=dict)
+
+
+class Instrumentation:
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self.track_memory = False                       # tracemalloc заметно замедляет Python, поэтому по запросу
+
+    def reset(self):
+        self.stages = {}
+
+    def get(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name)
+        return stats
+
+    # Счётчики копятся локально в горячих циклах и добавляются сюда одним вызовом
+    def count(self, stage: str, counter: str, n: int = 1):
+        counters = self.get(stage).counters
+        counters[counter] = counters.get(counter, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        stats = self.get(name)
+        own_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+            if own_tracing:
+                stats.peak_bytes = max(stats.peak_bytes, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: asdict(stats) for name, stats in self.stages.items()}
+
+
+instrumentation = Instrumentation()
+
+
+def get_report() -> Dict[str, Any]:
+    return instrumentation.to_dict()
+
+
+def reset():
+    instrumentation.reset()
+
+
+def set_track_memory(enabled: bool):
+    instrumentation.track_memory = enabled
+
+
+def instrumented(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrumentation.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Для генераторов время считается только внутри next(), а не пока потребитель обрабатывает результат
+def instrumented_generator(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            gen = fn(*args, **kwargs)
+            while True:
+                with instrumentation.stage(name):
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                yield item
+        return wrapper
+    return decorator
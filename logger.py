@@ -0,0 +1,35 @@
+import logging
+from typing import Dict
+
+PACKAGE_LOGGER = "geometry_connector"
+LOG_FORMAT = "[%(name)s] %(levelname)s: %(message)s"
+
+# Стадии конвейера, у каждой свой логгер и свой уровень
+STAGES: Dict[str, str] = {
+    "calculate": "Calculate",                           # Извлечение геометрии (GeometryCalculator)
+    "connect": "Connect",                               # Построение графа совпадений
+    "graph": "Graph",                                   # Сортировка графа и перебор сетей
+    "build": "Build",                                   # Сборка сети и трансформации
+    "ui": "UI",                                         # Панель, чтение и запись файлов
+}
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+DEFAULT_LEVEL = "INFO"
+
+_package_logger = logging.getLogger(PACKAGE_LOGGER)
+if not _package_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _package_logger.addHandler(_handler)
+    _package_logger.setLevel(logging.DEBUG)
+    _package_logger.propagate = False
+
+
+def get_logger(stage: str) -> logging.Logger:
+    log = logging.getLogger(f"{PACKAGE_LOGGER}.{stage}")
+    if log.level == logging.NOTSET:
+        log.setLevel(DEFAULT_LEVEL)
+    return log
+
+
+def set_stage_level(stage: str, level: str):
+    get_logger(stage).setLevel(level)
@@ -0,0 +1,232 @@
+from typing import List, Dict, Tuple, Iterator
+from collections.abc import Mapping
+import numpy as np
+from geometry_connector.enums import MatchType
+from geometry_connector.models import GraphMatch, Mesh
+from mathutils import Quaternion
+
+# Одна строка на неориентированное совпадение; обратное направление выдаётся на лету.
+# Рёбра совпадения хранятся парами new_index (ребро грани mesh1, ребро грани mesh2) в общем массиве edge_pairs
+MATCH_DTYPE = np.dtype([
+    ('mesh1', np.int32),
+    ('mesh2', np.int32),
+    ('type', np.int8),
+    ('idx1', np.int32),
+    ('idx2', np.int32),
+    ('coeff', np.float64),
+    ('rotation', np.float64, 4),                        # w, x, y, z; NaN — вращения нет
+    ('edge_start', np.int64),
+    ('edge_count', np.int16),
+    ('edges_swapped', np.bool_),                        # В кортежах рёбер первым идёт ребро mesh2
+])
+
+_TYPE_CODES = {MatchType.FACE: 0, MatchType.EDGE: 1}
+_CODE_TYPES = {code: t for t, code in _TYPE_CODES.items()}
+
+
+# Колоночное хранилище совпадений с CSR-индексом соседей.
+# Совпадения копятся в списках и собираются в массивы при первом чтении (и после новых добавлений)
+class MatchTable:
+    def __init__(self, meshes: List[Mesh]):
+        self.meshes: Dict[str, Mesh] = {m.name: m for m in meshes}
+        self.names: List[str] = [m.name for m in meshes]
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+        self.rows = np.empty(0, dtype=MATCH_DTYPE)
+        self.edge_pairs = np.empty((0, 2), dtype=np.int32)
+        self._pending_rows: List[tuple] = []
+        self._pending_edges: List[Tuple[int, int]] = []
+        self._index = None
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self._pending_rows)
+
+    @property
+    def nbytes(self) -> int:
+        self._freeze()
+        return self.rows.nbytes + self.edge_pairs.nbytes + sum(a.nbytes for a in self._index)
+
+    # Принимает прямые совпадения build_mesh_graph: первым в кортеже рёбер идёт ребро меньшей грани
+    def add(self, match: GraphMatch):
+        face1, face2 = self._faces(match.mesh1, match.mesh2, match.indices) \
+            if match.match_type == MatchType.FACE else (None, None)
+        swapped = face1 is not None and len(face1.edges) > len(face2.edges)
+
+        edge_start = len(self.edge_pairs) + len(self._pending_edges)
+        for a, b in match.edges:
+            self._pending_edges.append((b.new_index, a.new_index) if swapped else (a.new_index, b.new_index))
+
+        rotation = tuple(match.rotation) if match.rotation is not None else (np.nan,) * 4
+        self._pending_rows.append((
+            self.ids[match.mesh1], self.ids[match.mesh2], _TYPE_CODES[match.match_type],
+            match.indices[0], match.indices[1], match.coeff, rotation,
+            edge_start, len(match.edges), swapped
+        ))
+        self._index = None
+
+    # Прямые совпадения в порядке строк
+    def matches(self) -> Iterator[GraphMatch]:
+        self._freeze()
+        for row in range(len(self.rows)):
+            yield self._match(row, False)
+
+    # Двоичный формат: несжатый npz, читается без pickle
+    def save(self, filepath: str):
+        self._freeze()
+        with open(filepath, 'wb') as f:
+            np.savez(f, rows=self.rows, edge_pairs=self.edge_pairs, names=np.array(self.names))
+
+    @classmethod
+    def load(cls, filepath: str, meshes: List[Mesh]) -> "MatchTable":
+        with np.load(filepath, allow_pickle=False) as data:
+            by_name = {m.name: m for m in meshes}
+            table = cls([by_name[name] for name in data['names'].tolist()])
+            table.rows = data['rows']
+            table.edge_pairs = data['edge_pairs']
+        return table
+
+    def _faces(self, mesh1: str, mesh2: str, indices: Tuple[int, int]):
+        return self.meshes[mesh1].face(indices[0]), self.meshes[mesh2].face(indices[1])
+
+    def _freeze(self):
+        if self._pending_rows:
+            self.rows = np.concatenate((self.rows, np.array(self._pending_rows, dtype=MATCH_DTYPE)))
+            self._pending_rows = []
+        if self._pending_edges:
+            self.edge_pairs = np.concatenate((self.edge_pairs, np.array(self._pending_edges, dtype=np.int32)))
+            self._pending_edges = []
+        if self._index is None:
+            self._index = self._build_index()
+
+    # CSR по мешам: для меша m записи offsets[m]:offsets[m + 1] — (строка, сосед, обратное ли направление),
+    # упорядоченные по первому появлению пары, внутри пары — по порядку строк (как списки в dict-графе)
+    def _build_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self.rows)
+        mesh1 = self.rows['mesh1'].astype(np.int64)
+        mesh2 = self.rows['mesh2'].astype(np.int64)
+        rows = np.arange(n)
+
+        pair_key = np.minimum(mesh1, mesh2) * len(self.names) + np.maximum(mesh1, mesh2)
+        _, first_row, pair_of = np.unique(pair_key, return_index=True, return_inverse=True)
+        pair_rank = first_row[pair_of.reshape(-1)]
+
+        owner = np.concatenate((mesh1, mesh2))
+        neighbour = np.concatenate((mesh2, mesh1))
+        adj_rows = np.concatenate((rows, rows))
+        inverted = np.concatenate((np.zeros(n, dtype=bool), np.ones(n, dtype=bool)))
+        order = np.lexsort((adj_rows, np.concatenate((pair_rank, pair_rank)), owner))
+
+        offsets = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner, minlength=len(self.names)), out=offsets[1:])
+
+        # Порядок мешей — по первому появлению, как ключи dict-графа
+        appearance = np.full(len(self.names), np.iinfo(np.int64).max)
+        np.minimum.at(appearance, mesh1, 2 * rows)
+        np.minimum.at(appearance, mesh2, 2 * rows + 1)
+        mesh_order = np.argsort(appearance, kind="stable")[:np.count_nonzero(appearance < np.iinfo(np.int64).max)]
+
+        return offsets, adj_rows[order], neighbour[order], inverted[order], mesh_order
+
+    # Записи индекса по соседям меша: записи одного соседа идут подряд
+    def neighbours(self, mesh: str) -> Dict[str, np.ndarray]:
+        self._freeze()
+        offsets, _, neighbour, _, _ = self._index
+        m = self.ids[mesh]
+        lo, hi = int(offsets[m]), int(offsets[m + 1])
+        if lo == hi:
+            return {}
+        bounds = np.flatnonzero(np.diff(neighbour[lo:hi])) + 1
+        starts = np.concatenate(([0], bounds)) + lo
+        stops = np.concatenate((bounds, [hi - lo])) + lo
+        return {self.names[neighbour[a]]: np.arange(a, b) for a, b in zip(starts.tolist(), stops.tolist())}
+
+    # Сборка GraphMatch из записи индекса: рёбра берутся из граней исходных мешей
+    def materialize(self, entry: int) -> GraphMatch:
+        _, adj_rows, _, inverted, _ = self._index
+        return self._match(int(adj_rows[entry]), bool(inverted[entry]))
+
+    def _match(self, row_index: int, inverted: bool) -> GraphMatch:
+        row = self.rows[row_index]
+        match_type = _CODE_TYPES[int(row['type'])]
+        mesh1, mesh2 = self.names[row['mesh1']], self.names[row['mesh2']]
+        indices = (int(row['idx1']), int(row['idx2']))
+
+        edges = []
+        if row['edge_count']:
+            face1, face2 = self._faces(mesh1, mesh2, indices)
+            by_index1 = {e.new_index: e for e in face1.edges}
+            by_index2 = {e.new_index: e for e in face2.edges}
+            start = int(row['edge_start'])
+            for i1, i2 in self.edge_pairs[start:start + int(row['edge_count'])].tolist():
+                e1, e2 = by_index1[i1], by_index2[i2]
+                edges.append((e2, e1) if row['edges_swapped'] else (e1, e2))
+
+        rotation = None if np.isnan(row['rotation'][0]) else Quaternion(row['rotation'].tolist())
+        match = GraphMatch(mesh1=mesh1, mesh2=mesh2, match_type=match_type, indices=indices,
+                           coeff=float(row['coeff']), edges=edges, rotation=rotation)
+        return match.inverted if inverted else match
+
+    # Аналог sort_graph: FACE перед EDGE, по убыванию coeff; EDGE пары убираются, если есть идеальный FACE
+    def sorted(self) -> "MatchTable":
+        self._freeze()
+        rows = self.rows
+        n = len(rows)
+        mesh1 = rows['mesh1'].astype(np.int64)
+        mesh2 = rows['mesh2'].astype(np.int64)
+        pair_key = np.minimum(mesh1, mesh2) * len(self.names) + np.maximum(mesh1, mesh2)
+        _, first_row, pair_of = np.unique(pair_key, return_index=True, return_inverse=True)
+        pair_of = pair_of.reshape(-1)
+
+        perfect = (rows['type'] == _TYPE_CODES[MatchType.FACE]) & (np.abs(rows['coeff'] - 1.0) < 1e-6)
+        has_perfect = np.bincount(pair_of[perfect], minlength=len(first_row)) > 0
+        keep = ~(has_perfect[pair_of] & (rows['type'] != _TYPE_CODES[MatchType.FACE]))
+
+        order = np.lexsort((np.arange(n), -rows['coeff'], rows['type'], first_row[pair_of]))
+        order = order[keep[order]]
+
+        result = MatchTable(list(self.meshes.values()))
+        result.rows = rows[order].copy()
+        result.edge_pairs = self.edge_pairs
+        return result
+
+    @property
+    def connections(self) -> "ConnectionsView":
+        self._freeze()
+        return ConnectionsView(self)
+
+
+# Dict-подобное представление: connections[mesh][neighbour] -> List[GraphMatch], объекты собираются при чтении
+class NeighboursView(Mapping):
+    def __init__(self, table: MatchTable, entries: Dict[str, np.ndarray]):
+        self._table = table
+        self._entries = entries
+
+    def __getitem__(self, neighbour: str) -> List[GraphMatch]:
+        return [self._table.materialize(e) for e in self._entries[neighbour].tolist()]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ConnectionsView(Mapping):
+    def __init__(self, table: MatchTable):
+        self._table = table
+
+    def __getitem__(self, mesh: str) -> NeighboursView:
+        if mesh not in self._table.ids:
+            raise KeyError(mesh)
+        entries = self._table.neighbours(mesh)
+        if not entries:
+            raise KeyError(mesh)
+        return NeighboursView(self._table, entries)
+
+    def __iter__(self) -> Iterator[str]:
+        self._table._freeze()
+        return iter([self._table.names[m] for m in self._table._index[4].tolist()])
+
+    def __len__(self) -> int:
+        self._table._freeze()
+        return len(self._table._index[4])
@@ -0,0 +1,205 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+# Сырые массивы меша, снятые через foreach_get (или собранные без Blender)
+@dataclass
+class MeshArrays:
+    co: np.ndarray                                      # (V, 3) координаты вершин
+    vert_normals: np.ndarray                            # (V, 3) нормали вершин
+    loop_start: np.ndarray                              # (F,) первая петля грани
+    loop_total: np.ndarray                              # (F,) число петель грани
+    loop_verts: np.ndarray                              # (L,) вершина петли
+    loop_edges: np.ndarray                              # (L,) ребро петли (от этой вершины к следующей)
+    edge_verts: np.ndarray                              # (E, 2) вершины рёбер
+    face_normals: np.ndarray                            # (F, 3) нормали граней
+    face_areas: np.ndarray                              # (F,) площади граней
+
+    @property
+    def face_count(self) -> int:
+        return len(self.loop_start)
+
+    @property
+    def loop_faces(self) -> np.ndarray:
+        return np.repeat(np.arange(self.face_count), self.loop_total)
+
+    @classmethod
+    def from_blender(cls, mesh) -> "MeshArrays":
+        n_verts, n_edges = len(mesh.vertices), len(mesh.edges)
+        n_loops, n_faces = len(mesh.loops), len(mesh.polygons)
+
+        def get(collection, attr, count, dtype, width=1):
+            buf = np.empty(count * width, dtype=dtype)
+            collection.foreach_get(attr, buf)
+            return buf.reshape(-1, width) if width > 1 else buf
+
+        return cls(
+            co=get(mesh.vertices, "co", n_verts, np.float32, 3).astype(np.float64),
+            vert_normals=get(mesh.vertex_normals, "vector", n_verts, np.float32, 3).astype(np.float64),
+            loop_start=get(mesh.polygons, "loop_start", n_faces, np.int32),
+            loop_total=get(mesh.polygons, "loop_total", n_faces, np.int32),
+            loop_verts=get(mesh.loops, "vertex_index", n_loops, np.int32),
+            loop_edges=get(mesh.loops, "edge_index", n_loops, np.int32),
+            edge_verts=get(mesh.edges, "vertices", n_edges, np.int32, 2),
+            face_normals=get(mesh.polygons, "normal", n_faces, np.float32, 3).astype(np.float64),
+            face_areas=get(mesh.polygons, "area", n_faces, np.float32).astype(np.float64),
+        )
+
+
+# Результат векторного расчёта: всё, что нужно для сборки Mesh/Face/Edge
+@dataclass
+class ExtractedArrays:
+    size: np.ndarray                                    # (3,) габариты
+    convex_points: np.ndarray
+    concave_points: np.ndarray
+    flat_points: np.ndarray
+    face_types: np.ndarray                              # (F,) -1 / 0 / 1
+    face_normals: np.ndarray                            # (F, 3) нормаль по первым трём вершинам грани
+    edge_lengths: np.ndarray                            # (E,)
+    edge_directions: np.ndarray                         # (E, 3) единичные направления рёбер
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.divide(v, norm, out=np.zeros_like(v), where=norm > 0)
+
+
+# Таблица смежности ребро -> грани: грани петель, отсортированных по ребру, число граней и начало блока ребра
+def _edge_face_table(arrays: MeshArrays) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    order = np.argsort(arrays.loop_edges, kind="stable")
+    counts = np.bincount(arrays.loop_edges, minlength=len(arrays.edge_verts))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return arrays.loop_faces[order], counts, starts
+
+
+# Рёбра ровно с двумя гранями: (индексы рёбер, первая грань, вторая грань)
+def manifold_edge_faces(arrays: MeshArrays) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    faces, counts, starts = _edge_face_table(arrays)
+    edges = np.flatnonzero(counts == 2)
+    return edges, faces[starts[edges]], faces[starts[edges] + 1]
+
+
+# Все пары граней, смежных по ребру (для неманифолдных рёбер — все сочетания): (рёбра, грань a, грань b), a < b
+def edge_face_pairs(arrays: MeshArrays) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    faces, counts, starts = _edge_face_table(arrays)
+
+    edges, faces_a, faces_b = [], [], []
+    for i in range(1, int(counts.max(initial=0))):
+        sel = np.flatnonzero(counts > i)
+        for j in range(i):
+            edges.append(sel)
+            faces_a.append(faces[starts[sel] + j])
+            faces_b.append(faces[starts[sel] + i])
+    if not edges:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    edges, fa, fb = np.concatenate(edges), np.concatenate(faces_a), np.concatenate(faces_b)
+    keep = fa != fb
+    return edges[keep], np.minimum(fa, fb)[keep], np.maximum(fa, fb)[keep]
+
+
+# Центр грани как среднее её вершин (аналог calc_center_median)
+def face_centers(arrays: MeshArrays) -> np.ndarray:
+    if not arrays.face_count:
+        return np.zeros((0, 3))
+    sums = np.add.reduceat(arrays.co[arrays.loop_verts], arrays.loop_start, axis=0)
+    return sums / arrays.loop_total[:, None]
+
+
+# Компоненты связности по массиву рёбер a–b: каждому узлу сопоставляется минимальный индекс его компоненты.
+# Union-find на массивах: корни подвешиваются к меньшему корню, пути сжимаются перескоком parent[parent]
+def union_find_labels(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    parent = np.arange(n)
+    while True:
+        ra, rb = parent[a], parent[b]
+        changed = ra != rb
+        if not changed.any():
+            return parent
+        np.minimum.at(parent, np.maximum(ra, rb)[changed], np.minimum(ra, rb)[changed])
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+# Метки компланарных групп граней: угол между нормалями и разница расстояний плоскостей ниже порогов
+def coplanar_labels(arrays: MeshArrays, angle_threshold: float, distance_threshold: float) -> np.ndarray:
+    _, faces_a, faces_b = edge_face_pairs(arrays)
+    normals = arrays.face_normals
+    plane_d = np.einsum("ij,ij->i", normals, face_centers(arrays))
+    close = (dihedral_angles(normals, faces_a, faces_b) < angle_threshold) & \
+            (np.abs(plane_d[faces_a] - plane_d[faces_b]) < distance_threshold)
+    return union_find_labels(arrays.face_count, faces_a[close], faces_b[close])
+
+
+# Рёбра ровно с двумя гранями, угол между которыми ниже порога — их растворяет аппроксимация контуров
+def dissolvable_edges(arrays: MeshArrays, angle_threshold: float) -> np.ndarray:
+    edges, faces_a, faces_b = manifold_edge_faces(arrays)
+    return edges[dihedral_angles(arrays.face_normals, faces_a, faces_b) < angle_threshold]
+
+
+# Списки граней каждой группы (по возрастанию индекса) и номер группы для каждой грани
+def group_lists(labels: np.ndarray) -> tuple[list, np.ndarray]:
+    order = np.argsort(labels, kind="stable")
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    groups = np.split(order, bounds)
+    group_of = np.empty(len(labels), dtype=np.int64)
+    group_of[order] = np.repeat(np.arange(len(groups)), [len(g) for g in groups])
+    return [g.tolist() for g in groups], group_of
+
+
+# Угол между нормалями граней, считается один раз на ребро
+def dihedral_angles(normals: np.ndarray, faces_a: np.ndarray, faces_b: np.ndarray) -> np.ndarray:
+    dots = np.einsum("ij,ij->i", _normalize(normals[faces_a]), _normalize(normals[faces_b]))
+    return np.arccos(np.clip(dots, -1.0, 1.0))
+
+
+def extract(arrays: MeshArrays, angle_threshold: float, curvature_threshold: float) -> ExtractedArrays:
+    co = arrays.co
+    n_faces = arrays.face_count
+    loop_faces = arrays.loop_faces
+
+    # Габариты
+    size = co.max(axis=0) - co.min(axis=0) if len(co) else np.zeros(3)
+
+    # Классификация вершин по кривизне: средняя нормаль прилегающих граней против нормали вершины
+    sums = np.zeros_like(co)
+    np.add.at(sums, arrays.loop_verts, arrays.face_normals[loop_faces])
+    linked = np.bincount(arrays.loop_verts, minlength=len(co)) > 0
+    deviation = 1.0 - np.einsum("ij,ij->i", arrays.vert_normals, _normalize(sums))
+    convex = linked & (deviation > curvature_threshold)
+    concave = linked & (deviation < -curvature_threshold)
+    flat = linked & ~convex & ~concave
+
+    # Тип грани по среднему диэдральному углу её рёбер с двумя гранями
+    edges, faces_a, faces_b = manifold_edge_faces(arrays)
+    edge_dihedral = np.full(len(arrays.edge_verts), np.nan)
+    edge_dihedral[edges] = dihedral_angles(arrays.face_normals, faces_a, faces_b)
+    loop_dihedral = edge_dihedral[arrays.loop_edges]
+    has_dihedral = ~np.isnan(loop_dihedral)
+    total = np.bincount(loop_faces[has_dihedral], weights=loop_dihedral[has_dihedral], minlength=n_faces)
+    count = np.bincount(loop_faces[has_dihedral], minlength=n_faces)
+    avg_dihedral = np.divide(total, count, out=np.zeros(n_faces), where=count > 0)
+    face_types = np.where(avg_dihedral > angle_threshold, 1, np.where(avg_dihedral < -angle_threshold, -1, 0))
+
+    # Нормаль грани по первым трём вершинам
+    v0 = co[arrays.loop_verts[arrays.loop_start]]
+    v1 = co[arrays.loop_verts[arrays.loop_start + 1]]
+    v2 = co[arrays.loop_verts[arrays.loop_start + 2]]
+    face_normals = _normalize(np.cross(v1 - v0, v2 - v0))
+
+    edge_vectors = co[arrays.edge_verts[:, 1]] - co[arrays.edge_verts[:, 0]]
+    edge_lengths = np.linalg.norm(edge_vectors, axis=1)
+
+    return ExtractedArrays(
+        size=size,
+        convex_points=np.flatnonzero(convex),
+        concave_points=np.flatnonzero(concave),
+        flat_points=np.flatnonzero(flat),
+        face_types=face_types,
+        face_normals=face_normals,
+        edge_lengths=edge_lengths,
+        edge_directions=_normalize(edge_vectors),
+    )
@@ -1,9 +1,13 @@
 from copy import deepcopy
 from dataclasses import dataclass, field
 from typing import List, Tuple, Dict, Optional
+import numpy as np
 from geometry_connector.enums import MatchType
+from geometry_connector.logger import get_logger
 from mathutils import Vector, Quaternion, Matrix
 
+log = get_logger("connect")
+
 
 @dataclass
 class Edge:
@@ -11,6 +15,14 @@ class Edge:
     orig_indices: List[int]
     length: float
     vertices: List[List[float]]
+    # Единичное направление ребра, считается один раз при извлечении (или здесь, если не передано)
+    direction: np.ndarray | None = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.direction is None:
+            d = np.subtract(self.vertices[1], self.vertices[0], dtype=np.float64)
+            norm = np.linalg.norm(d)
+            self.direction = d / norm if norm > 0 else np.zeros(3)
 
 
 @dataclass
@@ -22,6 +34,14 @@ class Face:
     normal: Vector
     edges: List[Edge]
     vertices: List[List[float]]
+    # Единичная нормаль в numpy для пакетной проверки вращений
+    unit_normal: np.ndarray | None = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.unit_normal is None:
+            n = np.array(self.normal, dtype=np.float64)
+            norm = np.linalg.norm(n)
+            self.unit_normal = n / norm if norm > 0 else np.zeros(3)
 
 
 @dataclass
@@ -33,6 +53,15 @@ class Mesh:
     flat_points: List[int]
     matrix_world: Matrix
     faces: List[Face]
+    # Индексы new_index -> грань/ребро и число граней, по которому они построены
+    _face_index: Dict[int, Face] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _edge_index: Dict[int, Edge] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _indexed: int | None = field(default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, key, value):
+        if key == 'faces':
+            object.__setattr__(self, '_indexed', None)
+        object.__setattr__(self, key, value)
 
     @property
     def edges(self) -> List[Edge]:
@@ -41,6 +70,32 @@ class Mesh:
             result.extend(f.edges)
         return result
 
+    # Грань по new_index. Позиция в faces равна new_index, только пока список не отфильтрован и не переупорядочен,
+    # а в edges общие рёбра граней повторяются, поэтому индексы совпадений разрешаются только так
+    def face(self, new_index: int) -> Face:
+        self._ensure_index()
+        return self._face_index[new_index]
+
+    # Ребро по new_index; у общих рёбер берётся первое вхождение (вершины у вхождений одинаковые)
+    def edge(self, new_index: int) -> Edge:
+        self._ensure_index()
+        return self._edge_index[new_index]
+
+    # Индексы перестраиваются сами при присваивании faces или изменении длины списка;
+    # после замены граней на месте (faces[i] = ...) или правки их рёбер нужен явный вызов
+    def invalidate_index(self):
+        self._indexed = None
+
+    def _ensure_index(self):
+        if self._indexed == len(self.faces):
+            return
+        self._face_index = {f.new_index: f for f in self.faces}
+        self._edge_index = {}
+        for f in self.faces:
+            for e in f.edges:
+                self._edge_index.setdefault(e.new_index, e)
+        self._indexed = len(self.faces)
+
     @property
     def volume(self) -> float:
         x, y, z = self.size
@@ -76,15 +131,24 @@ class GraphMatch:
         )
 
 
-# Граф: MeshName -> Connected MeshNames -> info about connection
+# Граф: MeshName -> Connected MeshNames -> info about connection.
+# store — необязательное колоночное хранилище (MatchTable), отдающее тот же dict-подобный интерфейс
 class MeshGraph:
-    def __init__(self):
-        self.connections: Dict[str, Dict[str, List[GraphMatch]]] = {}
+    def __init__(self, store=None):
+        self.store = store
+        self._connections: Dict[str, Dict[str, List[GraphMatch]]] = {}
+
+    @property
+    def connections(self) -> Dict[str, Dict[str, List[GraphMatch]]]:
+        return self.store.connections if self.store is not None else self._connections
 
     def add_match(self, match: GraphMatch):
-        self.connections.setdefault(match.mesh1, {}).setdefault(match.mesh2, []).append(match)
-        self.connections.setdefault(match.mesh2, {}).setdefault(match.mesh1, []).append(match.inverted)
-        print(f"В граф добавлено совпадение: {match} \n")
+        if self.store is not None:
+            self.store.add(match)
+        else:
+            self._connections.setdefault(match.mesh1, {}).setdefault(match.mesh2, []).append(match)
+            self._connections.setdefault(match.mesh2, {}).setdefault(match.mesh1, []).append(match.inverted)
+        log.debug("В граф добавлено совпадение: %s", match)
 
 
 @dataclass
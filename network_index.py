@@ -0,0 +1,174 @@
+from typing import Dict, List, Tuple, Iterator
+from geometry_connector.constants import NETWORK_INDEX_MAX_STATES
+from geometry_connector.enums import MatchType
+from geometry_connector.graph_utils import group_matches_by_pair
+from geometry_connector.instrumentation import instrumentation
+from geometry_connector.logger import get_logger
+from geometry_connector.models import MeshGraph, GraphMatch, Network
+
+log = get_logger("graph")
+
+# Состояние узла дерева перебора: (номер пары, покрытые меши, присоединённые меши, занятые индексы, есть FACE).
+# Множества хранятся битами в int, как в beam_search_networks
+State = Tuple[int, int, int, int, bool]
+
+
+# Дерево перебора слишком велико для подсчёта: нужно больше max_states запомненных поддеревьев
+class NetworkIndexTooLarge(Exception):
+    pass
+
+
+# Произвольный доступ к сетям в порядке generate_networks(graph) без отсечений:
+# число сетей в каждом поддереве считается один раз и запоминается, поэтому N-я сеть (unrank)
+# находится спуском от корня, а номер сети (rank) — обратным подъёмом, без перебора предыдущих.
+# Отсечения по позам и по конгруэнтности зависят от всего пути, а не от состояния узла, и здесь не учитываются.
+# Число различных поддеревьев растёт экспоненциально с числом мешей, у которых пары есть и до, и после
+# текущей: больше max_states запомненных поддеревьев не считается, total бросает NetworkIndexTooLarge.
+# На синтетических разбиениях это около десяти фрагментов (подсчёт там занимает порядка секунды)
+class NetworkIndex:
+    def __init__(self, graph: MeshGraph, max_states: int = NETWORK_INDEX_MAX_STATES):
+        nodes: Dict[str, None] = dict.fromkeys(graph.connections.keys())
+        for nbrs in graph.connections.values():
+            nodes.update(dict.fromkeys(nbrs.keys()))
+        mesh_bit = {name: 1 << i for i, name in enumerate(nodes)}
+        self.all_meshes = (1 << len(nodes)) - 1
+
+        key_bits: Dict[Tuple[str, MatchType, int], int] = {}
+
+        def key_bit(mesh: str, match_type: MatchType, index: int) -> int:
+            return 1 << key_bits.setdefault((mesh, match_type, index), len(key_bits))
+
+        # Для каждой пары: её ключ и варианты (совпадение, бит a, бит b, биты занимаемых индексов, FACE ли)
+        pair_to_matches = group_matches_by_pair(graph)
+        self.pair_keys: List[frozenset] = list(pair_to_matches.keys())
+        self.pairs: List[List[Tuple[GraphMatch, int, int, int, bool]]] = [
+            [(m, mesh_bit[m.mesh1], mesh_bit[m.mesh2],
+              key_bit(m.mesh1, m.match_type, m.indices[0]) | key_bit(m.mesh2, m.match_type, m.indices[1]),
+              m.match_type == MatchType.FACE) for m in matches]
+            for matches in pair_to_matches.values()
+        ]
+
+        # Биты мешей и индексов, встречающихся в парах начиная с idx: остальная часть состояния
+        # на поддерево не влияет и в ключ памяти не входит
+        self._future_meshes = [0] * (len(self.pairs) + 1)
+        self._future_keys = [0] * (len(self.pairs) + 1)
+        for idx in range(len(self.pairs) - 1, -1, -1):
+            meshes = keys = 0
+            for _, bit_a, bit_b, bits, _ in self.pairs[idx]:
+                meshes |= bit_a | bit_b
+                keys |= bits
+            self._future_meshes[idx] = self._future_meshes[idx + 1] | meshes
+            self._future_keys[idx] = self._future_keys[idx + 1] | keys
+
+        self.max_states = max_states
+        self._counts: Dict[State, int] = {}
+        self._total: int | None = None
+
+    # Общее число сетей; может быть больше sys.maxsize, поэтому не __len__
+    @property
+    def total(self) -> int:
+        if self._total is None:
+            self._total = self._count((0, 0, 0, 0, False))
+            instrumentation.count("network_index", "memoized_states", len(self._counts))
+            log.info("Всего сетей в дереве перебора: %d, запомнено состояний: %d", self._total, len(self._counts))
+        return self._total
+
+    # N-я сеть (с нуля) в порядке generate_networks
+    def unrank(self, n: int) -> Network:
+        if not 0 <= n < self.total:
+            raise IndexError(f"network {n} is out of range 0..{self.total - 1}")
+        state: State = (0, 0, 0, 0, False)
+        current: List[GraphMatch] = []
+        while state[1] != self.all_meshes:
+            for match, child in self._children(state):
+                count = self._count(child)
+                if n < count:
+                    if match is not None:
+                        current.append(match)
+                    state = child
+                    break
+                n -= count
+        return Network(matches=current)
+
+    # Номер сети в порядке generate_networks; ValueError, если generate_networks её не выдаёт
+    def rank(self, network: Network) -> int:
+        targets = [(m.mesh1, m.mesh2, m.match_type, m.indices) for m in network.matches]
+        state: State = (0, 0, 0, 0, False)
+        position = result = 0
+        while state[1] != self.all_meshes:
+            target = targets[position] if position < len(targets) else None
+            # Сеть без совпадений из этой пары идёт по ветке пропуска
+            skip = target is None or frozenset(target[:2]) != self.pair_keys[state[0]]
+            for match, child in self._children(state):
+                if (match is None and skip) or \
+                        (match is not None and (match.mesh1, match.mesh2, match.match_type, match.indices) == target):
+                    position += match is not None
+                    state = child
+                    break
+                result += self._count(child)
+            else:
+                raise ValueError("Network is not produced by the search")
+        if position != len(targets) or not state[4]:
+            raise ValueError("Network is not produced by the search")
+        return result
+
+    # Дочерние узлы в порядке обхода generate_networks: для каждого совпадения пары присоединение b
+    # (прямое совпадение), затем a (обратное), последним — пропуск пары (совпадение None)
+    def _children(self, state: State) -> Iterator[Tuple[GraphMatch | None, State]]:
+        idx, covered, attached, used, has_face = state
+        for match, bit_a, bit_b, bits, is_face in self.pairs[idx]:
+            if used & bits:
+                continue
+            need_a, need_b = not attached & bit_a, not attached & bit_b
+            if not need_a and not need_b:
+                continue
+            child_covered, child_used, child_face = covered | bit_a | bit_b, used | bits, has_face or is_face
+            if need_b:
+                yield match, (idx + 1, child_covered, attached | bit_b, child_used, child_face)
+            if need_a:
+                yield match.inverted, (idx + 1, child_covered, attached | bit_a, child_used, child_face)
+        yield None, (idx + 1, covered, attached, used, has_face)
+
+    # Число сетей в поддереве. Обход идёт явным стеком: глубина дерева равна числу пар
+    # и на сотнях пар превышает предел рекурсии Python
+    def _count(self, state: State) -> int:
+        count = self._known(state)
+        if count is not None:
+            return count
+        # Кадр: [ключ узла, итератор по дочерним узлам, накопленная сумма]. Дочерние узлы ключа
+        # считаются так же, как у полного состояния: отброшенные биты на поддерево не влияют
+        root = self._key(state)
+        stack = [[root, self._children(root), 0]]
+        while stack:
+            frame = stack[-1]
+            for _, child in frame[1]:
+                count = self._known(child)
+                if count is None:
+                    key = self._key(child)
+                    stack.append([key, self._children(key), 0])
+                    break
+                frame[2] += count
+            else:
+                stack.pop()
+                self._counts[frame[0]] = frame[2]
+                if len(self._counts) > self.max_states:
+                    self._counts.clear()
+                    raise NetworkIndexTooLarge(f"network index needs more than {self.max_states} memoized subtrees")
+                if stack:
+                    stack[-1][2] += frame[2]
+        return self._counts[root]
+
+    # Число сетей в поддереве, если оно уже известно: концевой узел или запомненный ключ
+    def _known(self, state: State) -> int | None:
+        idx, covered, _, _, has_face = state
+        # Как в generate_networks: сеть выдаётся, как только покрыты все меши
+        if covered == self.all_meshes:
+            return 1 if has_face else 0
+        # Непокрытый меш, которого нет в оставшихся парах, уже не покроется
+        if idx >= len(self.pairs) or self.all_meshes & ~covered & ~self._future_meshes[idx]:
+            return 0
+        return self._counts.get(self._key(state))
+
+    def _key(self, state: State) -> State:
+        idx, covered, attached, used, has_face = state
+        return idx, covered, attached & self._future_meshes[idx], used & self._future_keys[idx], has_face
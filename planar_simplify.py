@@ -0,0 +1,232 @@
+from typing import List, Dict, Tuple
+import numpy as np
+from geometry_connector.mesh_arrays import MeshArrays, manifold_edge_faces, dihedral_angles, union_find_labels, \
+    coplanar_labels
+
+# Аналог цепочки bmesh.ops.dissolve_edges(use_verts=True) -> remove_doubles -> recalc_face_normals
+# на сырых массивах, без bpy и mathutils, чтобы фрагменты можно было упрощать в фоновых процессах.
+# Нумерация элементов результата может отличаться от bmesh, сами грани/рёбра совпадают.
+
+
+def _face_loops(arrays: MeshArrays) -> List[List[int]]:
+    return [loop.tolist() for loop in np.split(arrays.loop_verts, arrays.loop_start[1:])] if arrays.face_count else []
+
+
+# Слияние компланарных регионов: контур региона собирается из его граничных полурёбер
+def _dissolve(arrays: MeshArrays, angle_threshold: float) -> Tuple[List[List[int]], np.ndarray]:
+    n_faces = arrays.face_count
+    face_loops = _face_loops(arrays)
+
+    edges, faces_a, faces_b = manifold_edge_faces(arrays)
+    dissolve = dihedral_angles(arrays.face_normals, faces_a, faces_b) < angle_threshold
+    region = union_find_labels(n_faces, faces_a[dissolve], faces_b[dissolve])
+    internal = np.zeros(len(arrays.edge_verts), dtype=bool)
+    internal[edges[dissolve]] = True
+    touched = np.unique(arrays.edge_verts[edges[dissolve]])
+
+    region_size = np.bincount(region, minlength=n_faces)
+    loop_faces = arrays.loop_faces
+    next_loop = np.arange(len(arrays.loop_verts)) + 1
+    next_loop[arrays.loop_start + arrays.loop_total - 1] = arrays.loop_start
+
+    # Граничные полурёбра объединяемых регионов, сгруппированные по региону
+    boundary = np.flatnonzero((region_size[region[loop_faces]] > 1) & ~internal[arrays.loop_edges])
+    boundary_region = region[loop_faces[boundary]]
+    order = np.argsort(boundary_region, kind="stable")
+    boundary, boundary_region = boundary[order], boundary_region[order]
+    bounds = np.flatnonzero(np.diff(boundary_region)) + 1
+    starts_by_region = dict(zip(boundary_region[np.r_[0, bounds]].tolist(), np.split(boundary, bounds))) \
+        if len(boundary) else {}
+
+    result: List[Tuple[int, List[int]]] = []
+    for root in np.flatnonzero(region_size > 0).tolist():
+        if region_size[root] == 1:
+            result.append((root, face_loops[root]))
+            continue
+
+        half_edges = starts_by_region.get(root, np.empty(0, dtype=np.int64))
+        step = dict(zip(arrays.loop_verts[half_edges].tolist(), arrays.loop_verts[next_loop[half_edges]].tolist()))
+        contour = []
+        if len(step) == len(half_edges) and step:
+            start = next(iter(step))
+            v = start
+            while True:
+                contour.append(v)
+                v = step[v]
+                if v == start or len(contour) > len(step):
+                    break
+
+        if len(contour) == len(step) and len(contour) >= 3:
+            result.append((root, contour))
+        else:
+            # Регион с дырами или самокасанием bmesh тоже не растворяет — оставляем исходные грани
+            result.extend((f, face_loops[f]) for f in np.flatnonzero(region == root).tolist())
+
+    result.sort(key=lambda item: item[0])
+    return [loop for _, loop in result], touched
+
+
+def _undirected_edges(loops: List[List[int]]) -> Dict[Tuple[int, int], List[Tuple[int, bool]]]:
+    edges: Dict[Tuple[int, int], List[Tuple[int, bool]]] = {}
+    for f, loop in enumerate(loops):
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            edges.setdefault((min(a, b), max(a, b)), []).append((f, a < b))
+    return edges
+
+
+# use_verts=True: вершины растворённых рёбер, у которых осталось только два ребра, лежат на прямой и удаляются
+def _dissolve_lone_verts(loops: List[List[int]], touched: np.ndarray) -> List[List[int]]:
+    degree: Dict[int, int] = {}
+    for a, b in _undirected_edges(loops):
+        degree[a] = degree.get(a, 0) + 1
+        degree[b] = degree.get(b, 0) + 1
+    lone = {v for v in touched.tolist() if degree.get(v) == 2}
+    if not lone:
+        return loops
+    loops = [[v for v in loop if v not in lone] for loop in loops]
+    return [loop for loop in loops if len(loop) >= 3]
+
+
+# remove_doubles: жадная склейка вершин ближе dist через хеш-сетку с ячейкой dist
+def _weld(co: np.ndarray, loops: List[List[int]], dist: float) -> List[List[int]]:
+    if dist <= 0.0 or not len(co):
+        return loops
+    cells = np.floor(co / dist).astype(np.int64).tolist()
+    co_list = co.tolist()
+    target = list(range(len(co)))
+    grid: Dict[Tuple[int, int, int], List[int]] = {}
+    dist_sq = dist * dist
+    for v, (cx, cy, cz) in enumerate(cells):
+        px, py, pz = co_list[v]
+        found = -1
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for u in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        qx, qy, qz = co_list[u]
+                        if (px - qx) ** 2 + (py - qy) ** 2 + (pz - qz) ** 2 <= dist_sq:
+                            found = u
+                            break
+                    if found >= 0:
+                        break
+                if found >= 0:
+                    break
+        if found >= 0:
+            target[v] = found
+        else:
+            grid.setdefault((cx, cy, cz), []).append(v)
+
+    result = []
+    for loop in loops:
+        welded = []
+        for v in loop:
+            t = target[v]
+            if not welded or welded[-1] != t:
+                welded.append(t)
+        while len(welded) > 1 and welded[0] == welded[-1]:
+            welded.pop()
+        if len(welded) >= 3:
+            result.append(welded)
+    return result
+
+
+# recalc_face_normals: согласуем обход граней в каждой связной компоненте и разворачиваем её наружу
+def _orient(co: np.ndarray, loops: List[List[int]]) -> List[List[int]]:
+    edges = _undirected_edges(loops)
+    flip = [None] * len(loops)
+    for seed in range(len(loops)):
+        if flip[seed] is not None:
+            continue
+        flip[seed] = False
+        component = [seed]
+        queue = [seed]
+        while queue:
+            f = queue.pop()
+            loop = loops[f]
+            for a, b in zip(loop, loop[1:] + loop[:1]):
+                forward = (a < b) != flip[f]
+                for g, g_forward in edges[(min(a, b), max(a, b))]:
+                    if g == f or flip[g] is not None:
+                        continue
+                    # Соседняя грань должна проходить общее ребро в обратном направлении
+                    flip[g] = g_forward == forward
+                    component.append(g)
+                    queue.append(g)
+
+        # Знаковый объём компоненты по веерам треугольников: отрицательный — нормали смотрят внутрь
+        volume = 0.0
+        for f in component:
+            pts = co[loops[f][::-1] if flip[f] else loops[f]]
+            volume += float(np.einsum("j,ij->", pts[0], np.cross(pts[1:-1], pts[2:])))
+        if volume < 0.0:
+            for f in component:
+                flip[f] = not flip[f]
+
+    return [loop[::-1] if flip[f] else loop for f, loop in enumerate(loops)]
+
+
+# Сборка MeshArrays из списков вершин граней: рёбра в порядке первого появления, нормали по Ньюэллу
+def _to_arrays(co: np.ndarray, loops: List[List[int]]) -> MeshArrays:
+    used = sorted({v for loop in loops for v in loop})
+    remap = np.full(len(co), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    co = co[used]
+
+    loop_total = np.array([len(loop) for loop in loops], dtype=np.int64)
+    loop_start = np.concatenate(([0], np.cumsum(loop_total)[:-1])).astype(np.int64)
+    loop_verts = remap[np.concatenate(loops)] if loops else np.empty(0, dtype=np.int64)
+    next_loop = np.arange(len(loop_verts)) + 1
+    next_loop[loop_start + loop_total - 1] = loop_start
+    prev_loop = np.empty_like(next_loop)
+    prev_loop[next_loop] = np.arange(len(loop_verts))
+
+    pairs = np.sort(np.stack((loop_verts, loop_verts[next_loop]), axis=1), axis=1)
+    unique, first, loop_edges = np.unique(pairs, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    edge_verts = unique[order]
+    loop_edges = rank[loop_edges.reshape(-1)]
+
+    loop_faces = np.repeat(np.arange(len(loops)), loop_total)
+    newell = np.zeros((len(loops), 3))
+    np.add.at(newell, loop_faces, np.cross(co[loop_verts], co[loop_verts[next_loop]]))
+    norm = np.linalg.norm(newell, axis=1)
+    face_normals = np.divide(newell, norm[:, None], out=np.zeros_like(newell), where=norm[:, None] > 0)
+
+    # Нормали вершин взвешены углами при вершине, как в Blender
+    to_prev = co[loop_verts[prev_loop]] - co[loop_verts]
+    to_next = co[loop_verts[next_loop]] - co[loop_verts]
+    cos = np.einsum("ij,ij->i", to_prev, to_next) / np.maximum(
+        np.linalg.norm(to_prev, axis=1) * np.linalg.norm(to_next, axis=1), 1e-30)
+    vert_normals = np.zeros_like(co)
+    np.add.at(vert_normals, loop_verts, face_normals[loop_faces] * np.arccos(np.clip(cos, -1.0, 1.0))[:, None])
+    vnorm = np.linalg.norm(vert_normals, axis=1, keepdims=True)
+    vert_normals = np.divide(vert_normals, vnorm, out=np.zeros_like(vert_normals), where=vnorm > 0)
+
+    return MeshArrays(
+        co=co,
+        vert_normals=vert_normals,
+        loop_start=loop_start,
+        loop_total=loop_total,
+        loop_verts=loop_verts,
+        loop_edges=loop_edges,
+        edge_verts=edge_verts,
+        face_normals=face_normals,
+        face_areas=norm / 2,
+    )
+
+
+def simplify(arrays: MeshArrays, angle_threshold: float, distance_threshold: float) -> MeshArrays:
+    loops, touched = _dissolve(arrays, angle_threshold)
+    loops = _dissolve_lone_verts(loops, touched)
+    loops = _weld(arrays.co, loops, distance_threshold)
+    loops = _orient(arrays.co, loops)
+    return _to_arrays(arrays.co, loops)
+
+
+# Задача для пула процессов: группы компланарных граней исходника и упрощённая геометрия
+def simplify_fragment(arrays: MeshArrays, angle_threshold: float, distance_threshold: float) \
+        -> Tuple[MeshArrays, np.ndarray]:
+    group_labels = coplanar_labels(arrays, angle_threshold, distance_threshold)
+    return simplify(arrays, angle_threshold, distance_threshold), group_labels
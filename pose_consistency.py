@@ -0,0 +1,387 @@
+import math
+import numpy as np
+from typing import Dict, List, Tuple
+from geometry_connector.build_geometry import align_match
+from geometry_connector.constants import LOOP_CLOSURE_ANGLE_THRESHOLD, LOOP_CLOSURE_DISTANCE_RATIO, \
+    POSE_OVERLAP_RATIO, POSE_HINGE_CACHE_SIZE
+from geometry_connector.enums import MatchType
+from geometry_connector.models import Mesh, GraphMatch
+from mathutils import Matrix, Vector, Quaternion
+
+# Множество углов поворота — отсортированные интервалы в [0, 2π)
+Arcs = List[Tuple[float, float]]
+
+_FULL_TURN = 2 * math.pi
+_ARC_EPSILON = 1e-9                                     # Запас на погрешность: граница дуги считается допустимой
+
+
+# Проверка геометрической согласованности частичной сети во время перебора.
+# Позы мешей хранятся относительно корня компоненты: каждое FACE-совпадение с вращением жёстко задаёт
+# относительную трансформацию mesh2 -> mesh1. EDGE и FACE без вращения («шарниры») задают позу
+# с точностью до поворота вокруг оси контакта (нормали грани или ребра; ребро ещё и переворачивается
+# вдоль себя) и компоненты не объединяют. Внутри одной компоненты их рёбра/грани должны сойтись,
+# а между разными компонентами должен найтись угол, при котором компоненты не накладываются
+# и сходятся все остальные шарниры между ними.
+# Ветка отсекается, если новое совпадение замыкает цикл с другой позой, не сходится по контакту
+# или ставит фрагмент на место уже поставленного (по центроидам и радиусам описанных сфер)
+class PoseConsistency:
+    def __init__(self, meshes: Dict[str, Mesh]):
+        self.meshes = meshes
+        self.poses: Dict[str, Tuple[str, Matrix]] = {}   # Меш -> (корень компоненты, поза относительно корня)
+        self.members: Dict[str, List[str]] = {}         # Корень -> меши компоненты
+        self._history: List[list] = []
+        self._loose: List[GraphMatch] = []               # Совпадения без жёсткой позы, ждущие проверки контакта
+        self._relative: Dict[int, Matrix] = {}
+        self._hinges: Dict[int, Tuple[Vector, Vector, Vector, Vector, List[Matrix]]] = {}
+        self._versions: Dict[str, int] = {}             # Корень -> номер состояния компоненты
+        self._next_version = 1
+        self._feasible: Dict[tuple, bool] = {}           # Кэш _hinge_feasible по номерам состояний компонент
+        self._centroids: Dict[str, Vector] = {}
+        self._radii: Dict[str, float] = {}
+        self._cos_angle = math.cos(LOOP_CLOSURE_ANGLE_THRESHOLD)
+        self._cos_half_angle = math.cos(LOOP_CLOSURE_ANGLE_THRESHOLD / 2)
+
+    # Пытается добавить совпадение (inverted — совпадение берётся в обратную сторону).
+    # Возвращает False, если оно противоречит уже поставленным мешам; при True нужен парный pop()
+    def push(self, match: GraphMatch, inverted: bool) -> bool:
+        changes: list = []
+        dst, src = (match.mesh2, match.mesh1) if inverted else (match.mesh1, match.mesh2)
+        rel = self._relative_pose(match)
+        if rel is None:
+            if not self._loose_consistent(match):
+                return False
+            self._loose.append(match)
+            changes.append(('loose',))
+            self._history.append(changes)
+            return True
+        if inverted:
+            rel = rel.inverted()
+
+        if dst not in self.poses:
+            self._set_root(dst, changes)
+        root, pose_dst = self.poses[dst]
+        pose_src = pose_dst @ rel
+
+        merged_root = None
+        if src in self.poses:
+            src_root, placed = self.poses[src]
+            if src_root == root:
+                # Цикл: поза по новому совпадению должна совпасть с уже известной
+                if not self._same_pose(src, placed, pose_src):
+                    self._undo(changes)
+                    return False
+                self._history.append(changes)
+                return True
+            # Слияние компонент: компонента src переводится в систему корня dst
+            delta = pose_src @ placed.inverted()
+            moved = [(name, delta @ self.poses[name][1]) for name in self.members[src_root]]
+            merged_root = src_root
+        else:
+            moved = [(src, pose_src)]
+
+        for name, pose in moved:
+            for other in self.members[root]:
+                if self._overlaps(name, pose, other, self.poses[other][1]):
+                    self._undo(changes)
+                    return False
+
+        for name, pose in moved:
+            changes.append((name, self.poses.get(name)))
+            self.poses[name] = (root, pose)
+        if merged_root is not None:
+            changes.append(('members', merged_root, self.members.pop(merged_root)))
+        changes.append(('extend', root, len(self.members[root])))
+        self.members[root].extend(name for name, _ in moved)
+        self._bump_version(root, changes)
+
+        # Шарниры, задевающие изменившуюся компоненту: их меши могли оказаться в ней оба,
+        # а компонента на другом конце — наложиться на новые меши
+        for loose in self._loose:
+            if root in (self._root(loose.mesh1), self._root(loose.mesh2)) and not self._loose_consistent(loose):
+                self._undo(changes)
+                return False
+        self._history.append(changes)
+        return True
+
+    def pop(self):
+        self._undo(self._history.pop())
+
+    def _set_root(self, name: str, changes: list):
+        changes.append((name, None))
+        changes.append(('members', name, None))
+        self.poses[name] = (name, Matrix.Identity(4))
+        self.members[name] = [name]
+        self._bump_version(name, changes)
+
+    # Новый номер состояния компоненты; после отката возвращается прежний, и кэш шарниров снова верен
+    def _bump_version(self, root: str, changes: list):
+        changes.append(('version', root, self._versions.get(root)))
+        self._versions[root] = self._next_version
+        self._next_version += 1
+
+    def _undo(self, changes: list):
+        for change in reversed(changes):
+            if change[0] == 'loose':
+                self._loose.pop()
+            elif change[0] == 'version':
+                if change[2] is None:
+                    del self._versions[change[1]]
+                else:
+                    self._versions[change[1]] = change[2]
+            elif change[0] == 'extend':
+                del self.members[change[1]][change[2]:]
+            elif change[0] == 'members':
+                if change[2] is None:
+                    del self.members[change[1]]
+                else:
+                    self.members[change[1]] = change[2]
+            elif change[1] is None:
+                del self.poses[change[0]]
+            else:
+                self.poses[change[0]] = change[1]
+
+    # Поза mesh2 в локальных координатах mesh1; кэшируется на время перебора
+    def _relative_pose(self, match: GraphMatch) -> Matrix | None:
+        if match.match_type != MatchType.FACE or match.rotation is None:
+            return None
+        key = id(match)
+        if key not in self._relative:
+            identity = Matrix.Identity(4)
+            self._relative[key] = align_match(match, self.meshes, identity, identity)
+        return self._relative[key]
+
+    def _root(self, name: str) -> str:
+        placed = self.poses.get(name)
+        return placed[0] if placed is not None else name
+
+    # Меши компоненты с позами относительно её корня; непоставленный меш — компонента из себя самого
+    def _component(self, name: str) -> Dict[str, Matrix]:
+        placed = self.poses.get(name)
+        if placed is None:
+            return {name: Matrix.Identity(4)}
+        return {member: self.poses[member][1] for member in self.members[placed[0]]}
+
+    def _loose_consistent(self, match: GraphMatch) -> bool:
+        if self._root(match.mesh1) == self._root(match.mesh2):
+            return self._contact_consistent(match)
+        return self._hinge_feasible(match)
+
+    # Контакт совпадения без жёсткой позы, когда оба меша в одной компоненте
+    def _contact_consistent(self, match: GraphMatch) -> bool:
+        placed1, placed2 = self.poses[match.mesh1], self.poses[match.mesh2]
+        if match.match_type == MatchType.FACE:
+            fe1 = self.meshes[match.mesh1].face(match.indices[0])
+            fe2 = self.meshes[match.mesh2].face(match.indices[1])
+            dir1 = (placed1[1].to_3x3() @ Vector(fe1.normal)).normalized()
+            # Нормали прилегающих граней противоположны
+            dir2 = -(placed2[1].to_3x3() @ Vector(fe2.normal)).normalized()
+        else:
+            fe1 = self.meshes[match.mesh1].edge(match.indices[0])
+            fe2 = self.meshes[match.mesh2].edge(match.indices[1])
+            dir1 = placed1[1].to_3x3() @ Vector(fe1.direction)
+            dir2 = placed2[1].to_3x3() @ Vector(fe2.direction)
+        if abs(dir1.dot(dir2)) < self._cos_angle * dir1.length * dir2.length:
+            return False
+        c1 = placed1[1] @ _center(fe1)
+        c2 = placed2[1] @ _center(fe2)
+        limit = LOOP_CLOSURE_DISTANCE_RATIO * min(self._radius(match.mesh1), self._radius(match.mesh2))
+        return (c1 - c2).length <= limit
+
+    # Ось шарнира в локальных координатах mesh1 (точка, единичное направление, базис поперёк оси)
+    # и позы mesh2 при нулевом угле:
+    # поза align_match, а для ребра ещё и она же, перевёрнутая поворотом на π поперёк ребра
+    def _hinge(self, match: GraphMatch) -> Tuple[Vector, Vector, Vector, Vector, List[Matrix]]:
+        key = id(match)
+        if key not in self._hinges:
+            fe = self._feature(match.mesh1, match.match_type, match.indices[0])
+            center = _center(fe)
+            identity = Matrix.Identity(4)
+            base = align_match(match, self.meshes, identity, identity)
+            axis = _direction(fe, match.match_type).normalized()
+            e1, e2 = _basis(axis)
+            if match.match_type == MatchType.FACE:
+                branches = [base]
+            else:
+                flip = Matrix.Translation(center) @ Quaternion(e1, math.pi).to_matrix().to_4x4() \
+                    @ Matrix.Translation(-center)
+                branches = [base, flip @ base]
+            self._hinges[key] = (center, axis, e1, e2, branches)
+        return self._hinges[key]
+
+    # Есть ли угол шарнира match, при котором компонента mesh2 не накладывается на компоненту mesh1
+    # и сходятся все остальные шарниры между этими компонентами. Расчёт в локальных координатах mesh1:
+    # центроиды и контакты компоненты mesh2 вращаются вокруг оси, условия на угол — дуги окружности
+    def _hinge_feasible(self, match: GraphMatch) -> bool:
+        # Между двумя непоставленными мешами других шарниров нет (у пары одно совпадение в сети),
+        # а наложение двух мешей при всех углах почти не встречается — проверка не стоит своего времени
+        if match.mesh1 not in self.poses and match.mesh2 not in self.poses:
+            return True
+        roots = {self._root(match.mesh1), self._root(match.mesh2)}
+        others = [m for m in self._loose if m is not match and {self._root(m.mesh1), self._root(m.mesh2)} == roots]
+        key = (id(match), self._versions.get(self._root(match.mesh1)), self._versions.get(self._root(match.mesh2)),
+               *(id(m) for m in others))
+        if key not in self._feasible:
+            if len(self._feasible) >= POSE_HINGE_CACHE_SIZE:
+                self._feasible.clear()
+            self._feasible[key] = self._hinge_angles_exist(match, others)
+        return self._feasible[key]
+
+    def _hinge_angles_exist(self, match: GraphMatch, others: List[GraphMatch]) -> bool:
+        members_d, members_s = self._component(match.mesh1), self._component(match.mesh2)
+        to_local = members_d[match.mesh1].inverted()
+        from_s = members_s[match.mesh2].inverted()
+        center, axis, e1, e2, branches = self._hinge(match)
+
+        fixed = np.array([tuple(to_local @ pose @ self._centroid(name)) for name, pose in members_d.items()])
+        limits = POSE_OVERLAP_RATIO * np.minimum.outer([self._radius(name) for name in members_s],
+                                                       [self._radius(name) for name in members_d])
+        frame = np.array([tuple(center), tuple(axis), tuple(e1), tuple(e2)])
+        for branch in branches:
+            place = branch @ from_s
+            moving = np.array([tuple(place @ pose @ self._centroid(name)) for name, pose in members_s.items()])
+            allowed = _clearance_arcs(moving, fixed, limits, frame)
+
+            for other in others:
+                if not allowed:
+                    break
+                # Контакт другого шарнира: сторона из компоненты mesh2 вращается, из компоненты mesh1 — нет
+                rotating, still = (other.mesh2, other.mesh1) if other.mesh2 in members_s else (other.mesh1, other.mesh2)
+                index = {other.mesh1: other.indices[0], other.mesh2: other.indices[1]}
+                fe_r = self._feature(rotating, other.match_type, index[rotating])
+                fe_s = self._feature(still, other.match_type, index[still])
+                pose_r, pose_s = place @ members_s[rotating], to_local @ members_d[still]
+                limit = LOOP_CLOSURE_DISTANCE_RATIO * min(self._radius(rotating), self._radius(still))
+                allowed = _intersect(allowed, _distance_arcs(pose_r @ _center(fe_r), pose_s @ _center(fe_s),
+                                                             center, axis, e1, e2, limit, True))
+                # Направления сверяются с точностью до знака, как в _contact_consistent
+                v = pose_r.to_3x3() @ _direction(fe_r, other.match_type)
+                t = pose_s.to_3x3() @ _direction(fe_s, other.match_type)
+                allowed = _intersect(allowed, _alignment_arcs(v, t, axis, e1, e2, self._cos_angle)
+                                     + _alignment_arcs(v, -t, axis, e1, e2, self._cos_angle))
+            if allowed:
+                return True
+        return False
+
+    def _feature(self, name: str, match_type: MatchType, index: int):
+        mesh = self.meshes[name]
+        return mesh.face(index) if match_type == MatchType.FACE else mesh.edge(index)
+
+    def _same_pose(self, name: str, a: Matrix, b: Matrix) -> bool:
+        if abs(a.to_quaternion().rotation_difference(b.to_quaternion()).w) < self._cos_half_angle:
+            return False
+        centroid = self._centroid(name)
+        return ((a @ centroid) - (b @ centroid)).length <= LOOP_CLOSURE_DISTANCE_RATIO * self._radius(name)
+
+    def _overlaps(self, a: str, pose_a: Matrix, b: str, pose_b: Matrix) -> bool:
+        distance = ((pose_a @ self._centroid(a)) - (pose_b @ self._centroid(b))).length
+        return distance < POSE_OVERLAP_RATIO * min(self._radius(a), self._radius(b))
+
+    def _centroid(self, name: str) -> Vector:
+        if name not in self._centroids:
+            points = [Vector(v) for f in self.meshes[name].faces for v in f.vertices]
+            centroid = sum(points, Vector()) / len(points)
+            self._centroids[name] = centroid
+            self._radii[name] = max((p - centroid).length for p in points)
+        return self._centroids[name]
+
+    def _radius(self, name: str) -> float:
+        self._centroid(name)
+        return self._radii[name]
+
+
+def _center(fe) -> Vector:
+    return sum((Vector(v) for v in fe.vertices), Vector()) / len(fe.vertices)
+
+
+def _direction(fe, match_type: MatchType) -> Vector:
+    return Vector(fe.normal) if match_type == MatchType.FACE else Vector(fe.direction)
+
+
+# Ортонормированный базис плоскости, перпендикулярной axis: углы поворота отсчитываются от e1 к e2
+def _basis(axis: Vector) -> Tuple[Vector, Vector]:
+    helper = Vector((1.0, 0.0, 0.0)) if abs(axis[0]) < 0.9 else Vector((0.0, 1.0, 0.0))
+    e1 = axis.cross(helper).normalized()
+    return e1, axis.cross(e1)
+
+
+# Углы θ, при которых a + b·cos(θ − phase) ≥ threshold
+def _cos_arcs(a: float, b: float, phase: float, threshold: float) -> Arcs:
+    if b < 0:
+        b, phase = -b, phase + math.pi
+    if b < 1e-12:
+        return [(0.0, _FULL_TURN)] if a >= threshold - _ARC_EPSILON else []
+    k = (threshold - a) / b - _ARC_EPSILON
+    if k <= -1:
+        return [(0.0, _FULL_TURN)]
+    if k > 1:
+        return []
+    half = math.acos(k)
+    start = (phase - half) % _FULL_TURN
+    end = start + 2 * half
+    if end <= _FULL_TURN:
+        return [(start, end)]
+    return [(0.0, end - _FULL_TURN), (start, _FULL_TURN)]
+
+
+# Углы поворота точек moving вокруг оси frame = (точка, ось, e1, e2), при которых каждая дальше limits
+# от каждой точки fixed. Пары, которые расходятся при любом угле, отбрасываются сразу: их большинство
+def _clearance_arcs(moving: np.ndarray, fixed: np.ndarray, limits: np.ndarray, frame: np.ndarray) -> Arcs:
+    along_m, radius_m, phi_m = _polar_all(moving - frame[0], frame)
+    along_f, radius_f, phi_f = _polar_all(fixed - frame[0], frame)
+    a = (along_m[:, None] - along_f[None]) ** 2 + radius_m[:, None] ** 2 + radius_f[None] ** 2
+    b = 2 * radius_m[:, None] * radius_f[None]
+    # Расстояние меняется от sqrt(a − b) до sqrt(a + b)
+    limits_sq = limits ** 2
+    if np.any(a + b < limits_sq - _ARC_EPSILON):
+        return []
+    allowed: Arcs = [(0.0, _FULL_TURN)]
+    for i, j in zip(*np.nonzero(a - b < limits_sq - _ARC_EPSILON)):
+        phase = float(phi_f[j] - phi_m[i])
+        allowed = _intersect(allowed, _cos_arcs(float(a[i, j]), -float(b[i, j]), phase, float(limits_sq[i, j])))
+        if not allowed:
+            break
+    return allowed
+
+
+def _polar_all(points: np.ndarray, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    along = points @ frame[1]
+    x, y = points @ frame[2], points @ frame[3]
+    return along, np.hypot(x, y), np.arctan2(y, x)
+
+
+def _polar(v: Vector, axis: Vector, e1: Vector, e2: Vector) -> Tuple[float, float, float]:
+    along = v.dot(axis)
+    radial = v - axis * along
+    return along, radial.length, math.atan2(radial.dot(e2), radial.dot(e1))
+
+
+# Углы поворота точки x вокруг оси (center, axis), при которых она дальше limit от неподвижной y
+# (within=False) или не дальше (within=True)
+def _distance_arcs(x: Vector, y: Vector, center: Vector, axis: Vector, e1: Vector, e2: Vector,
+                   limit: float, within: bool) -> Arcs:
+    ax, rx, phi_x = _polar(x - center, axis, e1, e2)
+    ay, ry, phi_y = _polar(y - center, axis, e1, e2)
+    # |x(θ) − y|² = (ax − ay)² + rx² + ry² − 2·rx·ry·cos(θ − (phi_y − phi_x))
+    a = (ax - ay) ** 2 + rx ** 2 + ry ** 2
+    if within:
+        return _cos_arcs(-a, 2 * rx * ry, phi_y - phi_x, -limit ** 2)
+    return _cos_arcs(a, -2 * rx * ry, phi_y - phi_x, limit ** 2)
+
+
+# Углы поворота направления v вокруг оси, при которых угол между v и неподвижным t не больше arccos(cos_angle)
+def _alignment_arcs(v: Vector, t: Vector, axis: Vector, e1: Vector, e2: Vector, cos_angle: float) -> Arcs:
+    av, rv, phi_v = _polar(v, axis, e1, e2)
+    at, rt, phi_t = _polar(t, axis, e1, e2)
+    return _cos_arcs(av * at, rv * rt, phi_t - phi_v, cos_angle * v.length * t.length)
+
+
+# Пересечение множеств углов; b может состоять из перекрывающихся интервалов
+def _intersect(a: Arcs, b: Arcs) -> Arcs:
+    result = sorted((max(s1, s2), min(e1, e2)) for s1, e1 in a for s2, e2 in b if max(s1, s2) <= min(e1, e2))
+    merged: Arcs = []
+    for start, end in result:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
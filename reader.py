@@ -2,7 +2,10 @@ import json
 from typing import List
 from geometry_connector.models import Mesh, Face, Edge
 from geometry_connector.constants import JSON_PATH
-from mathutils import Vector
+from geometry_connector.logger import get_logger
+from mathutils import Vector, Matrix
+
+log = get_logger("ui")
 
 
 class JsonMeshReader:
@@ -41,9 +44,10 @@ class JsonMeshReader:
                 convex_points = md['convex_points'],
                 concave_points = md['concave_points'],
                 flat_points = md['flat_points'],
+                matrix_world = Matrix(md['matrix_world']) if 'matrix_world' in md else Matrix.Identity(4),
                 faces = faces
             )
             meshes.append(mesh)
 
-        print(f"Mesh-объекты считаны из файла: {filepath}")
+        log.info("Mesh-объекты считаны из файла: %s", filepath)
         return meshes
\ No newline at end of file
@@ -0,0 +1,97 @@
+from typing import Dict, Iterable, List, Set, Optional
+from geometry_connector.constants import SCENE_MATRIX_TOLERANCE
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.logger import get_logger
+from geometry_connector.models import TransformMatch
+from mathutils import Matrix
+
+log = get_logger("build")
+
+
+# Исходные матрицы объектов, общие для нескольких запусков: после Stop фрагменты остаются в позе варианта,
+# и новый запуск берёт исходную матрицу из первого снимка, а не из текущего положения.
+# Ключ — obj.session_uid: объект с тем же именем может быть из другого файла.
+# Снимок забывается, если матрица объекта отличается от последней записанной — объект сдвинули руками,
+# и его текущее положение становится новой исходной расстановкой
+class SceneSnapshots:
+    def __init__(self):
+        self.original: Dict[int, Matrix] = {}
+        self.written: Dict[int, Matrix] = {}             # Последняя матрица, записанная SceneApplier (или снятая)
+
+    def original_of(self, obj) -> Matrix:
+        uid = obj.session_uid
+        if uid in self.written and not _close(self.written[uid], obj.matrix_world):
+            log.debug("[scene_apply] %s сдвинут вручную, исходное положение снимается заново", obj.name)
+            del self.original[uid]
+        if uid not in self.original:
+            self.original[uid] = obj.matrix_world.copy()
+            self.written[uid] = obj.matrix_world.copy()
+        return self.original[uid]
+
+    def record(self, obj, matrix: Matrix):
+        self.written[obj.session_uid] = matrix.copy()
+
+    def clear(self):
+        self.original.clear()
+        self.written.clear()
+
+
+# Применение вариантов к сцене по разнице: исходные матрицы снимаются один раз (см. SceneSnapshots),
+# при переключении пишутся только объекты, чья матрица меняется больше допуска,
+# объекты вне варианта возвращаются в исходное положение. Все записи — одно обновление depsgraph.
+# Считается, что между применениями объекты двигает только он
+class SceneApplier:
+    def __init__(self, names: Iterable[str], snapshots: Optional[SceneSnapshots] = None):
+        import bpy
+        self.snapshots = SceneSnapshots() if snapshots is None else snapshots
+        self.original: Dict[str, Matrix] = {}
+        self.current: Dict[str, Matrix] = {}
+        for name in names:
+            obj = bpy.data.objects.get(name)
+            if obj:
+                self.original[name] = self.snapshots.original_of(obj)
+                self.current[name] = obj.matrix_world.copy()
+        # Объекты не в исходном положении
+        self.displaced: Set[str] = {name for name, m in self.current.items() if not _close(m, self.original[name])}
+
+    @instrumented("scene_apply")
+    def apply(self, transforms: List[TransformMatch]) -> int:
+        targets: Dict[str, Matrix] = {tm.src_mesh_name: tm.matrix_world for tm in transforms
+                                      if tm.src_mesh_name in self.original}
+        for name in self.displaced - targets.keys():
+            targets[name] = self.original[name]
+        return self._write(targets)
+
+    # Возврат исходной расстановки: O(число сдвинутых объектов)
+    @instrumented("scene_apply")
+    def restore(self) -> int:
+        return self._write({name: self.original[name] for name in self.displaced})
+
+    def _write(self, targets: Dict[str, Matrix]) -> int:
+        import bpy
+        written = 0
+        for name, matrix in targets.items():
+            if _close(self.current[name], matrix):
+                continue
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                continue
+            obj.matrix_world = matrix
+            self.current[name] = matrix.copy()
+            self.snapshots.record(obj, matrix)
+            if _close(matrix, self.original[name]):
+                self.displaced.discard(name)
+            else:
+                self.displaced.add(name)
+            written += 1
+
+        if written:
+            bpy.context.view_layer.update()
+        instrumentation.count("scene_apply", "objects_written", written)
+        instrumentation.count("scene_apply", "objects_skipped", len(targets) - written)
+        log.debug("[scene_apply] Записано объектов: %d из %d", written, len(targets))
+        return written
+
+
+def _close(a: Matrix, b: Matrix) -> bool:
+    return all(abs(x - y) <= SCENE_MATRIX_TOLERANCE for row_a, row_b in zip(a, b) for x, y in zip(row_a, row_b))
@@ -0,0 +1,199 @@
+import weakref
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import List, Dict, Tuple
+import numpy as np
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Mesh, Face, Edge
+from mathutils import Vector, Matrix
+
+log = get_logger("calculate")
+
+_ALIGN = 64                                             # Выравнивание массивов внутри блока, байт
+
+
+# Всё, что нужно процессу для подключения: имя блока, раскладка массивов и имена мешей.
+# Передаётся в пул вместо самих мешей: сериализуется в сотни байт при любом размере геометрии
+@dataclass(frozen=True)
+class SharedMeshHandle:
+    shm_name: str
+    layout: Tuple[Tuple[str, int, str, Tuple[int, ...]], ...]  # (массив, смещение, dtype, shape)
+    names: Tuple[str, ...]
+
+
+# Плоские массивы фрагментов: ступенчатые списки (грани меша, вершины и рёбра грани, orig_indices)
+# хранятся одним массивом и смещениями *_start длины N + 1
+def _pack(meshes: List[Mesh]) -> Dict[str, np.ndarray]:
+    faces = [f for m in meshes for f in m.faces]
+    edges = [e for f in faces for e in f.edges]
+    points = [(m.convex_points, m.concave_points, m.flat_points) for m in meshes]
+
+    def starts(counts) -> np.ndarray:
+        return np.concatenate(([0], np.cumsum(np.fromiter(counts, dtype=np.int64)))).astype(np.int64)
+
+    def floats(rows, width) -> np.ndarray:
+        return np.array(rows, dtype=np.float64).reshape(-1, *width)
+
+    return {
+        'mesh_face_start': starts(len(m.faces) for m in meshes),
+        'mesh_point_start': starts(len(p) for ps in points for p in ps),
+        'points': np.array([i for ps in points for p in ps for i in p], dtype=np.int64),
+        'mesh_size': floats([m.size for m in meshes], (3,)),
+        'mesh_matrix': floats([[list(row) for row in m.matrix_world] for m in meshes], (4, 4)),
+        'face_index': np.array([f.new_index for f in faces], dtype=np.int64),
+        'face_type': np.array([f.face_type for f in faces], dtype=np.int64),
+        'face_area': np.array([f.area for f in faces], dtype=np.float64),
+        'face_normal': floats([list(f.normal) for f in faces], (3,)),
+        'face_orig_start': starts(len(f.orig_indices) for f in faces),
+        'face_orig': np.array([i for f in faces for i in f.orig_indices], dtype=np.int64),
+        'face_vert_start': starts(len(f.vertices) for f in faces),
+        'face_verts': floats([v for f in faces for v in f.vertices], (3,)),
+        'face_edge_start': starts(len(f.edges) for f in faces),
+        'edge_index': np.array([e.new_index for e in edges], dtype=np.int64),
+        'edge_length': np.array([e.length for e in edges], dtype=np.float64),
+        'edge_verts': floats([e.vertices for e in edges], (2, 3)),
+        'edge_direction': floats([e.direction for e in edges], (3,)),
+        'edge_orig_start': starts(len(e.orig_indices) for e in edges),
+        'edge_orig': np.array([i for e in edges for i in e.orig_indices], dtype=np.int64),
+    }
+
+
+# Меши фрагментов в одном блоке разделяемой памяти. Главный процесс публикует их один раз (publish),
+# процессы пула подключаются по SharedMeshHandle (attach) и получают неизменяемые представления numpy
+# без копирования; объекты Mesh собираются только для тех мешей, к которым процесс обращается.
+# Блок удаляется владельцем при close(), выходе из with или сборке объекта, а если процесс упал —
+# трекером ресурсов multiprocessing
+class SharedMeshStore:
+    def __init__(self, shm: shared_memory.SharedMemory, handle: SharedMeshHandle, owner: bool):
+        self.handle = handle
+        self.owner = owner
+        self._shm = shm
+        self.arrays: Dict[str, np.ndarray] = {}
+        for key, offset, dtype, shape in handle.layout:
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            self.arrays[key] = view
+        self._ids = {name: i for i, name in enumerate(handle.names)}
+        self._meshes: Dict[str, Mesh] = {}
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+    @classmethod
+    def publish(cls, meshes: List[Mesh]) -> "SharedMeshStore":
+        arrays = _pack(meshes)
+        layout = []
+        size = 0
+        for key, array in arrays.items():
+            layout.append((key, size, array.dtype.str, array.shape))
+            size += -(-array.nbytes // _ALIGN) * _ALIGN
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (key, offset, _, _), array in zip(layout, arrays.values()):
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)[...] = array
+        handle = SharedMeshHandle(shm_name=shm.name, layout=tuple(layout), names=tuple(m.name for m in meshes))
+        log.info("Меши опубликованы в разделяемой памяти %s: %d шт., %.1f MiB", shm.name, len(meshes), size / 2 ** 20)
+        return cls(shm, handle, owner=True)
+
+    @classmethod
+    def attach(cls, handle: SharedMeshHandle) -> "SharedMeshStore":
+        try:
+            # Подключившийся процесс не должен регистрировать блок в трекере: удаляет его только владелец
+            shm = shared_memory.SharedMemory(name=handle.shm_name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=handle.shm_name)
+        return cls(shm, handle, owner=False)
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return self.handle.names
+
+    def close(self):
+        self._meshes.clear()
+        self.arrays.clear()
+        self._finalizer()
+
+    def __enter__(self) -> "SharedMeshStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Диапазон граней меша в общих массивах
+    def face_range(self, name: str) -> Tuple[int, int]:
+        i = self._ids[name]
+        starts = self.arrays['mesh_face_start']
+        return int(starts[i]), int(starts[i + 1])
+
+    def mesh(self, name: str) -> Mesh:
+        mesh = self._meshes.get(name)
+        if mesh is None:
+            mesh = self._meshes[name] = self._build_mesh(name)
+        return mesh
+
+    def meshes(self) -> Dict[str, Mesh]:
+        return {name: self.mesh(name) for name in self.names}
+
+    def _build_mesh(self, name: str) -> Mesh:
+        a = self.arrays
+        i = self._ids[name]
+        f0, f1 = self.face_range(name)
+        point_start = a['mesh_point_start'][3 * i:3 * i + 4].tolist()
+        convex, concave, flat = (a['points'][s:e].tolist() for s, e in zip(point_start, point_start[1:]))
+
+        # Смещения берутся только в пределах меша: сборка одного меша не зависит от размера всего набора
+        vert_start = a['face_vert_start'][f0:f1 + 1].tolist()
+        edge_start = a['face_edge_start'][f0:f1 + 1].tolist()
+        face_orig_start = a['face_orig_start'][f0:f1 + 1].tolist()
+        e0, e1 = edge_start[0], edge_start[-1]
+        edge_orig_start = a['edge_orig_start'][e0:e1 + 1].tolist()
+
+        faces: List[Face] = []
+        for f in range(f1 - f0):
+            edges = [Edge(
+                new_index=int(a['edge_index'][e]),
+                orig_indices=a['edge_orig'][edge_orig_start[e - e0]:edge_orig_start[e - e0 + 1]].tolist(),
+                length=float(a['edge_length'][e]),
+                vertices=a['edge_verts'][e].tolist(),
+                direction=a['edge_direction'][e].copy()
+            ) for e in range(edge_start[f], edge_start[f + 1])]
+            faces.append(Face(
+                new_index=int(a['face_index'][f0 + f]),
+                orig_indices=a['face_orig'][face_orig_start[f]:face_orig_start[f + 1]].tolist(),
+                area=float(a['face_area'][f0 + f]),
+                face_type=int(a['face_type'][f0 + f]),
+                normal=Vector(a['face_normal'][f0 + f].tolist()),
+                edges=edges,
+                vertices=a['face_verts'][vert_start[f]:vert_start[f + 1]].tolist()
+            ))
+
+        return Mesh(
+            name=name,
+            size=a['mesh_size'][i].tolist(),
+            convex_points=convex,
+            concave_points=concave,
+            flat_points=flat,
+            matrix_world=Matrix(a['mesh_matrix'][i].tolist()),
+            faces=faces
+        )
+
+
+def _release(shm: shared_memory.SharedMemory, owner: bool):
+    try:
+        shm.close()
+    except BufferError:
+        # Снаружи ещё живут представления массивов: отображение снимется при выходе процесса
+        log.warning("Блок %s ещё используется и будет закрыт при выходе процесса", shm.name)
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Подключения процесса пула: задачи с одним и тем же блоком переиспользуют одно отображение
+_attached: Dict[str, SharedMeshStore] = {}
+
+
+def attach_store(handle: SharedMeshHandle) -> SharedMeshStore:
+    store = _attached.get(handle.shm_name)
+    if store is None:
+        store = _attached[handle.shm_name] = SharedMeshStore.attach(handle)
+    return store
@@ -0,0 +1,156 @@
+import itertools
+import math
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Set, Iterator, Sequence
+from geometry_connector.connect_geometry import EdgeLengthIndex, match_face_edges, face_pair_coeff, rotation_checks
+from geometry_connector.constants import MIN_MATCH_FACE_COEFF, NORMAL_PENALTY
+from geometry_connector.enums import MatchType
+from geometry_connector.graph_utils import sort_graph, generate_networks
+from geometry_connector.instrumentation import instrumented
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Mesh, MeshGraph, GraphMatch
+from mathutils import Matrix
+
+log = get_logger("connect")
+
+
+@dataclass
+class SweepPoint:
+    connected_edge_angle_threshold: float
+    area_threshold: float
+    edge_length_threshold: float
+    face_matches: int = 0
+    edge_matches: int = 0
+    networks: int = 0
+    networks_capped: bool = False                       # Перебор сетей остановлен на max_networks
+
+
+# Графы для всех точек сетки порогов за один проход. Общая часть считается один раз:
+# сопоставление рёбер — по разу на порог длины, площади сравниваются готовыми числами,
+# вращения и косинусы для проверки нормалей кэшируются по набору совпавших рёбер и не зависят от угла.
+# Результат в каждой точке совпадает с GeometryConnector(...).build_mesh_graph
+def sweep_graphs(meshes: List[Mesh], angle_thresholds: Sequence[float], area_thresholds: Sequence[float],
+                 edge_length_thresholds: Sequence[float]) -> Iterator[Tuple[SweepPoint, MeshGraph]]:
+    grid = list(itertools.product(range(len(angle_thresholds)), range(len(area_thresholds)),
+                                  range(len(edge_length_thresholds))))
+    cos_thresholds = [math.cos(a) for a in angle_thresholds]
+
+    # Для каждой точки: совпадения FACE в порядке построения и занятые грани по парам мешей
+    face_matches: Dict[Tuple[int, int, int], List[GraphMatch]] = {point: [] for point in grid}
+    face_matched: Dict[Tuple[int, int, int], Dict[Tuple[str, str], Tuple[Set[int], Set[int]]]] = \
+        {point: {} for point in grid}
+    face_posed: Dict[Tuple[int, int, int], Set[Tuple[str, str]]] = {point: set() for point in grid}
+
+    for i, m1 in enumerate(meshes):
+        for m2 in meshes[i + 1:]:
+            # Вращения по набору совпавших рёбер: (вращение, базис невырожден, мин. косинус рёбер, косинус нормалей)
+            rotations: Dict[tuple, tuple] = {}
+            quaternions: Dict[tuple, object] = {}
+
+            for e_idx, edge_threshold in enumerate(edge_length_thresholds):
+                candidates = []
+                for f1 in m1.faces:
+                    n1 = len(f1.edges)
+                    for f2 in m2.faces:
+                        matched_edges, missing = match_face_edges(f1.edges, f2.edges, edge_threshold)
+                        coeff_ok = face_pair_coeff(True, n1, len(f2.edges), missing)
+                        if len(matched_edges) > 2 or coeff_ok >= MIN_MATCH_FACE_COEFF:
+                            key = (f1.new_index, f2.new_index,
+                                   tuple((a.new_index, b.new_index) for a, b in matched_edges))
+                            coeff_fail = face_pair_coeff(False, n1, len(f2.edges), missing)
+                            candidates.append((f1, f2, matched_edges, coeff_ok, coeff_fail, key))
+
+                pending = [c for c in candidates if len(c[2]) > 2 and c[5] not in rotations]
+                if pending:
+                    r, valid, edge_dots, normal_dots = rotation_checks(pending)
+                    for p, c in enumerate(pending):
+                        rotations[c[5]] = (r[p], bool(valid[p]), float(edge_dots[p]), float(normal_dots[p]))
+
+                for g_idx, a_idx in itertools.product(range(len(angle_thresholds)), range(len(area_thresholds))):
+                    point = (g_idx, a_idx, e_idx)
+                    cos_th = cos_thresholds[g_idx]
+                    area_threshold = area_thresholds[a_idx]
+                    for f1, f2, matched_edges, coeff_ok, coeff_fail, key in candidates:
+                        coeff = coeff_ok if abs(f1.area - f2.area) <= area_threshold else coeff_fail
+                        rotation = None
+                        if len(matched_edges) > 2:
+                            r, valid, edge_dot, normal_dot = rotations[key]
+                            if not (valid and edge_dot >= cos_th and normal_dot > cos_th):
+                                coeff -= NORMAL_PENALTY
+                            else:
+                                if key not in quaternions:
+                                    quaternions[key] = Matrix(r.tolist()).to_quaternion()
+                                rotation = quaternions[key]
+                                if coeff < MIN_MATCH_FACE_COEFF:
+                                    coeff = MIN_MATCH_FACE_COEFF
+
+                        if coeff >= MIN_MATCH_FACE_COEFF:
+                            used1, used2 = face_matched[point].setdefault((m1.name, m2.name), (set(), set()))
+                            used1.add(f1.new_index)
+                            used2.add(f2.new_index)
+                            if rotation is not None:
+                                face_posed[point].add((m1.name, m2.name))
+                            face_matches[point].append(GraphMatch(
+                                mesh1=m1.name,
+                                mesh2=m2.name,
+                                match_type=MatchType.FACE,
+                                indices=(f1.new_index, f2.new_index),
+                                coeff=coeff,
+                                edges=matched_edges,
+                                rotation=rotation.copy() if rotation is not None else None
+                            ))
+
+    # Рёбра: индекс длин общий для всех точек, меняются только порог и занятые грани
+    length_indexes = {m.name: EdgeLengthIndex(m) for m in meshes}
+    for point in grid:
+        g_idx, a_idx, e_idx = point
+        graph = MeshGraph()
+        for match in face_matches.pop(point):
+            graph.add_match(match)
+
+        edge_count = 0
+        for i, m1 in enumerate(meshes):
+            for m2 in meshes[i + 1:]:
+                # Как в build_mesh_graph: пары с проверенным FACE-совпадением рёбрами не сопоставляются
+                if (m1.name, m2.name) in face_posed[point]:
+                    continue
+                used1, used2 = face_matched[point].get((m1.name, m2.name), (set(), set()))
+                for e1, e2, coeff in length_indexes[m1.name].query(length_indexes[m2.name], used1, used2,
+                                                                   edge_length_thresholds[e_idx]):
+                    edge_count += 1
+                    graph.add_match(GraphMatch(
+                        mesh1=m1.name,
+                        mesh2=m2.name,
+                        match_type=MatchType.EDGE,
+                        indices=(e1.new_index, e2.new_index),
+                        coeff=coeff
+                    ))
+
+        face_count = sum(len(v) for d in graph.connections.values() for v in d.values()) // 2 - edge_count
+        yield SweepPoint(
+            connected_edge_angle_threshold=angle_thresholds[g_idx],
+            area_threshold=area_thresholds[a_idx],
+            edge_length_threshold=edge_length_thresholds[e_idx],
+            face_matches=face_count,
+            edge_matches=edge_count
+        ), graph
+
+
+# Число совпадений и сетей (не больше max_networks) для каждой точки сетки порогов.
+# С prune_poses сети считаются с отсечением противоречивых поз, как в панели с этим флагом
+@instrumented("threshold_sweep")
+def sweep_thresholds(meshes: List[Mesh], angle_thresholds: Sequence[float], area_thresholds: Sequence[float],
+                     edge_length_thresholds: Sequence[float], max_networks: int = 1000,
+                     prune_poses: bool = False) -> List[SweepPoint]:
+    points: List[SweepPoint] = []
+    meshes_dictionary = {m.name: m for m in meshes} if prune_poses else None
+    for point, graph in sweep_graphs(meshes, angle_thresholds, area_thresholds, edge_length_thresholds):
+        if max_networks > 0:
+            point.networks = sum(1 for _ in itertools.islice(generate_networks(sort_graph(graph), meshes_dictionary),
+                                                           max_networks))
+            point.networks_capped = point.networks == max_networks
+        log.info("Пороги: угол=%.5f, площадь=%.6f, длина=%.6f -> FACE=%d, EDGE=%d, сетей=%d%s",
+                 point.connected_edge_angle_threshold, point.area_threshold, point.edge_length_threshold,
+                 point.face_matches, point.edge_matches, point.networks, "+" if point.networks_capped else "")
+        points.append(point)
+    return points
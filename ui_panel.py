@@ -1,20 +1,41 @@
-﻿import math
+﻿import itertools
+import logging
 import bpy
-from typing import Dict, List
-from bpy.props import FloatProperty, IntProperty
+from typing import Dict, List, Tuple
+from bpy.app.handlers import persistent
+from bpy.props import FloatProperty, IntProperty, EnumProperty, BoolProperty
+from geometry_connector import instrumentation
 from geometry_connector.calculate_geometry import GeometryCalculator
 from geometry_connector.connect_geometry import GeometryConnector
-from geometry_connector.constants import BATCH_SIZE
-from geometry_connector.graph_utils import sort_graph, Network, generate_networks
+from geometry_connector.faces import ModalFaceHighlighter
+from geometry_connector.constants import BATCH_SIZE, DEFAULT_COPLANAR_ANGLE_THRESHOLD, \
+    DEFAULT_COPLANAR_DISTANCE_THRESHOLD, DEFAULT_CURVATURE_THRESHOLD, DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, \
+    DEFAULT_FACE_AREA_THRESHOLD, DEFAULT_EDGE_LENGTH_THRESHOLD, DEFAULT_BEAM_WIDTH, DEFAULT_BEAM_TIME_LIMIT, \
+    DEFAULT_RANK_TOP_N
+from geometry_connector.graph_cache import cached_mesh_graph, connector_graph_key
+from geometry_connector.graph_utils import sort_graph, Network, generate_networks, beam_search_networks
+from geometry_connector.greedy_assembly import greedy_assemble
+from geometry_connector.logger import get_logger, set_stage_level, STAGES, LEVELS, DEFAULT_LEVEL
 from geometry_connector.build_geometry import assemble_network, TransformMatch
-from geometry_connector.build_geometry import apply_transforms_to_scene
 from geometry_connector.models import Mesh, MeshGraph
+from geometry_connector.network_index import NetworkIndex, NetworkIndexTooLarge
+from geometry_connector.scene_applier import SceneApplier, SceneSnapshots
+from geometry_connector.variant_ranking import rank_networks
+from geometry_connector.variant_store import VariantStore
 from geometry_connector.writer import Writer
 
-_cached_networks : list[Network] = None
+log = get_logger("ui")
+
+_variant_store : VariantStore = None
 _cached_meshes_dictionary : Dict[str, Mesh] = None
 _cached_sorted_graph : MeshGraph = None
 _generated_networks = None
+_scene_applier : SceneApplier = None
+_scene_snapshots = SceneSnapshots()  # Исходные matrix_world объектов, живут между запусками до загрузки файла
+_network_index : NetworkIndex = None
+_shown_index : int = None
+_ranked_variants : List[int] = None
+_greedy_transforms : List[TransformMatch] = None  # Результат жадной сборки: вариантов нет, но есть Restore и Stop
 
 
 class GeometryResolverNPanelBuilder(bpy.types.Panel):
@@ -25,11 +46,10 @@ class GeometryResolverNPanelBuilder(bpy.types.Panel):
     bl_category = 'Geometry Resolver'
 
     def draw(self, context):
-        global _cached_networks
         layout = self.layout
         scene = context.scene
 
-        if _cached_networks is None:
+        if _variant_store is None and _network_index is None and _greedy_transforms is None:
             # Выводим константы
             layout.label(text="Thresholds:")
             layout.prop(scene, "coplanar_angle_threshold")
@@ -38,18 +58,83 @@ class GeometryResolverNPanelBuilder(bpy.types.Panel):
             layout.prop(scene, "connected_edge_angle_threshold")
             layout.prop(scene, "face_area_threshold")
             layout.prop(scene, "edge_length_threshold")
+            layout.prop(scene, "parallel_extraction")
+            layout.prop(scene, "use_match_table")
+            layout.prop(scene, "use_graph_cache")
+            layout.prop(scene, "assembly_mode")
+            if scene.assembly_mode == 'BEAM':
+                layout.prop(scene, "beam_width")
+                layout.prop(scene, "beam_time_limit")
+            elif scene.assembly_mode == 'EXHAUSTIVE':
+                layout.prop(scene, "random_access_variants")
+                if not scene.random_access_variants:
+                    layout.prop(scene, "prune_poses")
+            if scene.assembly_mode != 'GREEDY' and not scene.random_access_variants:
+                layout.prop(scene, "rank_variants")
+                if scene.rank_variants:
+                    layout.prop(scene, "rank_top_n")
+            layout.separator()
+
+            # Уровни логирования по стадиям
+            layout.label(text="Logging:")
+            for stage in STAGES:
+                layout.prop(scene, _log_level_prop(stage))
+            layout.separator()
+
+            layout.label(text="Instrumentation:")
+            layout.prop(scene, "instrumentation_track_memory")
+            layout.prop(scene, "instrumentation_dump_report")
             layout.separator()
 
             # Кнопка запуска соединения
             layout.operator(ResolveGeometryButton.bl_idname, text="Connect Fragments", icon='PLAY')
             layout.separator()
+        elif _greedy_transforms is not None:
+            layout.label(text=f"Greedy assembly: {len(_greedy_transforms)} fragments placed")
+            _draw_result_actions(layout)
         else:
             # Переключение возможных вариантов соединений
             row = layout.row(align=True)
             row.operator(PreviousVariant.bl_idname, text="", icon='TRIA_LEFT')
             row.prop(scene, "network_variant_index", text="")
             row.operator(NextVariant.bl_idname, text="", icon='TRIA_RIGHT')
-            layout.operator(StopResolve.bl_idname, text="Stop", icon='PAUSE')
+            total = _variant_count()
+            if _network_index is not None:
+                # Номера индекса идут в порядке перебора без отсечения поз
+                layout.label(text=f"Variants: {total} (random access, no pose pruning)")
+            elif total is not None:
+                layout.label(text=f"Variants: {total}")
+            if _ranked_variants:
+                layout.label(text="Best: " + ", ".join(str(i) for i in _ranked_variants[:5]))
+            _draw_result_actions(layout)
+
+        _draw_instrumentation(layout)
+
+
+# Кнопки, общие для всех режимов после Connect
+def _draw_result_actions(layout):
+    if _cached_sorted_graph is not None:
+        highlight = layout.operator(ModalFaceHighlighter.bl_idname, text="Highlight Matched Faces", icon='FACESEL')
+        highlight.mode = 'MATCHES'
+    layout.operator(RestoreLayout.bl_idname, text="Restore Original", icon='LOOP_BACK')
+    layout.operator(StopResolve.bl_idname, text="Stop", icon='PAUSE')
+
+
+# Время, память и счётчики стадий последнего запуска
+def _draw_instrumentation(layout):
+    report = instrumentation.get_report()
+    if not report:
+        return
+
+    box = layout.box()
+    box.label(text="Statistics:")
+    for name, stats in report.items():
+        text = f"{name}: {stats['seconds']:.3f} s"
+        if stats['peak_bytes']:
+            text += f", {stats['peak_bytes'] / 2 ** 20:.1f} MiB"
+        box.label(text=text)
+        for counter, value in stats['counters'].items():
+            box.label(text=f"    {counter}: {value}")
 
 
 class ResolveGeometryButton(bpy.types.Operator):
@@ -59,35 +144,86 @@ class ResolveGeometryButton(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
-        global _cached_networks, _cached_meshes_dictionary, _generated_networks, _cached_sorted_graph
+        global _variant_store, _cached_meshes_dictionary, _generated_networks, _cached_sorted_graph, _scene_applier, \
+            _network_index, _shown_index, _ranked_variants, _greedy_transforms
         scene = context.scene
+        _sync_log_levels(scene)
+        _variant_store = _network_index = _shown_index = _ranked_variants = _greedy_transforms = None
+        instrumentation.reset()
+        instrumentation.set_track_memory(scene.instrumentation_track_memory)
 
         meshes_list = GeometryCalculator().calculate()
         meshes_dictionary: Dict[str, Mesh] = {m.name: m for m in meshes_list}
         _cached_meshes_dictionary = meshes_dictionary
+        _scene_applier = SceneApplier(meshes_dictionary, _scene_snapshots)
 
-        graph = GeometryConnector().build_mesh_graph(meshes_list)
+        connector = GeometryConnector()
+        if scene.use_graph_cache:
+            graph = cached_mesh_graph(connector, meshes_list)
+        else:
+            graph = connector.build_mesh_graph(meshes_list)
         sorted_graph = sort_graph(graph)
         _cached_sorted_graph = sorted_graph
-        Writer.print_graph(sorted_graph)
+        if get_logger("graph").isEnabledFor(logging.DEBUG):
+            Writer.print_graph(sorted_graph)
+
+        # Жадная сборка даёт один результат без перебора вариантов
+        if scene.assembly_mode == 'GREEDY':
+            transforms = greedy_assemble(sorted_graph, meshes_dictionary)
+            _dump_report(scene)
+            if not transforms:
+                self.report({'WARNING'}, "No match networks found")
+                return {'CANCELLED'}
+            _scene_applier.apply(transforms)
+            _greedy_transforms = transforms
+            return {'FINISHED'}
 
-        _generated_networks = generate_networks(sorted_graph)
+        # Без хранилища: любой вариант строится напрямую по номеру
+        if scene.assembly_mode == 'EXHAUSTIVE' and scene.random_access_variants:
+            _network_index = _open_network_index(sorted_graph)
+        if _network_index is not None:
+            if not _network_index.total:
+                self.report({'WARNING'}, "No match networks found")
+                _network_index = None
+                return {'CANCELLED'}
+            result = show_another_network(0)
+            scene.network_variant_index = 0
+            _dump_report(scene)
+            if result:
+                return {'FINISHED'}
+            self.report({'WARNING'}, "Check logs for more information")
+            return {'CANCELLED'}
 
-        _cached_networks = []
-        for _ in range(BATCH_SIZE):
-            try:
-                net = next(_generated_networks)
-            except StopIteration:
-                break
-            _cached_networks.append(net)
+        # Сохранённые варианты не перебираются заново: генератор пропускает уже записанные сети.
+        # Результат лучевого поиска зависит от его параметров, поэтому хранится отдельно
+        store_key = connector_graph_key(connector, meshes_list)
+        if scene.assembly_mode == 'BEAM':
+            store_key += f"_beam{scene.beam_width}_{scene.beam_time_limit:g}"
+            networks = _beam_networks(sorted_graph, scene.beam_width, scene.beam_time_limit)
+        elif scene.prune_poses:
+            # Отсечение меняет перебор, поэтому варианты хранятся отдельно
+            store_key += "_pruned"
+            networks = generate_networks(sorted_graph, meshes_dictionary)
+        else:
+            networks = generate_networks(sorted_graph)
+        _variant_store = VariantStore.open(store_key, list(meshes_dictionary))
+        _generated_networks = itertools.islice(networks, len(_variant_store), None)
+        _fill_variants(_variant_store.current)
 
-        if not _cached_networks:
+        if not len(_variant_store):
             self.report({'WARNING'}, "No match networks found")
+            _variant_store = None
             return {'CANCELLED'}
 
-        scene.network_variant_index = 0
+        idx = min(_variant_store.current, len(_variant_store) - 1)
+        if scene.rank_variants:
+            idx = _rank_variants(scene.rank_top_n, idx)
+        elif idx:
+            log.info("Продолжение с варианта %d", idx)
 
-        result = show_another_network(scene.network_variant_index)
+        result = show_another_network(idx)
+        scene.network_variant_index = idx
+        _dump_report(scene)
 
         if result:
             return {'FINISHED'}
@@ -96,6 +232,11 @@ class ResolveGeometryButton(bpy.types.Operator):
             return {'CANCELLED'}
 
 
+def _dump_report(scene):
+    if scene.instrumentation_dump_report:
+        Writer.write_report(instrumentation.get_report())
+
+
 class PreviousVariant(bpy.types.Operator):
     bl_idname = "geometry_resolver_n_panel.prev_variant"
     bl_label = "←"
@@ -108,6 +249,7 @@ class PreviousVariant(bpy.types.Operator):
         if previous_index != new_idx:
             result = show_another_network(scene.network_variant_index - 1)
             scene.network_variant_index = new_idx if result else previous_index
+            _dump_report(scene)
 
         return {'FINISHED'}
 
@@ -117,15 +259,26 @@ class NextVariant(bpy.types.Operator):
     bl_label = "→"
 
     def execute(self, context):
-        global _cached_networks
         scene = context.scene
 
         previous_index = scene.network_variant_index
         new_idx = context.scene.network_variant_index + 1
 
-        result = show_another_network(scene.network_variant_index - 1)
+        result = show_another_network(new_idx)
         scene.network_variant_index = new_idx if result else previous_index
+        _dump_report(scene)
+
+        return {'FINISHED'}
 
+
+class RestoreLayout(bpy.types.Operator):
+    bl_idname = "geometry_resolver_n_panel.restore_layout"
+    bl_label = "Restore Original"
+    bl_description = "Move the fragments back to where they were before connecting"
+
+    def execute(self, context):
+        if _scene_applier is not None:
+            _scene_applier.restore()
         return {'FINISHED'}
 
 
@@ -135,57 +288,169 @@ class StopResolve(bpy.types.Operator):
     bl_description = "Exit change mode"
 
     def execute(self, context):
-        global _cached_networks, _cached_meshes_dictionary, _generated_networks, _cached_meshes_dictionary
-        _cached_networks = None
-        _cached_meshes_dictionary = None
-        _generated_networks = None
-        _cached_networks = None
-        _cached_meshes_dictionary = None
+        _clear_resolve_state()
         context.scene.network_variant_index = 0
         return {'FINISHED'}
 
 
-def show_another_network(idx : int) -> bool:
-    global _cached_networks, _cached_meshes_dictionary, _generated_networks, _cached_sorted_graph
+def _clear_resolve_state():
+    global _variant_store, _cached_meshes_dictionary, _generated_networks, _cached_sorted_graph, _scene_applier, \
+        _network_index, _shown_index, _ranked_variants, _greedy_transforms
+    _variant_store = None
+    _greedy_transforms = None
+    _network_index = None
+    _shown_index = None
+    _ranked_variants = None
+    _cached_meshes_dictionary = None
+    _generated_networks = None
+    _cached_sorted_graph = None
+    _scene_applier = None
 
-    if not _cached_networks:
-        return False
 
-    if idx >= len(_cached_networks):
+# Снимки и варианты относятся к объектам закрытого файла: в новом файле объекты с теми же именами — другие
+@persistent
+def _on_load_post(*_):
+    _clear_resolve_state()
+    _scene_snapshots.clear()
+
+
+# Индекс с уже посчитанным числом сетей; None, если дерево перебора слишком велико для подсчёта
+def _open_network_index(graph: MeshGraph) -> NetworkIndex | None:
+    index = NetworkIndex(graph)
+    try:
+        index.total
+    except NetworkIndexTooLarge as exc:
+        log.warning("Произвольный доступ к вариантам недоступен (%s), варианты берутся из хранилища", exc)
+        return None
+    return index
+
+
+# Поиск запускается при первом обращении, то есть только если сохранённых вариантов не хватило
+def _beam_networks(graph: MeshGraph, beam_width: int, time_limit: float):
+    yield from beam_search_networks(graph, beam_width, time_limit)
+
+
+# Дописывает в хранилище сети из генератора пачками по BATCH_SIZE, пока не появится вариант idx
+def _fill_variants(idx: int):
+    while idx >= len(_variant_store) and not _variant_store.exhausted:
         for _ in range(BATCH_SIZE):
             try:
                 net = next(_generated_networks)
             except StopIteration:
+                _variant_store.mark_exhausted()
                 break
-            _cached_networks.append(net)
+            _variant_store.append_network(net)
+
+
+# Собирает и оценивает первые top_n вариантов, возвращает номер лучшего (или fallback, если ни один не собрался)
+def _rank_variants(top_n: int, fallback: int) -> int:
+    global _ranked_variants
+    _fill_variants(top_n - 1)
+    networks = [_variant_store.network(i, _cached_sorted_graph) for i in range(min(top_n, len(_variant_store)))]
+    # Внутри Blender только в текущем процессе: запущенный spawn интерпретатор не видит mathutils
+    ranking = rank_networks(networks, _cached_meshes_dictionary, _cached_sorted_graph, processes=1)
+    _ranked_variants = [i for i, _ in ranking]
+    for i, score in ranking:
+        log.info("Вариант %d: score=%.4f, зазор ср.=%.5f, макс.=%.5f, площадь без пары=%.5f, наложений=%d",
+                 i, score.score, score.mean_gap, score.max_gap, score.unmatched_area, score.overlaps)
+    return ranking[0][0] if ranking else fallback
+
+
+# Число вариантов, если оно известно: у индекса сразу, у хранилища — после полного перебора
+def _variant_count() -> int | None:
+    if _network_index is not None:
+        return _network_index.total
+    if _variant_store is not None and _variant_store.exhausted:
+        return len(_variant_store)
+    return None
+
+
+# Граф совпадений и меши последнего Connect (None до него и после Stop) — для подсветки совпадений
+def resolved_match_graph() -> Tuple[MeshGraph | None, Dict[str, Mesh] | None]:
+    return _cached_sorted_graph, _cached_meshes_dictionary
+
+
+# Номер варианта можно ввести в поле: вариант показывается сразу, а недоступный номер откатывается.
+# Операторы переключения сами показывают вариант до записи номера, поэтому повторного показа нет
+def _update_variant_index(self, context):
+    if _shown_index is None or self.network_variant_index == _shown_index:
+        return
+    if not show_another_network(self.network_variant_index):
+        self.network_variant_index = _shown_index
+
+
+def _show_indexed_network(idx: int) -> bool:
+    global _shown_index
+    if idx >= _network_index.total:
+        log.warning("Trying to select network out of bounds")
+        return False
 
-    if idx >= len(_cached_networks):
-        print("WARNING: Trying to select network out of bounds")
+    network_to_show = _network_index.unrank(idx)
+    transforms = assemble_network(network_to_show, _cached_meshes_dictionary, _cached_sorted_graph)
+    if not transforms:
+        log.warning("No transforms could be calculated without conflict")
         return False
 
-    network_to_show: Network = _cached_networks[idx]
+    _scene_applier.apply(transforms)
+    _shown_index = idx
+    if log.isEnabledFor(logging.INFO):
+        log.info("Geometry built using network:")
+        Writer.print_networks([network_to_show])
+    return True
 
-    transforms: List[TransformMatch] = assemble_network(network_to_show, _cached_meshes_dictionary, _cached_sorted_graph)
-    if not transforms:
-        print("WARNING: No transforms could be calculated without conflict")
+
+def show_another_network(idx : int) -> bool:
+    global _shown_index
+    if _network_index is not None:
+        return _show_indexed_network(idx)
+    if _variant_store is None:
         return False
 
-    apply_transforms_to_scene(transforms)
-    print("INFO: Geometry built using network:")
-    Writer.print_networks([network_to_show])
+    _fill_variants(idx)
+    if idx >= len(_variant_store):
+        log.warning("Trying to select network out of bounds")
+        return False
+
+    # Уже собранный вариант берётся из хранилища без повторной сборки
+    if _variant_store.has_transforms(idx):
+        transforms: List[TransformMatch] = _variant_store.transforms(idx)
+    else:
+        network_to_show: Network = _variant_store.network(idx, _cached_sorted_graph)
+        transforms = assemble_network(network_to_show, _cached_meshes_dictionary, _cached_sorted_graph)
+        if not transforms:
+            log.warning("No transforms could be calculated without conflict")
+            return False
+        _variant_store.save_transforms(idx, transforms)
+
+    # Пишутся только объекты, положение которых отличается от текущего варианта
+    _scene_applier.apply(transforms)
+    _variant_store.set_current(idx)
+    _shown_index = idx
+    if log.isEnabledFor(logging.INFO):
+        log.info("Geometry built using network:")
+        Writer.print_networks([_variant_store.network(idx, _cached_sorted_graph)])
 
     return True
 
 
-# Значения по умолчанию
-DEFAULT_COPLANAR_ANGLE_THRESHOLD = math.radians(1)  # Угол, до которого грани считаются компланарными
-DEFAULT_COPLANAR_DISTANCE_THRESHOLD = 0.0001  # Дистанция, до которой грани считаются компланарными
-DEFAULT_CURVATURE_THRESHOLD = 0.01  # Величина отклонения кривизны
-DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD = math.radians(1)  # Минимальный итоговый коэффициент
-DEFAULT_FACE_AREA_THRESHOLD = 0.00001  # Допустимая разница площадей граней для совпадения
-DEFAULT_EDGE_LENGTH_THRESHOLD = 0.00130  # Допустимая разница длин рёбер
+def _log_level_prop(stage: str) -> str:
+    return f"log_level_{stage}"
+
+
+def _make_log_level_update(stage: str):
+    def update(self, context):
+        set_stage_level(stage, getattr(self, _log_level_prop(stage)))
+    return update
+
+
+# Уровни хранятся в сцене, а update не вызывается при загрузке файла — применяем их перед запуском
+def _sync_log_levels(scene):
+    for stage in STAGES:
+        set_stage_level(stage, getattr(scene, _log_level_prop(stage)))
+
 
-classes = [GeometryResolverNPanelBuilder, ResolveGeometryButton, PreviousVariant, NextVariant, StopResolve]
+classes = [GeometryResolverNPanelBuilder, ResolveGeometryButton, PreviousVariant, NextVariant, RestoreLayout,
+           StopResolve, ModalFaceHighlighter]
 
 
 def register():
@@ -229,27 +494,118 @@ def register():
         default=DEFAULT_EDGE_LENGTH_THRESHOLD,
         description="Allowed edge length difference for edge matching"
     )
+    scene.parallel_extraction = BoolProperty(
+        name="Parallel Extraction",
+        default=False,
+        description="Simplify fragments with the NumPy simplifier in a process pool instead of bmesh on the main thread"
+    )
+    scene.use_match_table = BoolProperty(
+        name="Columnar Match Table",
+        default=False,
+        description="Keep graph matches in compact NumPy arrays instead of Python objects (for very large graphs)"
+    )
+    scene.use_graph_cache = BoolProperty(
+        name="Cache Match Graph",
+        default=True,
+        description="Reuse the match graph saved for the same fragments and thresholds"
+    )
+    scene.assembly_mode = EnumProperty(
+        name="Assembly",
+        items=[
+            ('EXHAUSTIVE', "Exhaustive", "Enumerate match networks and browse the variants"),
+            ('GREEDY', "Greedy", "Merge the best consistent matches into clusters (for thousands of fragments)"),
+            ('BEAM', "Beam Search", "Browse the best networks found by a beam search within a time limit"),
+        ],
+        default='EXHAUSTIVE',
+        description="How matches are turned into an assembly"
+    )
+    scene.beam_width = IntProperty(
+        name="Beam Width",
+        default=DEFAULT_BEAM_WIDTH,
+        min=1,
+        description="Partial networks kept at each step of the beam search"
+    )
+    scene.beam_time_limit = FloatProperty(
+        subtype='TIME_ABSOLUTE',
+        unit='TIME_ABSOLUTE',
+        name="Beam Time Limit",
+        default=DEFAULT_BEAM_TIME_LIMIT,
+        min=0.1,
+        description="Seconds after which the beam search returns the best complete networks found so far"
+    )
+    scene.random_access_variants = BoolProperty(
+        name="Random Access Variants",
+        default=False,
+        description="Count all networks and build any variant by its number without enumerating the earlier ones. "
+                    "Numbers follow the order without pose pruning. Practical up to about ten fragments, "
+                    "larger searches fall back to stored variants"
+    )
+    scene.prune_poses = BoolProperty(
+        name="Prune Inconsistent Poses",
+        default=False,
+        description="Skip networks whose fragments would close a cycle with a different pose or land on each other. "
+                    "Cuts few networks at default thresholds and slows the search down"
+    )
+    scene.rank_variants = BoolProperty(
+        name="Rank Variants",
+        default=False,
+        description="Assemble the first variants and open the one with the smallest contact gaps"
+    )
+    scene.rank_top_n = IntProperty(
+        name="Variants to Rank",
+        default=DEFAULT_RANK_TOP_N,
+        min=1,
+        description="How many of the first variants are assembled and scored"
+    )
     scene.network_variant_index = IntProperty(
         name="Network Variant Index",
         default=0,
         min=0,
+        update=_update_variant_index,
         description="Index of shown connect variant"
     )
 
+    scene.instrumentation_track_memory = BoolProperty(
+        name="Track Memory",
+        default=False,
+        description="Record peak memory of each stage with tracemalloc (slows the run down)"
+    )
+    scene.instrumentation_dump_report = BoolProperty(
+        name="Dump JSON Report",
+        default=False,
+        description="Write stage timings and counters to report.json next to geometry.json"
+    )
+
+    for stage, label in STAGES.items():
+        setattr(scene, _log_level_prop(stage), EnumProperty(
+            name=label,
+            items=[(level, level.capitalize(), f"Log {level.lower()} messages and above") for level in LEVELS],
+            default=DEFAULT_LEVEL,
+            update=_make_log_level_update(stage),
+            description=f"Log verbosity of the {label.lower()} stage"
+        ))
+
     # Регистрация классов
     for cls in classes:
         bpy.utils.register_class(cls)
+    bpy.app.handlers.load_post.append(_on_load_post)
 
 
 def unregister():
     # Выгрузка зарегистрированных классов
+    if _on_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_on_load_post)
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
 
     scene = bpy.types.Scene
 
     # Выгрузка параметров панели
-    for param in ("coplanar_angle_threshold", "coplanar_dist_threshold",
+    for param in ("coplanar_angle_threshold", "coplanar_distance_threshold",
               "curvature_threshold", "connected_edge_angle_threshold",
-              "area_threshold", "edge_threshold", "variant_index"):
+              "face_area_threshold", "edge_length_threshold", "parallel_extraction", "use_match_table",
+              "use_graph_cache", "assembly_mode", "beam_width", "beam_time_limit", "random_access_variants",
+              "prune_poses", "rank_variants", "rank_top_n", "network_variant_index",
+              "instrumentation_track_memory", "instrumentation_dump_report",
+              *(_log_level_prop(stage) for stage in STAGES)):
         delattr(scene, param)
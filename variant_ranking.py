@@ -0,0 +1,205 @@
+import dataclasses
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+import numpy as np
+from geometry_connector.build_geometry import assemble_network
+from geometry_connector.constants import POSE_OVERLAP_RATIO, RANK_MAX_GAP_WEIGHT, RANK_AREA_WEIGHT, \
+    RANK_OVERLAP_PENALTY
+from geometry_connector.enums import MatchType
+from geometry_connector.instrumentation import instrumentation, instrumented
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Mesh, MeshGraph, Network, TransformMatch, Face, Edge, GraphMatch
+from geometry_connector.shared_mesh_store import SharedMeshStore, SharedMeshHandle, attach_store
+from mathutils import Quaternion
+
+log = get_logger("build")
+
+
+# Невязка собранного варианта: чем меньше score, тем лучше прилегают обломки
+@dataclass
+class VariantScore:
+    mean_gap: float                                     # Средний зазор между соответствующими вершинами контактов
+    max_gap: float                                      # Наибольший такой зазор
+    unmatched_area: float                               # Площадь прилегающих граней, оставшаяся без пары
+    overlaps: int                                       # Пары мешей, поставленные на одно место
+    score: float
+
+
+def _world_matrices(meshes: Dict[str, Mesh], transforms: List[TransformMatch]) -> Dict[str, np.ndarray]:
+    worlds = {name: np.array(mesh.matrix_world, dtype=np.float64) for name, mesh in meshes.items()}
+    for tm in transforms:
+        worlds[tm.src_mesh_name] = np.array(tm.matrix_world, dtype=np.float64)
+    return worlds
+
+
+def _transform(matrix: np.ndarray, points) -> np.ndarray:
+    points = np.asarray(points, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+# Концы пары рёбер в порядке (ребро mesh1, ребро mesh2): в GraphMatch.edges первым идёт ребро грани
+# с меньшим числом рёбер, поэтому принадлежность определяется по вершинам грани mesh1
+def _edge_ends(e1: Edge, e2: Edge, face1: Face) -> Tuple[List[List[float]], List[List[float]]]:
+    corners = {tuple(v) for v in face1.vertices}
+    if tuple(e1.vertices[0]) in corners and tuple(e1.vertices[1]) in corners:
+        return e1.vertices, e2.vertices
+    return e2.vertices, e1.vertices
+
+
+# Невязка по совпадениям сети в положении transforms. Зазоры считаются между концами соответствующих
+# рёбер (GraphMatch.edges, для EDGE — само ребро; концы сопоставляются в выгодном порядке),
+# для граней без пар рёбер — от каждой вершины до ближайшей вершины другой грани.
+# Площадь без пары — разница площадей прилегающих граней. Наложение — как в PoseConsistency:
+# центроиды ближе POSE_OVERLAP_RATIO меньшего радиуса. Длины в score отнесены к среднему радиусу мешей
+def contact_residual(network: Network, transforms: List[TransformMatch], meshes: Dict[str, Mesh],
+                     check_overlap: bool = True) -> VariantScore:
+    worlds = _world_matrices(meshes, transforms)
+    ends1, ends2, owners1, owners2 = [], [], [], []
+    gaps: List[np.ndarray] = []
+    unmatched_area = 0.0
+    for match in network.matches:
+        if match.match_type == MatchType.FACE:
+            face1 = meshes[match.mesh1].face(match.indices[0])
+            face2 = meshes[match.mesh2].face(match.indices[1])
+            unmatched_area += abs(face1.area - face2.area)
+            if not match.edges:
+                points1 = _transform(worlds[match.mesh1], face1.vertices)
+                points2 = _transform(worlds[match.mesh2], face2.vertices)
+                gaps.append(np.linalg.norm(points1[:, None] - points2[None], axis=2).min(axis=1))
+                continue
+            pairs = [_edge_ends(e1, e2, face1) for e1, e2 in match.edges]
+        else:
+            pairs = [(meshes[match.mesh1].edge(match.indices[0]).vertices,
+                      meshes[match.mesh2].edge(match.indices[1]).vertices)]
+        for a, b in pairs:
+            ends1.append(a)
+            ends2.append(b)
+            owners1.append(match.mesh1)
+            owners2.append(match.mesh2)
+
+    if ends1:
+        names = list(worlds)
+        stack = np.stack([worlds[name] for name in names])
+        ids = {name: i for i, name in enumerate(names)}
+        w1 = stack[[ids[n] for n in owners1]]
+        w2 = stack[[ids[n] for n in owners2]]
+        p1 = np.einsum("kij,knj->kni", w1[:, :3, :3], np.array(ends1, dtype=np.float64)) + w1[:, None, :3, 3]
+        p2 = np.einsum("kij,knj->kni", w2[:, :3, :3], np.array(ends2, dtype=np.float64)) + w2[:, None, :3, 3]
+        direct = np.linalg.norm(p1 - p2, axis=2)
+        swapped = np.linalg.norm(p1 - p2[:, ::-1], axis=2)
+        gaps.append(np.where((direct.sum(axis=1) <= swapped.sum(axis=1))[:, None], direct, swapped).ravel())
+
+    all_gaps = np.concatenate(gaps) if gaps else np.zeros(0)
+    mean_gap = float(all_gaps.mean()) if len(all_gaps) else 0.0
+    max_gap = float(all_gaps.max()) if len(all_gaps) else 0.0
+
+    # Центроиды и радиусы по вершинам граней в локальных координатах
+    names = list(meshes)
+    local = [np.array([v for f in meshes[n].faces for v in f.vertices], dtype=np.float64).reshape(-1, 3)
+             for n in names]
+    centroids = np.array([p.mean(axis=0) if len(p) else np.zeros(3) for p in local])
+    radii = np.array([np.linalg.norm(p - c, axis=1).max() if len(p) else 0.0 for p, c in zip(local, centroids)])
+    scale = max(float(radii.mean()) if len(radii) else 0.0, 1e-12)
+
+    overlaps = 0
+    if check_overlap and len(names) > 1:
+        world_centroids = np.array([_transform(worlds[n], c[None])[0] for n, c in zip(names, centroids)])
+        distance = np.linalg.norm(world_centroids[:, None] - world_centroids[None], axis=2)
+        limit = POSE_OVERLAP_RATIO * np.minimum(radii[:, None], radii[None])
+        overlaps = int(np.triu(distance < limit, k=1).sum())
+
+    score = (mean_gap + RANK_MAX_GAP_WEIGHT * max_gap) / scale + RANK_AREA_WEIGHT * unmatched_area / scale ** 2 \
+        + RANK_OVERLAP_PENALTY * overlaps
+    return VariantScore(mean_gap=mean_gap, max_gap=max_gap, unmatched_area=unmatched_area, overlaps=overlaps,
+                        score=score)
+
+
+def _score(network: Network, meshes: Dict[str, Mesh], graph: MeshGraph, check_overlap: bool) -> VariantScore | None:
+    transforms = assemble_network(network, meshes, graph)
+    if not transforms:
+        return None
+    return contact_residual(network, transforms, meshes, check_overlap)
+
+
+# region Процесс пула
+
+# Кватернионы mathutils не сериализуются pickle: между процессами вращение идёт кортежем
+def _match_to_wire(match: GraphMatch) -> GraphMatch:
+    return dataclasses.replace(match, rotation=tuple(match.rotation) if match.rotation is not None else None)
+
+
+def _match_from_wire(match: GraphMatch) -> GraphMatch:
+    return dataclasses.replace(match, rotation=Quaternion(match.rotation) if match.rotation is not None else None)
+
+
+# Порядок соседей и совпадений сохраняется: от него зависит проверка ориентаций в assemble_network
+def _graph_to_wire(graph: MeshGraph) -> Dict[str, Dict[str, List[GraphMatch]]]:
+    return {m1: {m2: [_match_to_wire(m) for m in matches] for m2, matches in nbrs.items()}
+            for m1, nbrs in graph.connections.items()}
+
+
+def _graph_from_wire(wire: Dict[str, Dict[str, List[GraphMatch]]]) -> MeshGraph:
+    graph = MeshGraph()
+    for m1, nbrs in wire.items():
+        graph.connections[m1] = {m2: [_match_from_wire(m) for m in matches] for m2, matches in nbrs.items()}
+    return graph
+
+
+# Граф передаётся один раз при запуске процесса, меши — через разделяемую память
+_worker_graph: MeshGraph | None = None
+_worker_handle: SharedMeshHandle | None = None
+
+
+def _init_worker(handle: SharedMeshHandle, graph_wire: Dict[str, Dict[str, List[GraphMatch]]]):
+    global _worker_graph, _worker_handle
+    _worker_graph, _worker_handle = _graph_from_wire(graph_wire), handle
+
+
+def _score_chunk(chunk: List[Tuple[int, List[GraphMatch]]],
+                 check_overlap: bool) -> List[Tuple[int, VariantScore | None]]:
+    meshes = attach_store(_worker_handle).meshes()
+    return [(i, _score(Network(matches=[_match_from_wire(m) for m in wire]), meshes, _worker_graph, check_overlap))
+            for i, wire in chunk]
+
+# endregion
+
+
+# Собирает сети и возвращает (номер сети в networks, оценка) по возрастанию score.
+# Сети, которые не собрались, в результат не попадают. По умолчанию сборка идёт в текущем процессе:
+# воркеры импортируют mathutils, которого нет у интерпретатора, запускаемого spawn изнутри Blender,
+# а на десятках сетей запуск пула дороже самой сборки. Пул (processes > 1, None — по числу ядер) —
+# для запуска вне Blender; если он не поднялся, оценка продолжается в текущем процессе
+@instrumented("rank_variants")
+def rank_networks(networks: List[Network], meshes: Dict[str, Mesh], graph: MeshGraph,
+                  processes: int | None = 1, check_overlap: bool = True) -> List[Tuple[int, VariantScore]]:
+    processes = min(processes or os.cpu_count() or 1, len(networks))
+
+    scored = None
+    if processes > 1:
+        try:
+            scored = _score_in_pool(networks, meshes, graph, processes, check_overlap)
+        except BrokenProcessPool as exc:
+            log.warning("Пул оценки вариантов не запустился (%s), оценка идёт в текущем процессе", exc)
+            instrumentation.count("rank_variants", "pool_failures")
+    if scored is None:
+        scored = [(i, _score(network, meshes, graph, check_overlap)) for i, network in enumerate(networks)]
+
+    ranked = sorted(((i, s) for i, s in scored if s is not None), key=lambda item: (item[1].score, item[0]))
+    instrumentation.count("rank_variants", "variants_scored", len(ranked))
+    instrumentation.count("rank_variants", "assembly_failures", len(scored) - len(ranked))
+    return ranked
+
+
+def _score_in_pool(networks: List[Network], meshes: Dict[str, Mesh], graph: MeshGraph, processes: int,
+                   check_overlap: bool) -> List[Tuple[int, VariantScore | None]]:
+    # По нескольку кусков на процесс, чтобы долгие сборки не оставляли остальные процессы без работы
+    indexed = [(i, [_match_to_wire(m) for m in network.matches]) for i, network in enumerate(networks)]
+    chunks = [c for c in (indexed[k::processes * 2] for k in range(processes * 2)) if c]
+    with SharedMeshStore.publish(list(meshes.values())) as store, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=_init_worker, initargs=(store.handle, _graph_to_wire(graph))) as pool:
+        return [item for part in pool.map(_score_chunk, chunks, [check_overlap] * len(chunks)) for item in part]
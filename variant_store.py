@@ -0,0 +1,173 @@
+import json
+import os
+from typing import List, Dict
+import numpy as np
+from geometry_connector.constants import CACHE_DIR, VARIANT_STORE_VERSION
+from geometry_connector.enums import MatchType
+from geometry_connector.logger import get_logger
+from geometry_connector.models import Network, GraphMatch, MeshGraph, TransformMatch
+from mathutils import Matrix
+
+log = get_logger("ui")
+
+# Ссылка на совпадение сети: по ней GraphMatch находится в графе connections[mesh1][mesh2]
+MATCH_REF_DTYPE = np.dtype([
+    ('mesh1', np.int32),
+    ('mesh2', np.int32),
+    ('type', np.int8),
+    ('idx1', np.int32),
+    ('idx2', np.int32),
+])
+# Вариант: срез ссылок в networks.bin и вес сети
+VARIANT_DTYPE = np.dtype([('start', np.int64), ('count', np.int32), ('weight', np.float64)])
+# Рассчитанные трансформации варианта: срез поз в poses.bin
+TRANSFORMS_DTYPE = np.dtype([('variant', np.int64), ('start', np.int64), ('count', np.int32)])
+# Поза меша относительно базового меша сети (первой трансформации)
+POSE_DTYPE = np.dtype([('src', np.int32), ('dst', np.int32), ('matrix', np.float64, (4, 4))])
+
+_TYPE_CODES = {MatchType.FACE: 0, MatchType.EDGE: 1}
+_CODE_TYPES = {code: t for t, code in _TYPE_CODES.items()}
+
+
+# Хранилище перебранных сетей и их трансформаций: файлы только дописываются, индекс варианта — номер записи.
+# Позы хранятся в мировых координатах, в которых вариант был собран
+class VariantStore:
+    def __init__(self, directory: str, names: List[str]):
+        self.directory = directory
+        self.names = names
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(names)}
+        os.makedirs(directory, exist_ok=True)
+
+        self.meta = {'names': names, 'exhausted': False, 'current': 0}
+        meta_path = self._path("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get('names') == names:
+                self.meta = meta
+            else:
+                log.warning("Хранилище вариантов %s создано для других мешей и будет перезаписано", directory)
+                self._truncate()
+
+        self.refs = self._read("networks.bin", MATCH_REF_DTYPE)
+        self.variants = self._read("variants.bin", VARIANT_DTYPE)
+        self.poses = self._read("poses.bin", POSE_DTYPE)
+        self.transforms_index: Dict[int, np.void] = {int(r['variant']): r
+                                                     for r in self._read("transforms.bin", TRANSFORMS_DTYPE)}
+        self._repair()
+
+    @classmethod
+    def open(cls, key: str, names: List[str], root: str = CACHE_DIR) -> "VariantStore":
+        return cls(os.path.join(root, f"variants_v{VARIANT_STORE_VERSION}_{key}"), names)
+
+    def __len__(self) -> int:
+        return len(self.variants)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.meta['exhausted']
+
+    @property
+    def current(self) -> int:
+        return self.meta['current']
+
+    def set_current(self, idx: int):
+        self.meta['current'] = idx
+        self._write_meta()
+
+    def mark_exhausted(self):
+        self.meta['exhausted'] = True
+        self._write_meta()
+
+    def append_network(self, network: Network) -> int:
+        refs = np.array([(self.ids[m.mesh1], self.ids[m.mesh2], _TYPE_CODES[m.match_type], m.indices[0], m.indices[1])
+                         for m in network.matches], dtype=MATCH_REF_DTYPE)
+        variant = np.array([(len(self.refs), len(refs), network.weight)], dtype=VARIANT_DTYPE)
+        self._append("networks.bin", refs)
+        self._append("variants.bin", variant)
+        self.refs = np.concatenate((self.refs, refs))
+        self.variants = np.concatenate((self.variants, variant))
+        return len(self.variants) - 1
+
+    # Восстановление сети: совпадения ищутся в графе по мешам, типу и индексам
+    def network(self, idx: int, graph: MeshGraph) -> Network:
+        v = self.variants[idx]
+        matches: List[GraphMatch] = []
+        for ref in self.refs[v['start']:v['start'] + v['count']].tolist():
+            mesh1, mesh2, code, idx1, idx2 = ref
+            match_type = _CODE_TYPES[code]
+            candidates = graph.connections[self.names[mesh1]][self.names[mesh2]]
+            matches.append(next(m for m in candidates if m.match_type == match_type and m.indices == (idx1, idx2)))
+        return Network(matches=matches)
+
+    def has_transforms(self, idx: int) -> bool:
+        return idx in self.transforms_index
+
+    def save_transforms(self, idx: int, transforms: List[TransformMatch]):
+        poses = np.zeros(len(transforms), dtype=POSE_DTYPE)
+        for pose, tm in zip(poses, transforms):
+            pose['src'] = self.ids[tm.src_mesh_name]
+            pose['dst'] = self.ids[tm.dst_mesh_name]
+            pose['matrix'] = np.array(tm.matrix_world)
+        record = np.array([(idx, len(self.poses), len(poses))], dtype=TRANSFORMS_DTYPE)
+        self._append("poses.bin", poses)
+        self._append("transforms.bin", record)
+        self.poses = np.concatenate((self.poses, poses))
+        self.transforms_index[idx] = record[0]
+
+    # Трансформации варианта в мировых координатах, как они были собраны: базовый меш мог быть
+    # перевёрнут _flip_incorrect_orientations, поэтому от его текущего положения позы не строятся
+    def transforms(self, idx: int) -> List[TransformMatch]:
+        record = self.transforms_index[idx]
+        poses = self.poses[record['start']:record['start'] + record['count']]
+        return [TransformMatch(src_mesh_name=self.names[p['src']], dst_mesh_name=self.names[p['dst']],
+                               matrix_world=Matrix(p['matrix'].tolist()))
+                for p in poses]
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _read(self, filename: str, dtype: np.dtype) -> np.ndarray:
+        path = self._path(filename)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=dtype)
+        data = np.fromfile(path, dtype=np.uint8)
+        usable = len(data) - len(data) % dtype.itemsize
+        return data[:usable].view(dtype).copy()
+
+    def _append(self, filename: str, records: np.ndarray):
+        with open(self._path(filename), 'ab') as f:
+            records.tofile(f)
+
+    def _write_meta(self):
+        with open(self._path("meta.json"), 'w') as f:
+            json.dump(self.meta, f)
+
+    # Файлы могли быть дописаны частично, если Blender закрылся посреди записи: отбрасываем неполные записи
+    # и переписываем файлы, чтобы следующие дозаписи легли ровно за последней целой записью
+    def _repair(self):
+        n_variants = len(self.variants)
+        self.variants = self.variants[self.variants['start'] + self.variants['count'] <= len(self.refs)]
+        self.refs = self.refs[:int((self.variants['start'] + self.variants['count']).max(initial=0))]
+        self.transforms_index = {idx: r for idx, r in self.transforms_index.items()
+                                 if r['start'] + r['count'] <= len(self.poses) and idx < len(self.variants)}
+        poses_end = max((int(r['start'] + r['count']) for r in self.transforms_index.values()), default=0)
+        self.poses = self.poses[:poses_end]
+        if len(self.variants) < n_variants:
+            self.meta['exhausted'] = False
+
+        transforms = np.array(list(self.transforms_index.values()), dtype=TRANSFORMS_DTYPE)
+        for filename, records in (("networks.bin", self.refs), ("variants.bin", self.variants),
+                                  ("poses.bin", self.poses), ("transforms.bin", transforms)):
+            path = self._path(filename)
+            if os.path.exists(path) and os.path.getsize(path) != records.nbytes:
+                log.warning("Хранилище вариантов: файл %s обрезан до целых записей", path)
+                with open(path, 'wb') as f:
+                    records.tofile(f)
+
+    def _truncate(self):
+        for filename in ("networks.bin", "variants.bin", "poses.bin", "transforms.bin"):
+            path = self._path(filename)
+            if os.path.exists(path):
+                os.remove(path)
+        self._write_meta()
@@ -0,0 +1,333 @@
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import secrets
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing.connection import Listener, Client, Connection
+from typing import List, Dict, Tuple, Any, Iterator, Callable
+from geometry_connector import instrumentation
+from geometry_connector.build_geometry import assemble_network
+from geometry_connector.connect_geometry import GeometryConnector
+from geometry_connector.constants import DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD, DEFAULT_FACE_AREA_THRESHOLD, \
+    DEFAULT_EDGE_LENGTH_THRESHOLD, DEFAULT_BEAM_WIDTH, DEFAULT_BEAM_TIME_LIMIT, WORKER_ADDRESS, WORKER_KEY_PATH
+from geometry_connector.graph_cache import cached_mesh_graph
+from geometry_connector.graph_utils import sort_graph, generate_networks, beam_search_networks
+from geometry_connector.greedy_assembly import greedy_assemble
+from geometry_connector.logger import get_logger
+from geometry_connector.models import TransformMatch
+from geometry_connector.reader import JsonMeshReader
+from mathutils import Matrix
+
+log = get_logger("ui")
+
+
+# Задание на сборку: файл геометрии, пороги коннектора и способ перебора (как в панели)
+@dataclass
+class AssemblyJob:
+    geometry: str
+    connected_edge_angle_threshold: float = DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD
+    area_threshold: float = DEFAULT_FACE_AREA_THRESHOLD
+    edge_length_threshold: float = DEFAULT_EDGE_LENGTH_THRESHOLD
+    mode: str = 'EXHAUSTIVE'                            # EXHAUSTIVE, GREEDY или BEAM
+    max_networks: int = 10
+    beam_width: int = DEFAULT_BEAM_WIDTH
+    beam_time_limit: float = DEFAULT_BEAM_TIME_LIMIT
+    use_graph_cache: bool = True
+    prune_poses: bool = False                           # Отсекать ветки с противоречивыми позами (PoseConsistency)
+
+
+@dataclass
+class RankedVariant:
+    weight: float | None                                # Вес сети; у жадной сборки сети нет
+    transforms: List[TransformMatch]
+
+
+@dataclass
+class JobResult:
+    variants: List[RankedVariant]                       # По убыванию веса
+    report: Dict[str, Any] = field(default_factory=dict)
+
+
+# Матрицы mathutils не сериализуются pickle: между процессами трансформации идут списками
+def _transforms_to_wire(transforms: List[TransformMatch]) -> List[Tuple[str, str, List[List[float]]]]:
+    return [(tm.src_mesh_name, tm.dst_mesh_name, [list(row) for row in tm.matrix_world]) for tm in transforms]
+
+
+def _transforms_from_wire(wire: List[Tuple[str, str, List[List[float]]]]) -> List[TransformMatch]:
+    return [TransformMatch(src_mesh_name=src, dst_mesh_name=dst, matrix_world=Matrix(rows)) for src, dst, rows in wire]
+
+
+# region Процесс-исполнитель
+
+# Все вызовы ждут друг друга на барьере, поэтому пул вынужден поднять каждый процесс
+def _ping(barrier) -> int:
+    barrier.wait(timeout=60)
+    return os.getpid()
+
+
+# Выполняется в процессе пула: модули пакета уже загружены, события идут в общую очередь сервиса
+def run_job(job: AssemblyJob, job_id: int, events) -> None:
+    def emit(stage: str, **info):
+        events.put(('progress', job_id, {'stage': stage, **info}))
+
+    try:
+        instrumentation.reset()
+        meshes = JsonMeshReader.read(job.geometry)
+        meshes_dictionary = {m.name: m for m in meshes}
+        emit('read', meshes=len(meshes))
+
+        connector = GeometryConnector(
+            connected_edge_angle_threshold=job.connected_edge_angle_threshold,
+            area_threshold=job.area_threshold,
+            edge_length_threshold=job.edge_length_threshold,
+            use_match_table=False
+        )
+        graph = cached_mesh_graph(connector, meshes) if job.use_graph_cache else connector.build_mesh_graph(meshes)
+        emit('build_mesh_graph', matches=sum(len(v) for d in graph.connections.values() for v in d.values()) // 2)
+        sorted_graph = sort_graph(graph)
+        emit('sort_graph')
+
+        if job.mode == 'GREEDY':
+            transforms = greedy_assemble(sorted_graph, meshes_dictionary)
+            variants = [(None, _transforms_to_wire(transforms))] if transforms else []
+            emit('greedy_assembly', transforms=len(transforms))
+        else:
+            if job.mode == 'BEAM':
+                networks = beam_search_networks(sorted_graph, job.beam_width, job.beam_time_limit, job.max_networks)
+            else:
+                prune_meshes = meshes_dictionary if job.prune_poses else None
+                networks = list(itertools.islice(generate_networks(sorted_graph, prune_meshes),
+                                                 job.max_networks))
+                networks.sort(key=lambda n: n.weight, reverse=True)
+            emit('networks', count=len(networks))
+
+            variants = []
+            for i, network in enumerate(networks):
+                transforms = assemble_network(network, meshes_dictionary, sorted_graph)
+                if transforms:
+                    variants.append((network.weight, _transforms_to_wire(transforms)))
+                emit('assemble_network', done=i + 1, total=len(networks))
+
+        events.put(('result', job_id, {'variants': variants, 'report': instrumentation.get_report()}))
+    except Exception:
+        events.put(('error', job_id, traceback.format_exc()))
+
+# endregion
+
+
+# region Сервис
+
+# Резидентный локальный сервис: пул процессов запускается один раз, каждое задание платит только за свою сборку.
+# Клиенты подключаются к 127.0.0.1 по multiprocessing.connection; ключ авторизации случайный
+# и лежит в файле, доступном только владельцу
+class WorkerService:
+    def __init__(self, address: Tuple[str, int] = WORKER_ADDRESS, processes: int | None = None,
+                 key_path: str = WORKER_KEY_PATH):
+        self.address = address
+        self.key_path = key_path
+        self.authkey = secrets.token_bytes(32)
+        context = multiprocessing.get_context("spawn")
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        self._manager = context.Manager()
+        self._events = self._manager.Queue()
+        self._clients: Dict[int, Tuple[Connection, threading.Lock]] = {}
+        self._ids = itertools.count(1)
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        # Прогрев: все процессы пула поднимаются и импортируют пакет до первого задания
+        barrier = self._manager.Barrier(self.processes)
+        pids = {f.result() for f in [self._pool.submit(_ping, barrier) for _ in range(self.processes)]}
+        router = threading.Thread(target=self._route_events, daemon=True)
+        router.start()
+        log.info("Сервис сборки слушает %s:%d, процессов: %d", *self.address, len(pids))
+
+        try:
+            with Listener(self.address, authkey=self.authkey) as listener:
+                # Ключ появляется, только когда сервис уже принимает подключения
+                self._write_key()
+                while not self._stopped.is_set():
+                    try:
+                        conn = listener.accept()
+                    except (OSError, EOFError, multiprocessing.AuthenticationError) as exc:
+                        log.warning("Подключение отклонено: %s", exc)
+                        continue
+                    threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._events.put(None)
+            router.join()
+            self._manager.shutdown()
+            if os.path.exists(self.key_path):
+                os.remove(self.key_path)
+            log.info("Сервис сборки остановлен")
+
+    def _write_key(self):
+        os.makedirs(os.path.dirname(self.key_path), exist_ok=True)
+        fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.authkey)
+
+    def _handle(self, conn: Connection):
+        lock = threading.Lock()
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'submit':
+                job_id = next(self._ids)
+                self._clients[job_id] = (conn, lock)
+                self._send(job_id, ('accepted', job_id, None))
+                future = self._pool.submit(run_job, message[1], job_id, self._events)
+                future.add_done_callback(partial(self._on_done, job_id))
+                log.info("Задание %d принято: %s", job_id, message[1].geometry)
+            elif message[0] == 'shutdown':
+                self._stopped.set()
+                # Будим accept в основном потоке
+                Client(self.address, authkey=self.authkey).close()
+                break
+        conn.close()
+
+    # Падение процесса пула не успевает отправить событие: сообщаем об ошибке отсюда
+    def _on_done(self, job_id: int, future):
+        if future.cancelled() or future.exception() is not None:
+            self._events.put(('error', job_id, repr(future.exception()) if not future.cancelled() else "cancelled"))
+
+    def _route_events(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            self._send(event[1], event)
+            if event[0] in ('result', 'error'):
+                self._clients.pop(event[1], None)
+
+    def _send(self, job_id: int, event: tuple):
+        client = self._clients.get(job_id)
+        if client is None:
+            return
+        conn, lock = client
+        try:
+            with lock:
+                conn.send(event)
+        except OSError:
+            log.warning("Клиент задания %d отключился", job_id)
+            self._clients.pop(job_id, None)
+
+# endregion
+
+
+# region Клиент
+
+class WorkerClient:
+    def __init__(self, address: Tuple[str, int] = WORKER_ADDRESS, key_path: str = WORKER_KEY_PATH):
+        with open(key_path, 'rb') as f:
+            authkey = f.read()
+        self._conn = Client(address, authkey=authkey)
+        self._pending: deque = deque()
+
+    def __enter__(self) -> "WorkerClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def submit(self, job: AssemblyJob) -> int:
+        self._conn.send(('submit', job))
+        # События уже идущих заданий могут прийти раньше подтверждения
+        while True:
+            event = self._conn.recv()
+            if event[0] == 'accepted':
+                return event[1]
+            self._pending.append(event)
+
+    def events(self) -> Iterator[tuple]:
+        while True:
+            yield self._pending.popleft() if self._pending else self._conn.recv()
+
+    # Отправляет все задания сразу и ждёт их результатов; прогресс передаётся в on_progress(job_id, info)
+    def run(self, jobs: List[AssemblyJob],
+            on_progress: Callable[[int, Dict[str, Any]], None] | None = None) -> List[JobResult]:
+        ids = [self.submit(job) for job in jobs]
+        results: Dict[int, JobResult] = {}
+        for kind, job_id, payload in self.events():
+            if kind == 'progress':
+                if on_progress:
+                    on_progress(job_id, payload)
+            elif kind == 'result':
+                variants = [RankedVariant(weight=w, transforms=_transforms_from_wire(t)) for w, t in payload['variants']]
+                results[job_id] = JobResult(variants=variants, report=payload['report'])
+            elif kind == 'error':
+                raise RuntimeError(f"Задание {job_id} завершилось ошибкой:\n{payload}")
+            if len(results) == len(ids):
+                break
+        return [results[job_id] for job_id in ids]
+
+    def shutdown(self):
+        self._conn.send(('shutdown',))
+
+# endregion
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Resident local worker service for batch assembly jobs")
+    parser.add_argument("--host", default=WORKER_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=WORKER_ADDRESS[1])
+    parser.add_argument("--key", default=WORKER_KEY_PATH, help="Auth key file written by the service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Start the service and keep it running")
+    serve.add_argument("--processes", type=int, default=None)
+
+    submit = commands.add_parser("submit", help="Run geometry.json files through a running service")
+    submit.add_argument("geometry", nargs="+")
+    submit.add_argument("--mode", choices=["EXHAUSTIVE", "GREEDY", "BEAM"], default="EXHAUSTIVE")
+    submit.add_argument("--angle", type=float, default=math.degrees(DEFAULT_CONNECTED_EDGE_ANGLE_THRESHOLD),
+                        help="Degrees")
+    submit.add_argument("--area", type=float, default=DEFAULT_FACE_AREA_THRESHOLD)
+    submit.add_argument("--edge", type=float, default=DEFAULT_EDGE_LENGTH_THRESHOLD)
+    submit.add_argument("--max-networks", type=int, default=10)
+    submit.add_argument("--beam", type=int, default=DEFAULT_BEAM_WIDTH, metavar="WIDTH")
+    submit.add_argument("--beam-time", type=float, default=DEFAULT_BEAM_TIME_LIMIT)
+    submit.add_argument("--no-cache", action="store_true", help="Do not reuse cached match graphs")
+
+    commands.add_parser("shutdown", help="Stop a running service")
+    args = parser.parse_args(argv)
+    address = (args.host, args.port)
+
+    if args.command == "serve":
+        WorkerService(address, args.processes, args.key).serve_forever()
+        return
+
+    with WorkerClient(address, args.key) as client:
+        if args.command == "shutdown":
+            client.shutdown()
+            return
+
+        jobs = [AssemblyJob(geometry=os.path.abspath(path), connected_edge_angle_threshold=math.radians(args.angle),
+                            area_threshold=args.area, edge_length_threshold=args.edge, mode=args.mode,
+                            max_networks=args.max_networks, beam_width=args.beam, beam_time_limit=args.beam_time,
+                            use_graph_cache=not args.no_cache)
+                for path in args.geometry]
+        results = client.run(jobs, on_progress=lambda job_id, info: print(f"[{job_id}] {info}"))
+        for job, result in zip(jobs, results):
+            best = result.variants[0] if result.variants else None
+            print(f"{job.geometry}: {len(result.variants)} variants"
+                  + (f", best weight {best.weight}" if best and best.weight is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
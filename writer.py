@@ -1,7 +1,10 @@
 import json
-from typing import List
+from typing import List, Dict, Any
 from geometry_connector.models import Mesh, MeshGraph, Network
-from geometry_connector.constants import JSON_PATH
+from geometry_connector.constants import JSON_PATH, REPORT_PATH
+from geometry_connector.logger import get_logger
+
+log = get_logger("ui")
 
 
 class Writer:
@@ -40,7 +43,14 @@ class Writer:
             data.append(md)
         with open(filepath, 'w') as f:
             json.dump(data, f, indent = 4)
-        print(f"Параметры Mesh записаны в файл: {filepath}")
+        log.info("Параметры Mesh записаны в файл: %s", filepath)
+
+
+    @staticmethod
+    def write_report(report: Dict[str, Any], filepath: str = REPORT_PATH):
+        with open(filepath, 'w') as f:
+            json.dump(report, f, indent = 4)
+        log.info("Отчёт инструментирования записан в файл: %s", filepath)
 
 
     @staticmethod